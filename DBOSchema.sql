@@ -95,7 +95,7 @@ CREATE table Booking
 	 TotalCost numeric(12,2),
 	 PRIMARY KEY(BookID),
 	FOREIGN KEY(RenterID) references Renter,
-	FOREIGN KEY (PropId) REFERENCES Property(PropId););
+	FOREIGN KEY (PropId) REFERENCES Property(PropId));
 
 CREATE TABLE Rewards
 	(
@@ -0,0 +1,151 @@
+import os
+import sys
+import json
+import time
+import argparse
+
+import psycopg2
+
+import db
+
+
+FOLD_INTERVAL = float(os.getenv('ANALYTICS_FOLD_INTERVAL', '30'))
+
+# Dashboard groupings -> listing_rollup key columns.
+DIMENSIONS = {'agency': 'AgencyName', 'city': 'City', 'type': 'PropType'}
+METRICS = ['Listings', 'Available', 'PriceSum', 'PriceCount', 'SqftSum', 'SqftCount',
+           'Bookings', 'Revenue']
+
+# Reads listing_rollup only (migrations/015_listing_rollups.sql); averages
+# and the availability ratio come from the stored sums and counts.
+ROLLUP_SQL = """
+    SELECT {dims}, sum(Listings), sum(Available)::numeric / NULLIF(sum(Listings), 0),
+           sum(PriceSum) / NULLIF(sum(PriceCount), 0), sum(SqftSum) / NULLIF(sum(SqftCount), 0),
+           sum(Bookings), sum(Revenue)
+    FROM listing_rollup
+    {where}
+    GROUP BY {dims}
+    ORDER BY sum(Revenue) DESC, {dims}
+"""
+
+# Rollup plus deltas not yet folded, against a full recompute, read in one
+# statement so both sides see the same snapshot. A group missing on one
+# side counts as all zeros.
+_keys = "AgencyName, City, PropType"
+_cols = ", ".join(METRICS)
+CHECK_SQL = f"""
+    WITH incremental AS (
+        SELECT {_keys}, {", ".join(f"sum({m}) AS {m}" for m in METRICS)}
+        FROM (SELECT {_keys}, {_cols} FROM listing_rollup
+              UNION ALL
+              SELECT {_keys}, {_cols} FROM listing_rollup_delta) t
+        GROUP BY {_keys}
+    )
+    SELECT {_keys},
+           ARRAY[{", ".join(f"COALESCE(i.{m}, 0)" for m in METRICS)}]::numeric[],
+           ARRAY[{", ".join(f"COALESCE(f.{m}, 0)" for m in METRICS)}]::numeric[]
+    FROM incremental i FULL JOIN listing_rollup_source f USING ({_keys})
+    WHERE ({", ".join(f"COALESCE(i.{m}, 0)" for m in METRICS)})
+          <> ({", ".join(f"COALESCE(f.{m}, 0)" for m in METRICS)})
+    ORDER BY {_keys}
+"""
+
+
+def rollup(cur, by, agency=None):
+    # One row per combination of the `by` dimensions: the dimension values,
+    # then listings, availability ratio, average price, average sqft,
+    # bookings and revenue. `agency` restricts it to one agency.
+    dims = ", ".join(DIMENSIONS[d] for d in by)
+    where, params = "", ()
+    if agency is not None:
+        where, params = "WHERE AgencyName = %s", (agency,)
+    cur.execute(ROLLUP_SQL.format(dims=dims, where=where), params)
+    return cur.fetchall()
+
+
+def updated_at(cur):
+    cur.execute("SELECT max(UpdatedAt) FROM listing_rollup")
+    return cur.fetchone()[0]
+
+
+def fold(conn):
+    with conn.cursor() as cur:
+        cur.execute("SELECT listing_rollup_fold()")
+        folded = cur.fetchone()[0]
+    conn.commit()
+    return folded
+
+
+def check(cur):
+    # Groups whose incrementally maintained totals disagree with a full
+    # recompute, as {group, incremental, recomputed} with metrics by name.
+    cur.execute(CHECK_SQL)
+    return [{'group': [agency, city, ptype],
+             'incremental': dict(zip(METRICS, map(float, inc))),
+             'recomputed': dict(zip(METRICS, map(float, full)))}
+            for agency, city, ptype, inc, full in cur.fetchall()]
+
+
+def rebuild(conn):
+    with conn.cursor() as cur:
+        cur.execute("SELECT listing_rollup_rebuild()")
+    conn.commit()
+
+
+def run_forever(interval):
+    backoff = 1
+    while True:
+        conn = None
+        try:
+            conn = db.connect()
+            backoff = 1
+            while True:
+                fold(conn)
+                time.sleep(interval)
+        except psycopg2.Error as e:
+            print(f"analytics fold: {e}; reconnecting in {backoff}s", file=sys.stderr)
+            if conn is not None:
+                conn.close()
+            time.sleep(backoff)
+            backoff = min(backoff * 2, 30)
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description='Agency and market analytics rollups.')
+    sub = ap.add_subparsers(dest='command', required=True)
+    f = sub.add_parser('fold', help='apply pending rollup deltas')
+    f.add_argument('--forever', action='store_true',
+                   help='keep folding every --interval seconds')
+    f.add_argument('--interval', type=float, default=FOLD_INTERVAL)
+    c = sub.add_parser('check', help='compare the rollups with a full recompute')
+    c.add_argument('--repair', action='store_true', help='rebuild the rollups on a mismatch')
+    sub.add_parser('rebuild', help='recompute the rollups from scratch')
+    args = ap.parse_args(argv)
+
+    if args.command == 'fold' and args.forever:
+        run_forever(args.interval)
+    conn = db.connect()
+    try:
+        status = 0
+        if args.command == 'fold':
+            report = {'folded': fold(conn)}
+        elif args.command == 'rebuild':
+            rebuild(conn)
+            report = {'rebuilt': True}
+        else:
+            with conn.cursor() as cur:
+                mismatches = check(cur)
+            conn.rollback()
+            report = {'mismatches': len(mismatches), 'groups': mismatches[:50]}
+            if mismatches and args.repair:
+                rebuild(conn)
+                report['rebuilt'] = True
+            status = 1 if mismatches and not args.repair else 0
+        print(json.dumps(report))
+    finally:
+        conn.close()
+    return status
+
+
+if __name__ == '__main__':
+    sys.exit(main())
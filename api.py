@@ -0,0 +1,274 @@
+import os
+import sys
+import hmac
+import json
+import argparse
+import functools
+from datetime import date
+from decimal import Decimal
+
+from aiohttp import web
+from psycopg.conninfo import make_conninfo
+from psycopg_pool import AsyncConnectionPool
+
+import db
+import cache
+import queries
+
+
+API_POOL_MIN = int(os.getenv('API_POOL_MIN', '4'))
+API_POOL_MAX = int(os.getenv('API_POOL_MAX', '20'))
+MAX_PAGE     = int(os.getenv('API_MAX_PAGE', '1000'))
+STREAM_BATCH = int(os.getenv('API_STREAM_BATCH', '1000'))
+# Shared secret the trusted front end sends as "Authorization: Bearer ..."
+# to book, cancel or list bookings on a user's behalf. Without it set,
+# those endpoints are refused.
+API_TOKEN    = os.getenv('API_TOKEN', '')
+
+LISTING_FIELDS   = ['id', 'type', 'description', 'city', 'state', 'price', 'available',
+                    'agent_name', 'agent_id']
+PORTFOLIO_FIELDS = LISTING_FIELDS[:7]
+BOOKING_FIELDS   = ['booking_id', 'prop_id', 'prop_type', 'start', 'end', 'mode', 'total',
+                    'receipt']
+
+# book_property() status -> HTTP status.
+BOOK_STATUS = {'booked': 201, 'bad_dates': 400, 'no_renter': 403, 'not_found': 404,
+               'unavailable': 409, 'busy': 409}
+
+
+class BadRequest(ValueError):
+    pass
+
+
+def _default(v):
+    if isinstance(v, Decimal):
+        return float(v)
+    if isinstance(v, date):
+        return v.isoformat()
+    raise TypeError(f'{type(v).__name__} is not JSON serializable')
+
+
+def _dumps(v):
+    return json.dumps(v, default=_default, separators=(',', ':'))
+
+
+def _json(body, status=200):
+    return web.json_response(body, status=status, dumps=_dumps)
+
+
+def _error(status, message):
+    return _json({'error': message}, status)
+
+
+def _record(fields, row):
+    return dict(zip(fields, row))
+
+
+def _date(value, name):
+    try:
+        return date.fromisoformat(value) if value else None
+    except ValueError:
+        raise BadRequest(f'{name} must be YYYY-MM-DD')
+
+
+def _number(q, name, cast=float):
+    value = q.get(name)
+    if value in (None, ''):
+        return None
+    try:
+        return cast(value)
+    except ValueError:
+        raise BadRequest(f'{name} must be a number')
+
+
+def _list(q, name, allowed):
+    values = [v for v in q.get(name, '').split(',') if v]
+    unknown = [v for v in values if v not in allowed]
+    if unknown:
+        raise BadRequest(f"unknown {name}: {', '.join(unknown)}")
+    return values
+
+
+def search_from_query(q):
+    # Query string -> the search dict queries.search_listings() takes.
+    if q.get('available') not in (None, '', 'true', 'false'):
+        raise BadRequest('available must be true or false')
+    return {
+        'text': q.get('text', ''), 'city': q.get('city', ''), 'state': q.get('state', ''),
+        'types': _list(q, 'types', queries.TYPE_MAP),
+        'price_min': _number(q, 'price_min'), 'price_max': _number(q, 'price_max'),
+        'rooms_min': _number(q, 'rooms_min', int),
+        'sqft_min': _number(q, 'sqft_min'), 'sqft_max': _number(q, 'sqft_max'),
+        'max_crime': _number(q, 'max_crime'),
+        'available': {'true': True, 'false': False}.get(q.get('available')),
+        'amenities': _list(q, 'amenities', queries.AMENITY_BITS),
+        'free_from': _date(q.get('free_from'), 'free_from'),
+        'free_to': _date(q.get('free_to'), 'free_to'),
+    }
+
+
+@web.middleware
+async def errors(request, handler):
+    try:
+        return await handler(request)
+    except BadRequest as e:
+        return _error(400, str(e))
+
+
+def requires_token(handler):
+    @functools.wraps(handler)
+    async def checked(request):
+        if not API_TOKEN:
+            return _error(403, 'booking endpoints are disabled: API_TOKEN is not set')
+        given = request.headers.get('Authorization', '').encode()
+        if not hmac.compare_digest(given, f'Bearer {API_TOKEN}'.encode()):
+            return _error(401, 'missing or invalid bearer token')
+        return await handler(request)
+    return checked
+
+
+async def _notify(cur, event):
+    # Same channel and event shape as cache.commit(), so every Streamlit
+    # process drops the affected cache entries once this commits.
+    await cur.execute("SELECT pg_notify(%s, %s)", (cache.NOTIFY_CHANNEL, json.dumps(event)))
+
+
+# ------------------------------------------------------------------ handlers
+
+async def search(request):
+    q = request.query
+    search = search_from_query(q)
+    limit = min(max(_number(q, 'limit', int) or 20, 1), MAX_PAGE)
+    after, before = q.get('after') or None, q.get('before') or None
+    async with request.app['pool'].connection() as conn:
+        cur = await conn.execute(*queries.search_statement(search, after, before, limit))
+        result = await cur.fetchall()
+    rows, has_prev, has_next, facets = queries.search_result(result, search, after, before, limit)
+    return _json({'listings': [_record(LISTING_FIELDS, r) for r in rows],
+                  'has_prev': has_prev, 'has_next': has_next, 'facets': facets})
+
+
+async def detail(request):
+    pid = request.match_info['pid']
+    async with request.app['pool'].connection() as conn:
+        cur = await conn.execute(queries.BY_ID_SQL, ([pid],))
+        row = await cur.fetchone()
+        if row is None:
+            return _error(404, f'no property {pid}')
+        cur = await conn.execute(queries.BOOKED_PERIODS_SQL, (pid,))
+        taken = await cur.fetchall()
+    return _json(dict(_record(LISTING_FIELDS, row),
+                      booked=[{'start': s, 'end': e} for s, e in taken]))
+
+
+@requires_token
+async def book(request):
+    try:
+        body = await request.json()
+        email, pid, mode = body['email'], body['prop_id'], body.get('mode', 'Cash')
+        start, end = _date(body['start'], 'start'), _date(body['end'], 'end')
+    except (ValueError, KeyError, TypeError) as e:
+        raise BadRequest(f'expected JSON with email, prop_id, start and end ({e})')
+    if mode not in ('Cash', 'Credit'):
+        raise BadRequest('mode must be Cash or Credit')
+    card = None
+    if mode == 'Credit':
+        c = body.get('card') or {}
+        if not str(c.get('number', '')).isdigit() or len(str(c['number'])) != 16:
+            raise BadRequest('card.number must be exactly 16 digits')
+        card = (c.get('name'), str(c['number']), _date(c.get('exp_date'), 'card.exp_date'),
+                c.get('cvv'))
+    async with request.app['pool'].connection() as conn:
+        async with conn.cursor() as cur:
+            await cur.execute(queries.BOOK_SQL,
+                              queries.book_params(email, pid, None, start, end, mode, card))
+            status, booking_id, renter_id, total, _ = await cur.fetchone()
+            if status != 'booked':
+                await conn.rollback()
+                return _json({'status': status}, BOOK_STATUS[status])
+            await _notify(cur, cache.booking_event(pid))
+    return _json({'status': status, 'booking_id': booking_id, 'renter_id': renter_id,
+                  'total': total}, 201)
+
+
+@requires_token
+async def cancel(request):
+    book_id, renter_id = request.match_info['book_id'], request.query.get('renter_id')
+    if not renter_id:
+        raise BadRequest('renter_id is required')
+    async with request.app['pool'].connection() as conn:
+        async with conn.cursor() as cur:
+            await cur.execute(queries.CANCEL_SQL, (book_id, renter_id))
+            row = await cur.fetchone()
+            if row is None:
+                return _error(404, f'no booking {book_id} for renter {renter_id}')
+            await cur.execute(queries.CANCEL_REWARDS_SQL,
+                              queries.cancel_rewards_params(book_id, renter_id))
+            await _notify(cur, cache.booking_event(row[0]))
+    return web.Response(status=204)
+
+
+@requires_token
+async def renter_bookings(request):
+    async with request.app['pool'].connection() as conn:
+        cur = await conn.execute(queries.RENTER_BOOKINGS_SQL, (request.match_info['renter_id'],))
+        rows = await cur.fetchall()
+    return _json([_record(BOOKING_FIELDS, r) for r in rows])
+
+
+async def agency_portfolio(request):
+    # Streamed: a server-side cursor feeds the response STREAM_BATCH rows
+    # at a time, so an agency's whole portfolio never sits in memory.
+    resp = web.StreamResponse(headers={'Content-Type': 'application/json'})
+    async with request.app['pool'].connection() as conn:
+        async with conn.cursor(name='agency_portfolio') as cur:
+            await cur.execute(queries.AGENCY_LISTINGS_SQL, (request.match_info['agency'],))
+            await resp.prepare(request)
+            sep = b'['
+            while rows := await cur.fetchmany(STREAM_BATCH):
+                chunk = ','.join(_dumps(_record(PORTFOLIO_FIELDS, r)) for r in rows)
+                await resp.write(sep + chunk.encode())
+                sep = b','
+            await resp.write(b'[]' if sep == b'[' else b']')
+    await resp.write_eof()
+    return resp
+
+
+# ----------------------------------------------------------------------- app
+
+async def _pool(app):
+    conninfo = make_conninfo(host=db.DB_HOST, port=db.DB_PORT, dbname=db.DB_NAME,
+                             user=db.DB_USER, password=db.DB_PASSWORD)
+    app['pool'] = AsyncConnectionPool(conninfo, min_size=API_POOL_MIN, max_size=API_POOL_MAX,
+                                      timeout=db.POOL_TIMEOUT, max_lifetime=db.POOL_MAX_LIFETIME,
+                                      open=False)
+    await app['pool'].open()
+    yield
+    await app['pool'].close()
+
+
+def make_app():
+    app = web.Application(middlewares=[errors])
+    app.cleanup_ctx.append(_pool)
+    app.add_routes([
+        web.get('/listings', search),
+        web.get('/listings/{pid}', detail),
+        web.post('/bookings', book),
+        web.delete('/bookings/{book_id}', cancel),
+        web.get('/renters/{renter_id}/bookings', renter_bookings),
+        web.get('/agencies/{agency}/listings', agency_portfolio),
+    ])
+    return app
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description='Headless listing and booking HTTP API.')
+    ap.add_argument('--host', default='127.0.0.1')
+    ap.add_argument('--port', type=int, default=8080)
+    args = ap.parse_args(argv)
+    web.run_app(make_app(), host=args.host, port=args.port, access_log=None)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
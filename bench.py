@@ -0,0 +1,938 @@
+import os
+import re
+import sys
+import json
+import time
+import random
+import argparse
+import threading
+from datetime import date, timedelta
+
+import psycopg2
+import psycopg2.extensions
+
+import db
+import queries
+import recommend
+import analytics
+import outbox_worker
+
+
+CITIES = ['Austin', 'Newark', 'Chicago', 'Dallas', 'Denver', 'Houston', 'Miami',
+          'Nashville', 'Phoenix', 'Portland', 'Seattle', 'San Diego', 'Atlanta',
+          'Orlando', 'Tampa', 'Raleigh', 'Columbus', 'Detroit', 'Memphis', 'Buffalo']
+STATES = ['Texas', 'New Jersey', 'Illinois', 'Texas', 'Colorado', 'Texas', 'Florida',
+          'Tennessee', 'Arizona', 'Oregon', 'Washington', 'California', 'Georgia',
+          'Florida', 'Florida', 'N Carolina', 'Ohio', 'Michigan', 'Tennessee', 'New York']
+PTYPES = list(queries.TYPE_MAP)
+AMENITIES = ['Lincoln', 'Oak Ridge', 'Riverside', 'Central', 'Maple', 'Westside', '']
+# Descriptions name two of these, so a word matches about one listing in
+# twelve and a pair of them about one in three hundred, as free text would.
+FEATURES = ['garden', 'pool', 'garage', 'balcony', 'fireplace', 'loft', 'basement', 'patio',
+            'skylight', 'terrace', 'porch', 'sunroom', 'workshop', 'cellar', 'courtyard', 'deck',
+            'sauna', 'gym', 'attic', 'veranda', 'carport', 'library', 'pantry', 'jacuzzi']
+
+# Tables whose triggers are suspended while bulk loading, and the statements
+# that rebuild derived tables afterwards. Generated bookings all land in
+# booking_default; booking_partitions_ensure() moves them into monthly
+# partitions. The analytics rollups are recomputed once at the end rather
+# than maintained row by row through the reload.
+TRIGGER_TABLES = ['Users', 'Agent', 'Property', 'VacHome', 'Houses', 'Apartments',
+                  'CommBuildings', 'Neighbourhood', 'Booking']
+REBUILD_SQL = [
+    "ALTER TABLE property_listing DISABLE TRIGGER USER",
+    "TRUNCATE property_listing",
+    "INSERT INTO property_listing SELECT * FROM property_listing_source",
+    "ALTER TABLE property_listing ENABLE TRIGGER USER",
+    "SELECT booking_partitions_ensure()",
+    "SELECT listing_rollup_rebuild()",
+]
+SEQUENCE_SQL = [
+    "SELECT setval('property_id_seq', COALESCE((SELECT MAX(PropId::bigint) FROM Property "
+    "WHERE PropId ~ '^[0-9]{1,10}$'), 0) + 1, FALSE)",
+    "SELECT setval('renter_id_seq', COALESCE((SELECT MAX(substr(RenterID, 2)::bigint) FROM Renter "
+    "WHERE RenterID ~ '^R[0-9]{9}$'), 0) + 1, FALSE)",
+    "SELECT setval('agent_id_seq', COALESCE((SELECT MAX(substr(AgentID, 2)::bigint) FROM Agent "
+    "WHERE AgentID ~ '^A[0-9]{9}$'), 0) + 1, FALSE)",
+    "SELECT setval('booking_id_seq', COALESCE((SELECT MAX(substr(BookID, 2)::bigint) FROM Booking "
+    "WHERE BookID ~ '^B[0-9]{9}$'), 0) + 1, FALSE)",
+]
+BIG_TABLES = {'property', 'property_listing', 'booking', 'agent', 'renter', 'users',
+              'neighbourhood', 'vachome', 'houses', 'apartments', 'commbuildings', 'rewards'}
+# Partitions report under their own names (booking_2025_01, booking_default).
+# An empty one (a month nobody has booked yet) is read whole by any plan,
+# so scans of empty relations don't count.
+PARTITION_SUFFIX = re.compile(r'_(\d{4}_\d{2}|default)$')
+
+
+# ---------------------------------------------------------------- generator
+
+def generate(args):
+    rnd = random.Random(args.seed)
+    n_agents, n_renters, n_props = args.agents, args.renters, args.properties
+    n_bookings = min(args.bookings, n_props)
+    today = date.today()
+
+    agent_ids  = ['A%09d' % i for i in range(1, n_agents + 1)]
+    renter_ids = ['R%09d' % i for i in range(1, n_renters + 1)]
+    booked = set(rnd.sample(range(1, n_props + 1), n_bookings))
+
+    def users():
+        for i in range(1, n_agents + 1):
+            yield (f'Agent {i}', f'{i} Market St', f'agent{i}@bench.test', 'Agent')
+        for i in range(1, n_renters + 1):
+            yield (f'Renter {i}', f'{i} Main St', f'renter{i}@bench.test', 'Renter')
+
+    def agents():
+        for i, aid in enumerate(agent_ids, 1):
+            yield (aid, 'Broker', f'agent{i}@bench.test', f'Agency {i % args.agencies}')
+
+    def renters():
+        for i, rid in enumerate(renter_ids, 1):
+            yield (rid, today + timedelta(days=rnd.randint(0, 90)), f'renter{i}@bench.test',
+                   rnd.choice(CITIES), rnd.randint(500, 5000) * 10)
+
+    def prop_type(i):
+        return PTYPES[i % len(PTYPES)]
+
+    def properties():
+        for i in range(1, n_props + 1):
+            c = rnd.randrange(len(CITIES))
+            desc = f'{rnd.randint(1, 6)} bedroom with {" and ".join(rnd.sample(FEATURES, 2))}'
+            yield ('%010d' % i, prop_type(i), desc, CITIES[c], STATES[c], agent_ids[i % n_agents])
+
+    def subtype(ptype):
+        for i in range(1, n_props + 1):
+            if prop_type(i) != ptype:
+                continue
+            # Bookings hold dates only; a few listings are closed by their agent.
+            pid, avail = '%010d' % i, rnd.random() >= 0.05
+            sqft, price = rnd.randint(400, 9000), rnd.randint(500, 20000)
+            if ptype == 'CommBuildings':
+                yield (pid, f'{i} Commerce Ave', 'Retail', sqft, price, avail)
+            elif ptype == 'Apartments':
+                yield (pid, rnd.randint(1, 8), f'{i} Elm St', sqft, price, avail, 'Highrise')
+            else:
+                yield (pid, rnd.randint(1, 12), f'{i} Oak St', sqft, price, avail)
+
+    def neighbourhoods():
+        for i in range(1, n_props + 1):
+            yield ('%010d' % i, round(rnd.uniform(0, 99.99), 2),
+                   rnd.choice(AMENITIES), rnd.choice(AMENITIES),
+                   rnd.choice(AMENITIES), rnd.choice(AMENITIES))
+
+    def bookings():
+        for n, i in enumerate(sorted(booked), 1):
+            start = today - timedelta(days=rnd.randint(0, 365))
+            yield (rnd.choice(renter_ids), 'B%09d' % n, '%010d' % i, start,
+                   start + timedelta(days=30), rnd.choice(['Cash', 'Credit']),
+                   rnd.randint(500, 20000))
+
+    subtype_cols = {
+        'VacHome':       ['VacHomeId', 'NoOfRooms', 'address', 'SqFootage', 'Price', 'Availablity'],
+        'Houses':        ['HouseId', 'NoOfRooms', 'address', 'SqFootage', 'Price', 'Availablity'],
+        'Apartments':    ['AptId', 'NoOfRooms', 'address', 'SqFootage', 'Price', 'Availablity', 'BuildingType'],
+        'CommBuildings': ['BuildId', 'address', 'BusinessType', 'SqFootage', 'Price', 'Availablity'],
+    }
+
+    conn = db.connect()
+    started = time.monotonic()
+    try:
+        with conn.cursor() as cur:
+            if args.reset:
+                cur.execute("TRUNCATE Users, Agent, Renter, Property, VacHome, Houses, Apartments, "
+                            "CommBuildings, Neighbourhood, Booking, booking_archive, Rewards, Address, "
+                            "CreditCard, outbox, booking_receipts CASCADE")
+            for t in TRIGGER_TABLES:
+                cur.execute(f"ALTER TABLE {t} DISABLE TRIGGER USER")
+
+            steps = [
+                ('Users', ['Name_', 'address', 'Email', 'UserType'], users()),
+                ('Agent', ['AgentID', 'JobTitle', 'Email', 'AgencyName'], agents()),
+                ('Renter', ['RenterID', 'Movein_date', 'Email', 'PrefLocation', 'Budget'], renters()),
+                ('Property', ['PropId', 'PropType', 'Description', 'City', 'State_', 'AgentID'], properties()),
+            ]
+            steps += [(t, cols, subtype(t)) for t, cols in subtype_cols.items()]
+            steps += [
+                ('Neighbourhood', ['PropId', 'CrimeRate', 'NearbySchool', 'Hospital', 'Park', 'mart'],
+                 neighbourhoods()),
+                ('Booking', ['RenterID', 'BookID', 'PropId', 'StartDate', 'EndDate', 'Mode_of_pay', 'TotalCost'],
+                 bookings()),
+            ]
+            for table, cols, rows in steps:
+                t0 = time.monotonic()
+                db.copy_rows(cur, table, cols, rows)
+                print(f'{table:<14} {cur.rowcount:>10} rows  {time.monotonic() - t0:7.2f}s', file=sys.stderr)
+
+            cur.execute(
+                "INSERT INTO Rewards(R_id, Reward_Points) "
+                "SELECT RenterID, LEAST(COUNT(*) * 100, 999999) FROM Booking GROUP BY RenterID "
+                "ON CONFLICT (R_id) DO NOTHING"
+            )
+            for t in TRIGGER_TABLES:
+                cur.execute(f"ALTER TABLE {t} ENABLE TRIGGER USER")
+            for sql in REBUILD_SQL + SEQUENCE_SQL:
+                cur.execute(sql)
+        conn.commit()
+        conn.autocommit = True
+        with conn.cursor() as cur:
+            # Statistics for every table and partition, and the visibility
+            # map the planner needs before it picks an index-only scan.
+            cur.execute("VACUUM ANALYZE")
+    finally:
+        conn.close()
+    print(f'generated in {time.monotonic() - started:.1f}s', file=sys.stderr)
+
+
+# ------------------------------------------------------------------- driver
+
+_counter = threading.local()
+
+
+class CountingCursor(psycopg2.extensions.cursor):
+
+    def execute(self, query, vars=None):
+        _counter.statements = getattr(_counter, 'statements', 0) + 1
+        return super().execute(query, vars)
+
+
+def _sample(cur, sql, n):
+    cur.execute(sql + " ORDER BY random() LIMIT %s", (n,))
+    return [r if len(r) > 1 else r[0] for r in cur.fetchall()]
+
+
+def load_samples(n=2000):
+    conn = db.connect()
+    try:
+        with conn.cursor() as cur:
+            return {
+                'props':    _sample(cur, "SELECT PropId, PropType FROM property_listing", n),
+                'renters':  _sample(cur, "SELECT RenterID, Email FROM Renter", n),
+                'agents':   _sample(cur, "SELECT AgentID, Email, AgencyName FROM Agent", n),
+            }
+    finally:
+        conn.close()
+
+
+def _search(cur, search, **kwargs):
+    # queries.search_listings, timed on its own for the run's search p95.
+    t0 = time.perf_counter()
+    result = queries.search_listings(cur, search, **kwargs)
+    _counter.searches.append(time.perf_counter() - t0)
+    return result
+
+
+def wl_view(cur, rnd, s):
+    # Browsing as view_page does: an optional city typed into the search
+    # box, then paging through the results.
+    search = {'city': rnd.choice(CITIES)[:rnd.choice([3, 4, 12])]} if rnd.random() < 0.6 else {}
+    after = None
+    for _ in range(rnd.randint(1, 3)):
+        rows, _, has_next, _ = _search(cur, search, after=after, limit=20)
+        if not has_next:
+            break
+        after = rows[-1][0]
+
+
+def random_search(rnd):
+    search = {'types': rnd.sample(PTYPES, rnd.randint(0, 2))}
+    if rnd.random() < 0.3:
+        search['text'] = rnd.choice(['near park', '3 bed', 'pool sauna', 'bedroom fireplace',
+                                     'garden patio', 'hosp', 'Lincoln sch'])
+    if rnd.random() < 0.5:
+        c = rnd.randrange(len(CITIES))
+        search['city'] = CITIES[c]
+    if rnd.random() < 0.5:
+        lo = rnd.randint(5, 150) * 100
+        search['price_min'], search['price_max'] = lo, lo + rnd.randint(10, 50) * 100
+    if rnd.random() < 0.3:
+        search['rooms_min'] = rnd.randint(2, 6)
+    if rnd.random() < 0.3:
+        search['max_crime'] = rnd.choice([5, 10, 25])
+    if rnd.random() < 0.7:
+        search['available'] = True
+    if rnd.random() < 0.3:
+        search['amenities'] = rnd.sample(list(queries.AMENITY_BITS), rnd.randint(1, 2))
+    return search
+
+
+def wl_search(cur, rnd, s):
+    search = random_search(rnd)
+    rows, _, has_next, _ = _search(cur, search, limit=20)
+    if has_next and rnd.random() < 0.3:
+        _search(cur, search, after=rows[-1][0], limit=20)
+
+
+def wl_profile(cur, rnd, s):
+    # The identity lookup stands in for a login; later page loads reuse it.
+    if rnd.random() < 0.5:
+        _, email = rnd.choice(s['renters'])
+        me = queries.load_identity(cur, email)
+        queries.renter_bookings(cur, me['renter_id'])
+    else:
+        _, email, _ = rnd.choice(s['agents'])
+        me = queries.load_identity(cur, email)
+        queries.fetch_agency_listings(cur, me['agency'])
+
+
+def wl_buy(cur, rnd, s):
+    pid, _ = rnd.choice(s['props'])
+    _, email = rnd.choice(s['renters'])
+    start = date.today() + timedelta(days=rnd.randint(0, 180))
+    queries.book_property(cur, email, pid, None, start,
+                          start + timedelta(days=rnd.randint(1, 30)), 'Cash')
+
+
+def _details(rnd, ptype):
+    return {'rooms': rnd.randint(1, 9), 'address': 'Bench Rd', 'sqft': rnd.randint(400, 9000),
+            'price': rnd.randint(500, 20000), 'available': True,
+            'btype': 'Retail' if ptype == 'CommBuildings' else 'Lowrise'}
+
+
+def wl_edit(cur, rnd, s):
+    pid, _ = rnd.choice(s['props'])
+    ptype, desc, city, state, version, _, _ = queries.load_listing(cur, pid)
+    queries.save_listing(cur, pid, ptype, desc, city, state, _details(rnd, ptype),
+                         (round(rnd.uniform(0, 99), 2), 'Central', 'Central', 'Maple', ''), version)
+
+
+def wl_add(cur, rnd, s):
+    aid, _, _ = rnd.choice(s['agents'])
+    ptype = rnd.choice(PTYPES)
+    c = rnd.randrange(len(CITIES))
+    queries.insert_listing(cur, aid, ptype, 'bench listing', CITIES[c], STATES[c],
+                           _details(rnd, ptype), (1.5, 'Central', 'Central', 'Maple', ''))
+
+
+WORKLOADS = {'view': wl_view, 'search': wl_search, 'profile': wl_profile, 'buy': wl_buy, 'edit': wl_edit, 'add': wl_add}
+
+
+def percentile(sorted_vals, p):
+    if not sorted_vals:
+        return None
+    k = max(0, min(len(sorted_vals) - 1, int(round(p / 100.0 * len(sorted_vals) + 0.5)) - 1))
+    return sorted_vals[k]
+
+
+def parse_mix(text, known=WORKLOADS):
+    mix = {}
+    for part in text.split(','):
+        name, _, weight = part.partition('=')
+        if name not in known:
+            raise SystemExit(f'unknown workload {name!r}; choose from {", ".join(known)}')
+        mix[name] = float(weight or 1)
+    return mix
+
+
+def run(args):
+    mix = parse_mix(args.mix)
+    names, weights = list(mix), list(mix.values())
+    samples = load_samples()
+    results = {n: {'lat': [], 'errors': 0, 'statements': 0} for n in names}
+    searches = []
+    lock = threading.Lock()
+    stop_at = time.monotonic() + args.duration
+
+    def session(idx):
+        rnd = random.Random(args.seed + idx)
+        conn = db.connect()
+        conn.cursor_factory = CountingCursor
+        local = {n: {'lat': [], 'errors': 0, 'statements': 0} for n in names}
+        local_searches = []
+        try:
+            while time.monotonic() < stop_at:
+                name = rnd.choices(names, weights)[0]
+                _counter.statements = 0
+                _counter.searches = []
+                t0 = time.perf_counter()
+                try:
+                    with conn.cursor() as cur:
+                        WORKLOADS[name](cur, rnd, samples)
+                    if args.keep_writes:
+                        conn.commit()
+                    else:
+                        conn.rollback()
+                except psycopg2.Error:
+                    conn.rollback()
+                    local[name]['errors'] += 1
+                    continue
+                local[name]['lat'].append(time.perf_counter() - t0)
+                local[name]['statements'] += _counter.statements
+                local_searches += _counter.searches
+        finally:
+            conn.close()
+        with lock:
+            searches.extend(local_searches)
+            for n in names:
+                results[n]['lat'] += local[n]['lat']
+                results[n]['errors'] += local[n]['errors']
+                results[n]['statements'] += local[n]['statements']
+
+    started = time.monotonic()
+    threads = [threading.Thread(target=session, args=(i,)) for i in range(args.sessions)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.monotonic() - started
+
+    report = {'config': {'sessions': args.sessions, 'duration_s': args.duration,
+                         'mix': mix, 'keep_writes': args.keep_writes, 'seed': args.seed},
+              'elapsed_s': round(elapsed, 3), 'workloads': {}}
+    total_ops = 0
+    for n in names:
+        lat = sorted(results[n]['lat'])
+        ops = len(lat)
+        total_ops += ops
+        ms = lambda v: round(v * 1000, 3) if v is not None else None
+        report['workloads'][n] = {
+            'ops': ops,
+            'errors': results[n]['errors'],
+            'throughput_ops_s': round(ops / elapsed, 2),
+            'p50_ms': ms(percentile(lat, 50)),
+            'p95_ms': ms(percentile(lat, 95)),
+            'p99_ms': ms(percentile(lat, 99)),
+            'mean_ms': ms(sum(lat) / ops) if ops else None,
+            'queries_per_op': round(results[n]['statements'] / ops, 2) if ops else None,
+        }
+    report['throughput_ops_s'] = round(total_ops / elapsed, 2)
+    # Every search statement of the view and search workloads, against the
+    # faceted search target (50 ms at p95 on 1M listings).
+    searches.sort()
+    p95 = percentile(searches, 95)
+    report['search'] = {'queries': len(searches),
+                        'p50_ms': ms(percentile(searches, 50)), 'p95_ms': ms(p95),
+                        'p95_target_ms': args.search_p95_ms,
+                        'ok': p95 is None or p95 * 1000 <= args.search_p95_ms}
+    _emit(report, args.out)
+    return 0 if report['search']['ok'] else 1
+
+
+def _emit(report, out):
+    text = json.dumps(report, indent=2, default=str)
+    if out:
+        with open(out, 'w', encoding='utf-8') as f:
+            f.write(text + '\n')
+    print(text)
+
+
+# ------------------------------------------------------------------ explain
+
+class ExplainCursor(psycopg2.extensions.cursor):
+    # Runs EXPLAIN for every statement instead of the statement itself, so
+    # the real query functions can be checked without changing data.
+
+    def execute(self, query, vars=None):
+        # execute_values() passes the statement already composed, as bytes.
+        if isinstance(query, bytes):
+            query = query.decode(self.connection.encoding)
+        super().execute("EXPLAIN (FORMAT JSON) " + query, vars)
+        self.connection.plans.append((query, self.fetchone()[0][0]['Plan']))
+
+
+class ExplainConnection(psycopg2.extensions.connection):
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.plans = []
+
+    def cursor(self, name=None, **kwargs):
+        # Named (server-side) cursors can't run EXPLAIN, so helpers that
+        # open one get a plain ExplainCursor instead.
+        if name is not None:
+            return super().cursor(cursor_factory=ExplainCursor)
+        return super().cursor(**kwargs)
+
+
+def _seq_scans(plan, empty=frozenset()):
+    found = []
+    name = plan.get('Relation Name', '')
+    relation = PARTITION_SUFFIX.sub('', name.lower())
+    if plan.get('Node Type') == 'Seq Scan' and relation in BIG_TABLES and name not in empty:
+        found.append(name)
+    for child in plan.get('Plans', []):
+        found += _seq_scans(child, empty)
+    return found
+
+
+def explain_report():
+    # {check: {statements, seq_scans, error, ok}} and the failure count. A
+    # check fails if it seq-scans a big table, or if it raised before
+    # issuing any statement, since it then tested nothing.
+    samples = load_samples(50)
+    pid, ptype = samples['props'][0]
+    r_id, r_email = samples['renters'][0]
+    a_id, a_email, agency = samples['agents'][0]
+    mine = {ptype: [pid]}
+    # Seeded stays all start in the past year, so most of this month's
+    # bookings overlap the coming week and reading that partition whole is
+    # the better plan; a week a month out is the selective case.
+    month_out = date.today() + timedelta(days=31)
+    checks = {
+        'identity_renter':  lambda c: queries.load_identity(c, r_email),
+        'identity_agent':   lambda c: queries.load_identity(c, a_email),
+        'search_browse':    lambda c: queries.search_listings(c, {}, after=pid),
+        'search_city_part': lambda c: queries.search_listings(c, {'city': CITIES[0][:4]}),
+        'search_state':     lambda c: queries.search_listings(c, {'state': 'Florida'}),
+        'search_facets':    lambda c: queries.search_listings(
+                                c, {'types': ['Houses'], 'price_min': 1000, 'price_max': 1500,
+                                    'available': True}),
+        'search_text':      lambda c: queries.search_listings(c, {'text': 'pool sauna'},
+                                                              after=pid),
+        'search_window':    lambda c: queries.search_listings(
+                                c, {'city': CITIES[1], 'free_from': month_out,
+                                    'free_to': month_out + timedelta(days=7)}),
+        'booked_periods':   lambda c: queries.booked_periods(c, pid),
+        'search_city':      lambda c: queries.search_listings(
+                                c, {'city': CITIES[0], 'rooms_min': 3, 'max_crime': 10}),
+        'agency_portfolio': lambda c: queries.fetch_agency_listings(c, agency),
+        'agent_listings':   lambda c: queries.fetch_agent_listings(c, a_id),
+        'renter_bookings':  lambda c: queries.renter_bookings(c, r_id),
+        'booking_history':  lambda c: queries.booking_history(c.connection, r_id),
+        'cancel_booking':   lambda c: queries.cancel_booking(c, 'B000000001', r_id),
+        'agency_analytics': lambda c: analytics.rollup(c, ['city', 'type'], agency),
+
+        'load_listing':     lambda c: queries.load_listing(c, pid),
+        'save_listing':     lambda c: queries.save_listing(c, pid, ptype, 'd', 'c', 's',
+                                                           _details(random.Random(0), ptype),
+                                                           (1, '', '', '', ''), 1),
+        'delete_listing':   lambda c: queries.delete_listing(c, pid, ptype),
+        'insert_listing':   lambda c: queries.insert_listing(c, a_id, ptype, 'd', 'c', 's',
+                                                             _details(random.Random(0), ptype),
+                                                             (1, '', '', '', '')),
+        'bulk_reprice':     lambda c: queries.bulk_reprice(c, a_id, mine, delta=10),
+        'bulk_available':   lambda c: queries.bulk_set_availability(c, a_id, mine, False),
+        'bulk_delete':      lambda c: queries.bulk_delete(c, a_id, mine),
+    }
+    conn = psycopg2.connect(connection_factory=ExplainConnection, host=db.DB_HOST, port=db.DB_PORT,
+                            dbname=db.DB_NAME, user=db.DB_USER, password=db.DB_PASSWORD)
+    failures = 0
+    report = {}
+    try:
+        with conn.cursor() as cur:
+            cur.execute("SELECT relname FROM pg_class WHERE relkind = 'r' AND pg_relation_size(oid) = 0")
+            empty = {r[0] for r in cur.fetchall()}
+        for name, check in checks.items():
+            conn.plans = []
+            error = None
+            with conn.cursor(cursor_factory=ExplainCursor) as cur:
+                try:
+                    check(cur)
+                except (TypeError, IndexError) as e:
+                    # Query helpers post-process rows that EXPLAIN doesn't
+                    # return; fine once the statement has been planned.
+                    if not conn.plans:
+                        error = f"{type(e).__name__}: {e}"
+                except psycopg2.Error as e:
+                    error = f"{type(e).__name__}: {e}".strip()
+            conn.rollback()
+            scans = sorted({t for _, plan in conn.plans for t in _seq_scans(plan, empty)})
+            ok = bool(conn.plans) and not scans and error is None
+            failures += not ok
+            report[name] = {'statements': len(conn.plans), 'seq_scans': scans,
+                            'error': error, 'ok': ok}
+    finally:
+        conn.close()
+    return report, failures
+
+
+def explain(args):
+    report, failures = explain_report()
+    _emit({'checks': report, 'failures': failures}, args.out)
+    return 1 if failures else 0
+
+
+# --------------------------------------------------------------------- race
+
+def race_report(buyers):
+    # N renters try to book the same free listing at the same moment;
+    # exactly one must win, and every buyer must come back with an outcome
+    # (an exception counts as one, by its type).
+    start, end = date.today(), date.today() + timedelta(days=30)
+    conn = db.connect()
+    try:
+        with conn.cursor() as cur:
+            cur.execute(
+                "SELECT p.PropId FROM property_listing p WHERE p.Availablity AND NOT EXISTS "
+                "(SELECT 1 FROM Booking b WHERE b.PropId = p.PropId AND b.StartDate < %s "
+                "AND b.Period && daterange(%s, %s, '[)')) ORDER BY random() LIMIT 1",
+                (end, start, end)
+            )
+            pid = cur.fetchone()[0]
+            emails = _sample(cur, "SELECT Email FROM Renter", buyers)
+    finally:
+        conn.close()
+
+    barrier = threading.Barrier(len(emails))
+    outcomes, lock = [], threading.Lock()
+
+    def buyer(email):
+        t0 = time.perf_counter()
+        c = None
+        try:
+            c = db.connect()
+            with c.cursor() as cur:
+                barrier.wait()
+                t0 = time.perf_counter()
+                status = queries.book_property(cur, email, pid, None, start, end, 'Cash')[0]
+                c.commit()
+        except Exception as e:
+            barrier.abort()     # nobody waits forever for a buyer that failed to connect
+            status = type(e).__name__
+        finally:
+            if c is not None:
+                c.close()
+        with lock:
+            outcomes.append((status, time.perf_counter() - t0))
+
+    threads = [threading.Thread(target=buyer, args=(e,)) for e in emails]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    counts = {}
+    for status, _ in outcomes:
+        counts[status] = counts.get(status, 0) + 1
+    lat = sorted(l for _, l in outcomes)
+    winners = counts.get('booked', 0)
+    return {'property': pid, 'buyers': len(emails), 'outcomes': counts,
+            'p99_ms': round(percentile(lat, 99) * 1000, 3) if lat else None,
+            'ok': winners == 1 and len(outcomes) == len(emails)}
+
+
+def race(args):
+    report = race_report(args.buyers)
+    _emit(report, args.out)
+    return 0 if report['ok'] else 1
+
+
+# ------------------------------------------------------------------- outbox
+
+def outbox(args):
+    # Books --bookings random stays, drains the outbox, and checks every
+    # booking got its receipt and every event was applied exactly once.
+    samples = load_samples(args.bookings)
+    rnd = random.Random(args.seed)
+    conn = db.connect()
+    booked = []
+    try:
+        with conn.cursor() as cur:
+            cur.execute("SELECT coalesce(sum(Reward_Points), 0) FROM Rewards")
+            points_before = cur.fetchone()[0]
+            t0 = time.monotonic()
+            for _ in range(args.bookings):
+                pid, _ = rnd.choice(samples['props'])
+                _, email = rnd.choice(samples['renters'])
+                start = date.today() + timedelta(days=rnd.randint(200, 2000))
+                status, book_id = queries.book_property(
+                    cur, email, pid, None, start, start + timedelta(days=rnd.randint(1, 14)),
+                    'Cash')[:2]
+                conn.commit()
+                if status == 'booked':
+                    booked.append(book_id)
+            book_s = time.monotonic() - t0
+            t0 = time.monotonic()
+            totals = outbox_worker.drain(conn)
+            drain_s = time.monotonic() - t0
+            cur.execute("SELECT count(*) FROM booking_receipts WHERE BookID = ANY(%s)", (booked,))
+            receipts = cur.fetchone()[0]
+            cur.execute("SELECT coalesce(sum(Reward_Points), 0) FROM Rewards")
+            points_gained = cur.fetchone()[0] - points_before
+            queue = outbox_worker.stats(cur)
+    finally:
+        conn.close()
+    ok = receipts == len(booked) and queue['pending'] == 0 and points_gained == 100 * len(booked)
+    _emit({'bookings': len(booked), 'book_ms_per_op': round(book_s * 1000 / max(len(booked), 1), 3),
+           'drained': totals, 'drain_events_per_s': round(totals['processed'] / drain_s, 1)
+           if drain_s else None, 'receipts': receipts, 'points_gained': points_gained,
+           'queue': queue, 'ok': ok}, args.out)
+    return 0 if ok else 1
+
+
+# ------------------------------------------------------------------- render
+
+def _render_listings(layout, rows):
+    # Runs as a Streamlit script under AppTest, so it imports what it uses.
+    import streamlit as st
+    import main
+    st.session_state.setdefault('role', 'Renter')
+    if layout == 'Table':
+        main.listing_table(rows, 'listing_table')
+    else:
+        main.listing_cards(None, rows, None)
+
+
+def _payload_bytes(node):
+    # Serialized size of every element and block proto sent to the browser.
+    proto = getattr(node, 'proto', None)
+    size = proto.ByteSize() if hasattr(proto, 'ByteSize') else 0
+    for child in getattr(node, 'children', {}).values():
+        size += _payload_bytes(child)
+    return size
+
+
+def render(args):
+    # Payload and server-side render time of one page of listings in each
+    # layout, rendered through Streamlit's AppTest harness.
+    from streamlit.testing.v1 import AppTest
+    conn = db.connect()
+    try:
+        with conn.cursor() as cur:
+            rows = queries.search_listings(cur, {}, limit=max(args.rows))[0]
+    finally:
+        conn.close()
+    report = {}
+    for n in args.rows:
+        page = rows[:n]
+        for layout in ('Cards', 'Table'):
+            times = []
+            for _ in range(args.repeat):
+                at = AppTest.from_function(_render_listings, args=(layout, page),
+                                           default_timeout=600)
+                t0 = time.perf_counter()
+                at.run()
+                times.append(time.perf_counter() - t0)
+            report[f'{layout.lower()}_{len(page)}'] = {
+                'rows': len(page), 'payload_bytes': _payload_bytes(at.main),
+                'render_ms_p50': round(percentile(sorted(times), 50) * 1000, 1),
+                'exceptions': [str(e.value) for e in at.exception],
+            }
+    _emit(report, args.out)
+    return 0
+
+
+# ---------------------------------------------------------------- recommend
+
+def recommend_latency(args):
+    # Per-renter scoring time over the full in-memory snapshot.
+    snapshot = recommend.Snapshot()
+    t0 = time.monotonic()
+    snapshot.load()
+    load_s = time.monotonic() - t0
+    conn = db.connect()
+    try:
+        with conn.cursor() as cur:
+            profiles = _sample(cur, "SELECT PrefLocation, Budget FROM Renter", args.renters)
+    finally:
+        conn.close()
+    lat = []
+    for pref, budget in profiles:
+        t0 = time.perf_counter()
+        snapshot.top_k(pref, float(budget) if budget else None, args.k)
+        lat.append(time.perf_counter() - t0)
+    lat.sort()
+    p95 = percentile(lat, 95)
+    _emit({'listings': len(snapshot.pids), 'renters': len(lat), 'load_s': round(load_s, 2),
+           'p50_ms': round(percentile(lat, 50) * 1000, 3) if lat else None,
+           'p95_ms': round(p95 * 1000, 3) if lat else None,
+           'ok': bool(lat) and p95 < args.budget_ms / 1000}, args.out)
+    return 0 if lat and p95 < args.budget_ms / 1000 else 1
+
+
+# ----------------------------------------------------------------- replicas
+
+def replicas(args):
+    # Opens --reads read-only connections through the replica router and
+    # counts which server answered each. Point DB_REPLICAS at a second local
+    # instance; stopping it mid-run should shift reads back to the primary
+    # without errors.
+    if not db.REPLICA_DSNS:
+        raise SystemExit('set DB_REPLICAS to at least one replica DSN')
+    router = db.get_router()
+    time.sleep(args.warmup)
+    served, errors, lat = {}, 0, []
+    for _ in range(args.reads):
+        t0 = time.perf_counter()
+        try:
+            with db.connection(replica=True) as conn, conn.cursor() as cur:
+                cur.execute("SELECT 1")
+                where = f"{'replica' if db.on_replica(conn) else 'primary'} "
+                where += f"{conn.info.host}:{conn.info.port}"
+        except psycopg2.Error:
+            errors += 1
+            continue
+        lat.append(time.perf_counter() - t0)
+        served[where] = served.get(where, 0) + 1
+        time.sleep(args.interval)
+    lat.sort()
+    healthy = router.stats()['healthy']
+    ok = errors == 0 and (healthy == 0 or any(k.startswith('replica') for k in served))
+    _emit({'policy': router.policy, 'reads': args.reads, 'errors': errors, 'served': served,
+           'p50_ms': round(percentile(lat, 50) * 1000, 3) if lat else None,
+           'router': router.stats(),
+           'replicas': [r.stats() for r in router.replicas], 'ok': ok}, args.out)
+    return 0 if ok else 1
+
+
+# ---------------------------------------------------------------------- api
+
+API_MIX = {'search': 60, 'detail': 35, 'book': 5}
+
+
+def _query_string(search):
+    # random_search() dict -> the query parameters api.py's search takes.
+    q = {}
+    for k, v in search.items():
+        if isinstance(v, bool):
+            v = 'true' if v else 'false'
+        elif isinstance(v, (list, tuple)):
+            v = ','.join(v)
+        if v not in (None, ''):
+            q[k] = str(v)
+    return q
+
+
+def api_report(url, token, concurrency, duration, mix, seed):
+    # Drives a running api.py with `concurrency` clients for `duration`
+    # seconds: facet searches, property details and Cash bookings of
+    # stays years out (these commit). Same per-workload figures as `run`,
+    # for comparing the two paths.
+    import asyncio
+    import aiohttp
+
+    samples = load_samples()
+    names, weights = list(mix), list(mix.values())
+    results = {n: {'lat': [], 'errors': 0} for n in names}
+    headers = {'Authorization': f'Bearer {token}'} if token else {}
+
+    def request(rnd):
+        name = rnd.choices(names, weights)[0]
+        if name == 'search':
+            return name, 'GET', '/listings', {'params': _query_string(random_search(rnd))}, (200,)
+        pid, _ = rnd.choice(samples['props'])
+        if name == 'detail':
+            return name, 'GET', f'/listings/{pid}', {}, (200,)
+        start = date.today() + timedelta(days=rnd.randint(400, 4000))
+        body = {'email': rnd.choice(samples['renters'])[1], 'prop_id': pid, 'mode': 'Cash',
+                'start': start.isoformat(),
+                'end': (start + timedelta(days=rnd.randint(1, 14))).isoformat()}
+        # A stay that overlaps an existing one is a clean 409, not an error.
+        return name, 'POST', '/bookings', {'json': body, 'headers': headers}, (201, 409)
+
+    async def client(session, idx, stop_at):
+        rnd = random.Random(seed + idx)
+        while time.monotonic() < stop_at:
+            name, method, path, kwargs, expected = request(rnd)
+            t0 = time.perf_counter()
+            try:
+                async with session.request(method, url + path, **kwargs) as resp:
+                    await resp.read()
+                    ok = resp.status in expected
+            except aiohttp.ClientError:
+                ok = False
+            if ok:
+                results[name]['lat'].append(time.perf_counter() - t0)
+            else:
+                results[name]['errors'] += 1
+
+    async def drive():
+        connector = aiohttp.TCPConnector(limit=concurrency)
+        async with aiohttp.ClientSession(connector=connector) as session:
+            stop_at = time.monotonic() + duration
+            await asyncio.gather(*(client(session, i, stop_at) for i in range(concurrency)))
+
+    started = time.monotonic()
+    asyncio.run(drive())
+    elapsed = time.monotonic() - started
+
+    report = {'config': {'url': url, 'concurrency': concurrency, 'duration_s': duration,
+                         'mix': mix, 'seed': seed},
+              'elapsed_s': round(elapsed, 3), 'workloads': {}}
+    ms = lambda v: round(v * 1000, 3) if v is not None else None
+    total_ops = 0
+    for n in names:
+        lat = sorted(results[n]['lat'])
+        total_ops += len(lat)
+        report['workloads'][n] = {
+            'ops': len(lat),
+            'errors': results[n]['errors'],
+            'throughput_ops_s': round(len(lat) / elapsed, 2),
+            'p50_ms': ms(percentile(lat, 50)),
+            'p95_ms': ms(percentile(lat, 95)),
+            'p99_ms': ms(percentile(lat, 99)),
+        }
+    report['throughput_ops_s'] = round(total_ops / elapsed, 2)
+    return report
+
+
+def api(args):
+    mix = parse_mix(args.mix, API_MIX)
+    if 'book' in mix and not args.token:
+        raise SystemExit('booking needs the API token: pass --token or set API_TOKEN')
+    report = api_report(args.url.rstrip('/'), args.token, args.concurrency, args.duration,
+                        mix, args.seed)
+    _emit(report, args.out)
+    return 1 if any(w['errors'] for w in report['workloads'].values()) else 0
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description='Synthetic data generator and load driver.')
+    sub = ap.add_subparsers(dest='cmd', required=True)
+
+    g = sub.add_parser('generate', help='bulk-load synthetic data with COPY')
+    g.add_argument('--agents', type=int, default=1000)
+    g.add_argument('--agencies', type=int, default=50)
+    g.add_argument('--renters', type=int, default=20000)
+    g.add_argument('--properties', type=int, default=100000)
+    g.add_argument('--bookings', type=int, default=20000)
+    g.add_argument('--seed', type=int, default=42)
+    g.add_argument('--reset', action='store_true', help='truncate application tables first')
+
+    r = sub.add_parser('run', help='drive page workloads with concurrent sessions')
+    r.add_argument('--sessions', type=int, default=8)
+    r.add_argument('--duration', type=float, default=30)
+    r.add_argument('--mix', default='view=60,search=10,profile=10,buy=10,edit=5,add=5')
+    r.add_argument('--search-p95-ms', type=float, default=50,
+                   help='fail the run if searches are slower than this at p95')
+    r.add_argument('--seed', type=int, default=1)
+    r.add_argument('--keep-writes', action='store_true', help='commit write workloads')
+    r.add_argument('--out')
+
+    e = sub.add_parser('explain', help='fail if any page query seq-scans a large table')
+    e.add_argument('--out')
+
+    c = sub.add_parser('race', help='many renters book one listing concurrently')
+    c.add_argument('--buyers', type=int, default=100)
+    c.add_argument('--out')
+
+    o = sub.add_parser('outbox', help='book, drain the outbox and check every side effect')
+    o.add_argument('--bookings', type=int, default=200)
+    o.add_argument('--seed', type=int, default=7)
+    o.add_argument('--out')
+
+    d = sub.add_parser('render', help='payload size and render time per listing layout')
+    d.add_argument('--rows', type=int, nargs='+', default=[1000, 10000])
+    d.add_argument('--repeat', type=int, default=3)
+    d.add_argument('--out')
+
+    m = sub.add_parser('recommend', help='time per-renter recommendation scoring')
+    m.add_argument('--renters', type=int, default=200)
+    m.add_argument('--k', type=int, default=5)
+    m.add_argument('--budget-ms', type=float, default=100)
+    m.add_argument('--out')
+
+    p = sub.add_parser('replicas', help='route reads through DB_REPLICAS and report where they went')
+    p.add_argument('--reads', type=int, default=1000)
+    p.add_argument('--interval', type=float, default=0.0, help='seconds between reads')
+    p.add_argument('--warmup', type=float, default=1.0, help='seconds to wait for the first health check')
+    p.add_argument('--out')
+
+    h = sub.add_parser('api', help='drive a running api.py with concurrent HTTP clients')
+    h.add_argument('--url', default='http://127.0.0.1:8080')
+    h.add_argument('--token', default=os.getenv('API_TOKEN', ''),
+                   help="api.py's API_TOKEN, needed for bookings")
+    h.add_argument('--concurrency', type=int, default=32)
+    h.add_argument('--duration', type=float, default=30)
+    h.add_argument('--mix', default=','.join(f'{k}={v}' for k, v in API_MIX.items()))
+    h.add_argument('--seed', type=int, default=1)
+    h.add_argument('--out')
+
+    args = ap.parse_args(argv)
+    return {'generate': generate, 'run': run, 'explain': explain, 'race': race,
+            'outbox': outbox, 'render': render, 'api': api,
+            'recommend': recommend_latency, 'replicas': replicas}[args.cmd](args) or 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
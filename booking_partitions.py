@@ -0,0 +1,77 @@
+import os
+import sys
+import json
+import argparse
+
+import db
+
+
+# Run `maintain` daily (cron or similar): it is idempotent, and a month
+# without a partition lands in booking_default until the next run.
+AHEAD              = int(os.getenv('BOOKING_PARTITIONS_AHEAD', '12'))
+ARCHIVE_TABLESPACE = os.getenv('BOOKING_ARCHIVE_TABLESPACE') or None
+
+STATUS_SQL = """
+    SELECT i.inhparent::regclass::text, c.relname, pg_get_expr(c.relpartbound, c.oid),
+           GREATEST(c.reltuples, 0)::bigint, COALESCE(t.spcname, 'pg_default'),
+           pg_total_relation_size(c.oid)
+    FROM pg_inherits i
+    JOIN pg_class c ON c.oid = i.inhrelid
+    LEFT JOIN pg_tablespace t ON t.oid = c.reltablespace
+    WHERE i.inhparent IN ('booking'::regclass, 'booking_archive'::regclass)
+    ORDER BY 1, 2
+"""
+
+
+def maintain(conn, ahead=AHEAD, archive=True, tablespace=ARCHIVE_TABLESPACE):
+    # Creates partitions through `ahead` months from now, then moves months
+    # whose stays have all ended into booking_archive. Each step commits on
+    # its own so a failed archive keeps the new partitions.
+    report = {}
+    with conn.cursor() as cur:
+        cur.execute("SELECT booking_partitions_ensure(%s)", (ahead,))
+        report['created'] = [r[0] for r in cur.fetchall()]
+        conn.commit()
+        if archive:
+            cur.execute("SELECT booking_partitions_archive(%s)", (tablespace,))
+            report['archived'] = [r[0] for r in cur.fetchall()]
+            conn.commit()
+    return report
+
+
+def status(cur):
+    cur.execute(STATUS_SQL)
+    parts = [{'parent': parent, 'partition': name, 'bound': bound, 'rows': rows,
+              'tablespace': space, 'bytes': size}
+             for parent, name, bound, rows, space, size in cur.fetchall()]
+    # Rows here mean `maintain` has fallen behind the bookings being taken.
+    cur.execute("SELECT count(*) FROM booking_default")
+    return {'partitions': parts, 'default_rows': cur.fetchone()[0]}
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description='Booking partition maintenance.')
+    sub = ap.add_subparsers(dest='command', required=True)
+    m = sub.add_parser('maintain', help='create upcoming partitions and archive finished months')
+    m.add_argument('--ahead', type=int, default=AHEAD, help='months of partitions to keep ready')
+    m.add_argument('--tablespace', default=ARCHIVE_TABLESPACE,
+                   help='move archived partitions and their indexes here')
+    m.add_argument('--no-archive', dest='archive', action='store_false')
+    sub.add_parser('status', help='print partitions of Booking and booking_archive')
+    args = ap.parse_args(argv)
+
+    conn = db.connect()
+    try:
+        if args.command == 'maintain':
+            report = maintain(conn, args.ahead, args.archive, args.tablespace)
+        else:
+            with conn.cursor() as cur:
+                report = status(cur)
+        print(json.dumps(report))
+    finally:
+        conn.close()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
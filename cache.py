@@ -0,0 +1,300 @@
+import os
+import sys
+import json
+import time
+import select
+import threading
+from collections import OrderedDict
+
+import psycopg2
+import psycopg2.extensions
+
+import db
+import queries
+
+
+CACHE_TTL     = float(os.getenv('LISTING_CACHE_TTL', '60'))
+CACHE_SIZE    = int(os.getenv('LISTING_CACHE_SIZE', '512'))
+NOTIFY_CHANNEL = 'listing_cache'
+NOTIFY_MAX_BYTES = 7900    # pg_notify payloads must stay under 8000 bytes
+
+
+class ListingCache:
+    # Read-through LRU cache with a TTL. Every entry carries a predicate
+    # deciding whether a given change event can affect it, so writes only
+    # drop the entries they actually touch.
+
+    def __init__(self, maxsize, ttl):
+        self.maxsize = maxsize
+        self.ttl     = ttl
+        self._data   = OrderedDict()    # key -> (expires_at, value, affected_by)
+        self._lock   = threading.Lock()
+        self._gen    = 0                # bumped by every invalidation
+        self._invalidated_at = float('-inf')
+        self.counters = {'hits': 0, 'misses': 0, 'evictions': 0,
+                         'expired': 0, 'invalidations': 0}
+
+    def get_or_load(self, key, loader, affected_by, lagging=False):
+        # lagging: the loader reads a replica, which may not have replayed
+        # the write behind a recent invalidation yet; such loads are served
+        # but not kept for db.READ_YOUR_WRITES seconds after one.
+        now = time.monotonic()
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None:
+                if entry[0] > now:
+                    self._data.move_to_end(key)
+                    self.counters['hits'] += 1
+                    return entry[1]
+                del self._data[key]
+                self.counters['expired'] += 1
+            self.counters['misses'] += 1
+            gen = self._gen
+
+        value = loader()
+        with self._lock:
+            # An invalidation that raced with the load may already describe
+            # a newer state than what we read; serve it but don't keep it.
+            if gen != self._gen or (lagging and now - self._invalidated_at < db.READ_YOUR_WRITES):
+                return value
+            self._data[key] = (now + self.ttl, value, affected_by(value))
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.counters['evictions'] += 1
+        return value
+
+    def invalidate(self, event):
+        if event.get('all'):
+            self.clear()
+            return None
+        with self._lock:
+            stale = [k for k, (_, _, hit) in self._data.items() if hit(event)]
+            for k in stale:
+                del self._data[k]
+            self._gen += 1
+            self._invalidated_at = time.monotonic()
+            self.counters['invalidations'] += len(stale)
+        return len(stale)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self._gen += 1
+            self._invalidated_at = time.monotonic()
+
+    def stats(self):
+        with self._lock:
+            s = dict(self.counters)
+            s['size'] = len(self._data)
+        lookups = s['hits'] + s['misses']
+        s['hit_ratio'] = s['hits'] / lookups if lookups else 0.0
+        return s
+
+
+_cache = ListingCache(CACHE_SIZE, CACHE_TTL)
+_subscribers = []
+
+
+def subscribe(fn):
+    # fn(event) runs after the cache has applied every change event, local
+    # or heard over NOTIFY, so other process-wide copies of listing data
+    # (e.g. the recommendation snapshot) can follow the same stream.
+    if fn not in _subscribers:
+        _subscribers.append(fn)
+
+
+def _call(fn, arg, fallback):
+    # A failing callback must not take the listener thread down with it:
+    # log, then give it fallback (a flush, or None for a channel) instead.
+    try:
+        fn(arg)
+    except Exception as e:
+        print(f"listing cache: {getattr(fn, '__qualname__', fn)} failed: {e!r}", file=sys.stderr)
+        if arg is not fallback:
+            _call(fn, fallback, fallback)
+
+
+def _apply(event):
+    flush = flush_event()
+    _call(_cache.invalidate, event, flush)
+    for fn in list(_subscribers):
+        _call(fn, event, flush)
+
+
+_channels = {}
+
+
+def on_notify(channel, fn):
+    # Has the listener thread also LISTEN on channel and pass each payload
+    # to fn; fn(None) after every (re)connect means notifications may have
+    # been missed. Register before start_listener().
+    _channels[channel] = fn
+
+
+def _reconnected():
+    _apply(flush_event())
+    for fn in list(_channels.values()):
+        _call(fn, None, None)
+
+
+def _norm(text):
+    return (text or '').strip().lower()
+
+
+def _matches(needle, value):
+    # Mirrors "col ILIKE '%needle%'"; user-typed wildcards are treated as
+    # matching anything so invalidation errs on the side of dropping.
+    if not needle or '%' in needle or '_' in needle:
+        return True
+    return needle in (value or '').lower()
+
+
+def change_event(pid, locations=(), agency=None):
+    # locations: every (city, state) the listing had before and after the
+    # write, so both old and new search results get refreshed. Without
+    # them every search entry goes, since any could count the listing.
+    return {'pid': pid, 'locations': [list(l) for l in locations], 'agency': agency}
+
+
+def batch_event(pids, locations=()):
+    # Many listings changed in place (price, availability) or were deleted;
+    # locations as in change_event, for all of them together.
+    return {'pid': None, 'pids': sorted(pids),
+            'locations': sorted({tuple(l) for l in locations}), 'agency': None}
+
+
+def booking_event(pid):
+    # A stay was booked or cancelled: the listing itself is unchanged, so
+    # only searches for free dates and entries holding it are affected.
+    return {'pid': pid, 'locations': [], 'agency': None, 'booking': True}
+
+
+def _touches(event, pids):
+    return event['pid'] in pids or not pids.isdisjoint(event.get('pids') or ())
+
+
+def flush_event():
+    # For bulk writes that touch too many listings to describe one by one.
+    return {'pid': None, 'locations': [], 'agency': None, 'all': True}
+
+
+def search_key(search):
+    # Hashable, normalized form of a facet search (see queries.search_listings).
+    key = []
+    for k, v in sorted(search.items()):
+        if isinstance(v, str):
+            v = _norm(v)
+        elif isinstance(v, (list, tuple, set)):
+            v = tuple(sorted(v))
+        if v is not None and v != '' and v != ():
+            key.append((k, v))
+    return tuple(key)
+
+
+def search_page(cur, search, after=None, before=None, limit=20):
+    city, state = _norm(search.get('city')), _norm(search.get('state'))
+    key = ('search', search_key(search), after, before, limit)
+    # A booking anywhere can change which listings are free for a window.
+    window = bool(search.get('free_from') and search.get('free_to'))
+
+    def affected_by(result):
+        pids = {r[0] for r in result[0]}
+
+        # Facet counts span every match, not just the page, so any write
+        # that may fall inside the searched locations drops the entry.
+        def hit(event):
+            if _touches(event, pids) or window:
+                return True
+            if event.get('booking'):
+                return False
+            if not event['locations']:
+                return True
+            return any(_matches(city, c) and _matches(state, s)
+                       for c, s in event['locations'])
+        return hit
+
+    return _cache.get_or_load(
+        key,
+        lambda: queries.search_listings(cur, search, after, before, limit),
+        affected_by, db.on_replica(cur.connection)
+    )
+
+def agency_listings(cur, agency_name):
+    def affected_by(rows):
+        pids = {r[0] for r in rows}
+        return lambda event: _touches(event, pids) or event['agency'] == agency_name
+
+    return _cache.get_or_load(
+        ('agency', agency_name),
+        lambda: queries.fetch_agency_listings(cur, agency_name),
+        affected_by, db.on_replica(cur.connection)
+    )
+
+
+def commit(conn, cur, *events):
+    # NOTIFY is transactional: other workers only hear about the change once
+    # it is visible. This process invalidates right after the commit so the
+    # st.rerun() that follows never reads its own stale entries.
+    events = [e if len(json.dumps(e)) <= NOTIFY_MAX_BYTES else flush_event() for e in events]
+    for event in events:
+        cur.execute("SELECT pg_notify(%s, %s)", (NOTIFY_CHANNEL, json.dumps(event)))
+    conn.commit()
+    for event in events:
+        _apply(event)
+
+
+def stats():
+    return _cache.stats()
+
+
+_listener = None
+_listener_lock = threading.Lock()
+
+
+def _listen_forever():
+    backoff = 1
+    while True:
+        conn = None
+        try:
+            conn = db.connect()
+            conn.set_isolation_level(psycopg2.extensions.ISOLATION_LEVEL_AUTOCOMMIT)
+            with conn.cursor() as cur:
+                cur.execute(f"LISTEN {NOTIFY_CHANNEL}")
+                for channel in list(_channels):
+                    cur.execute(f"LISTEN {channel}")
+            # Anything missed while disconnected is unknown; start clean.
+            _reconnected()
+            backoff = 1
+            while True:
+                if select.select([conn], [], [], 30) == ([], [], []):
+                    continue
+                conn.poll()
+                while conn.notifies:
+                    note = conn.notifies.pop(0)
+                    if note.channel != NOTIFY_CHANNEL:
+                        if note.channel in _channels:
+                            _call(_channels[note.channel], note.payload, None)
+                        continue
+                    try:
+                        _apply(json.loads(note.payload))
+                    except (ValueError, KeyError, TypeError):
+                        _apply(flush_event())
+        except Exception as e:
+            if not isinstance(e, psycopg2.Error):
+                print(f"listing cache listener: {e!r}; reconnecting", file=sys.stderr)
+            if conn is not None:
+                conn.close()
+            _reconnected()
+            time.sleep(backoff)
+            backoff = min(backoff * 2, 30)
+
+
+def start_listener():
+    global _listener
+    if _listener is None:
+        with _listener_lock:
+            if _listener is None:
+                _listener = threading.Thread(target=_listen_forever,
+                                             name='listing-cache-listener', daemon=True)
+                _listener.start()
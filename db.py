@@ -0,0 +1,403 @@
+import io
+import os
+import time
+import itertools
+import threading
+from contextlib import contextmanager
+
+import psycopg2
+import psycopg2.extensions
+
+import instrument
+
+
+DB_HOST     = os.getenv('DB_HOST', 'localhost')
+DB_PORT     = os.getenv('DB_PORT', '5432')
+DB_NAME     = os.getenv('DB_NAME', 'DBOSchema')
+DB_USER     = os.getenv('DB_USER', 'postgres')
+DB_PASSWORD = os.getenv('DB_PASSWORD', 'tgms1402')
+
+POOL_MIN          = int(os.getenv('DB_POOL_MIN', '1'))
+POOL_MAX          = int(os.getenv('DB_POOL_MAX', '10'))
+POOL_TIMEOUT      = float(os.getenv('DB_POOL_TIMEOUT', '5'))
+POOL_MAX_LIFETIME = float(os.getenv('DB_POOL_MAX_LIFETIME', '1800'))
+POOL_HEALTH_IDLE  = float(os.getenv('DB_POOL_HEALTH_IDLE', '30'))
+
+# Read replicas as libpq DSNs separated by ';', e.g.
+#   DB_REPLICAS='host=localhost port=5433 dbname=DBOSchema user=postgres password=...'
+# Any second PostgreSQL instance with the same schema works for testing;
+# one that is not in recovery counts as zero lag.
+REPLICA_DSNS     = [d.strip() for d in os.getenv('DB_REPLICAS', '').split(';') if d.strip()]
+REPLICA_POLICY   = os.getenv('DB_REPLICA_POLICY', 'round_robin')   # or 'least_latency'
+REPLICA_CHECK    = float(os.getenv('DB_REPLICA_CHECK_INTERVAL', '5'))
+REPLICA_MAX_LAG  = float(os.getenv('DB_REPLICA_MAX_LAG', '5'))
+READ_YOUR_WRITES = float(os.getenv('DB_READ_YOUR_WRITES', '10'))
+
+
+class PoolExhausted(Exception):
+    pass
+
+
+def connect():
+    return psycopg2.connect(
+        host=DB_HOST,
+        port=DB_PORT,
+        dbname=DB_NAME,
+        user=DB_USER,
+        password=DB_PASSWORD,
+        cursor_factory=instrument.InstrumentedCursor
+    )
+
+
+def connect_replica(dsn, **kwargs):
+    # Read-only sessions, so a write routed here by mistake fails loudly.
+    conn = psycopg2.connect(dsn, cursor_factory=instrument.InstrumentedCursor, **kwargs)
+    conn.set_session(readonly=True)
+    return conn
+
+
+def on_replica(conn):
+    return conn.readonly is True
+
+
+class ConnectionPool:
+    # Bounded pool shared by every Streamlit session in the process.
+    # Connections older than max_lifetime are recycled, and connections
+    # idle for longer than health_idle are pinged before being handed out.
+
+    def __init__(self, factory, minconn, maxconn, timeout, max_lifetime, health_idle):
+        self.factory      = factory
+        self.maxconn      = maxconn
+        self.timeout      = timeout
+        self.max_lifetime = max_lifetime
+        self.health_idle  = health_idle
+        self._idle    = []          # [(conn, released_at)]
+        self._born    = {}          # id(conn) -> created_at
+        self._opening = 0
+        self._cond    = threading.Condition()
+        self._metrics = {
+            'checkouts': 0, 'waits': 0, 'exhausted': 0,
+            'created': 0, 'recycled': 0, 'failed_health': 0,
+            'peak_in_use': 0, 'wait_seconds': 0.0,
+        }
+        for _ in range(minconn):
+            self._idle.append((self._open(), time.monotonic()))
+
+    def _open(self):
+        conn = self.factory()
+        with self._cond:
+            self._born[id(conn)] = time.monotonic()
+            self._metrics['created'] += 1
+        return conn
+
+    def _discard(self, conn):
+        with self._cond:
+            self._born.pop(id(conn), None)
+            self._cond.notify()
+        try:
+            conn.close()
+        except psycopg2.Error:
+            pass
+
+    def _healthy(self, conn, released):
+        now = time.monotonic()
+        if conn.closed or now - self._born[id(conn)] > self.max_lifetime:
+            self._metrics['recycled'] += 1
+            return False
+        if now - released > self.health_idle:
+            try:
+                with conn.cursor() as cur:
+                    cur.execute("SELECT 1")
+                conn.rollback()
+            except psycopg2.Error:
+                self._metrics['failed_health'] += 1
+                return False
+        return True
+
+    def _reserve(self, deadline):
+        # Returns an idle (conn, released_at) pair, or None when the caller
+        # has been granted a slot to open a fresh connection.
+        waited = False
+        with self._cond:
+            while True:
+                if self._idle:
+                    return self._idle.pop(), waited
+                if len(self._born) + self._opening < self.maxconn:
+                    self._opening += 1
+                    return None, waited
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self._metrics['exhausted'] += 1
+                    raise PoolExhausted(
+                        f"No free database connection after {self.timeout}s "
+                        f"({self.maxconn} in use)"
+                    )
+                if not waited:
+                    self._metrics['waits'] += 1
+                    waited = True
+                self._cond.wait(remaining)
+
+    def getconn(self):
+        # Network work (connect, health ping) happens outside the lock so a
+        # slow handshake never blocks other sessions returning connections.
+        start = time.monotonic()
+        deadline = start + self.timeout
+        while True:
+            idle, waited = self._reserve(deadline)
+            if idle is None:
+                try:
+                    conn = self._open()
+                finally:
+                    with self._cond:
+                        self._opening -= 1
+                        self._cond.notify()
+                break
+            conn, released = idle
+            if self._healthy(conn, released):
+                break
+            self._discard(conn)
+        with self._cond:
+            m = self._metrics
+            m['checkouts'] += 1
+            if waited:
+                m['wait_seconds'] += time.monotonic() - start
+            m['peak_in_use'] = max(m['peak_in_use'], len(self._born) - len(self._idle))
+        return conn
+
+    def putconn(self, conn):
+        # Anything left uncommitted (e.g. st.rerun() raised mid-transaction)
+        # is rolled back so the next borrower starts clean.
+        broken = conn.closed
+        if not broken and conn.get_transaction_status() != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+            try:
+                conn.rollback()
+            except psycopg2.Error:
+                broken = True
+        if broken:
+            self._discard(conn)
+            return
+        with self._cond:
+            self._idle.append((conn, time.monotonic()))
+            self._cond.notify()
+
+    def stats(self):
+        with self._cond:
+            s = dict(self._metrics)
+            s['open']    = len(self._born)
+            s['idle']    = len(self._idle)
+            s['in_use']  = s['open'] - s['idle']
+            s['maxconn'] = self.maxconn
+            return s
+
+    def closeall(self):
+        with self._cond:
+            idle, self._idle = self._idle, []
+        for conn, _ in idle:
+            self._discard(conn)
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool():
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ConnectionPool(connect, POOL_MIN, POOL_MAX, POOL_TIMEOUT,
+                                       POOL_MAX_LIFETIME, POOL_HEALTH_IDLE)
+    return _pool
+
+
+LAG_SQL = """
+    SELECT CASE WHEN NOT pg_is_in_recovery()
+                  OR pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+                ELSE EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()) END
+"""
+
+
+class Replica:
+    # One read replica: its own pool, plus health, round-trip latency and
+    # replication lag as last measured by the router's checker thread.
+    # Starts unhealthy, so reads stay on the primary until the first check.
+
+    def __init__(self, dsn):
+        self.dsn     = dsn
+        self.pool    = ConnectionPool(lambda: connect_replica(dsn), 0, POOL_MAX, POOL_TIMEOUT,
+                                      POOL_MAX_LIFETIME, POOL_HEALTH_IDLE)
+        self.healthy = False
+        self.latency = None     # seconds, moving average
+        self.lag     = None     # seconds
+        self.error   = None
+        self._probe  = None
+
+    def check(self):
+        try:
+            if self._probe is None or self._probe.closed:
+                self._probe = connect_replica(self.dsn, connect_timeout=max(int(REPLICA_CHECK), 1))
+                self._probe.autocommit = True
+            t0 = time.perf_counter()
+            with self._probe.cursor() as cur:
+                cur.execute(LAG_SQL)
+                lag = float(cur.fetchone()[0] or 0)
+            rtt = time.perf_counter() - t0
+        except psycopg2.Error as e:
+            self.mark_down(e)
+            return
+        self.latency = rtt if self.latency is None else 0.8 * self.latency + 0.2 * rtt
+        self.lag     = lag
+        self.healthy = lag <= REPLICA_MAX_LAG
+        self.error   = None if self.healthy else f'lagging {lag:.1f}s'
+
+    def mark_down(self, error):
+        self.healthy = False
+        self.error   = f"{type(error).__name__}: {error}".strip()
+        if self._probe is not None:
+            self._probe.close()
+            self._probe = None
+        self.pool.closeall()
+
+    def stats(self):
+        return {'healthy': self.healthy, 'latency_ms': None if self.latency is None
+                else round(self.latency * 1000, 3), 'lag_s': self.lag, 'error': self.error,
+                'pool': self.pool.stats()}
+
+
+class Router:
+    # Picks a healthy replica per read connection (round-robin or lowest
+    # latency); None means use the primary. A checker thread re-measures
+    # every replica each REPLICA_CHECK seconds.
+
+    def __init__(self, dsns, policy):
+        self.replicas = [Replica(dsn) for dsn in dsns]
+        self.policy   = policy
+        self._turn    = itertools.count()
+        self.counters = {'replica_reads': 0, 'primary_reads': 0, 'fallbacks': 0}
+        threading.Thread(target=self._check_forever, name='replica-checker', daemon=True).start()
+
+    def _check_forever(self):
+        while True:
+            for replica in self.replicas:
+                replica.check()
+            time.sleep(REPLICA_CHECK)
+
+    def choose(self):
+        healthy = [r for r in self.replicas if r.healthy]
+        if not healthy:
+            return None
+        if self.policy == 'least_latency':
+            return min(healthy, key=lambda r: r.latency)
+        return healthy[next(self._turn) % len(healthy)]
+
+    def stats(self):
+        s = dict(self.counters)
+        s['replicas'] = len(self.replicas)
+        s['healthy']  = sum(r.healthy for r in self.replicas)
+        return s
+
+
+_router = None
+
+
+def get_router():
+    global _router
+    if _router is None:
+        with _pool_lock:
+            if _router is None:
+                _router = Router(REPLICA_DSNS, REPLICA_POLICY)
+    return _router
+
+
+def replica_stats():
+    return get_router().stats() if REPLICA_DSNS else {}
+
+
+@contextmanager
+def connection(replica=False):
+    # replica=True is for read-only work: it goes to a healthy replica when
+    # DB_REPLICAS is set and falls back to the primary otherwise, including
+    # when the chosen replica cannot hand out a connection.
+    pool = get_pool()
+    conn = None
+    if replica and REPLICA_DSNS:
+        router = get_router()
+        target = router.choose()
+        if target is not None:
+            try:
+                conn = target.pool.getconn()
+                pool = target.pool
+                router.counters['replica_reads'] += 1
+            except (psycopg2.Error, PoolExhausted) as e:
+                router.counters['fallbacks'] += 1
+                if isinstance(e, psycopg2.Error):
+                    target.mark_down(e)
+        if conn is None:
+            router.counters['primary_reads'] += 1
+    if conn is None:
+        conn = pool.getconn()
+    try:
+        yield conn
+    finally:
+        pool.putconn(conn)
+
+
+@contextmanager
+def primary(conn):
+    # For work that must run on the primary (writes, and reads that must
+    # see them) while conn, from connection(replica=True), is still held:
+    # conn itself when it already is on the primary. Taking a second
+    # primary connection instead would let POOL_MAX sessions that each
+    # hold one wait forever on one another.
+    if on_replica(conn):
+        with connection() as c:
+            yield c
+    else:
+        yield conn
+
+
+def pool_stats():
+    return get_pool().stats()
+
+
+def _copy_value(v):
+    if v is None:
+        return '\\N'
+    return (str(v).replace('\\', '\\\\').replace('\t', ' ').replace('\n', ' ')
+            .replace('\r', ' '))
+
+
+class CopyStream(io.TextIOBase):
+    # File-like view over a row iterator so COPY streams in constant memory.
+
+    def __init__(self, rows):
+        self._rows = rows
+        self._buf  = ''
+
+    def readable(self):
+        return True
+
+    def read(self, size=-1):
+        parts, have = [self._buf], len(self._buf)
+        while size < 0 or have < size:
+            row = next(self._rows, None)
+            if row is None:
+                break
+            line = '\t'.join(_copy_value(v) for v in row) + '\n'
+            parts.append(line)
+            have += len(line)
+        data = ''.join(parts)
+        if size < 0:
+            self._buf = ''
+            return data
+        self._buf = data[size:]
+        return data[:size]
+
+    readline = read
+
+
+def copy_rows(cur, table, columns, rows):
+    cur.copy_expert(
+        f"COPY {table} ({', '.join(columns)}) FROM STDIN",
+        CopyStream(iter(rows))
+    )
@@ -0,0 +1,115 @@
+import os
+import sys
+import json
+import time
+import weakref
+import threading
+
+import db
+import cache
+import queries
+
+
+CHANNEL       = 'listing_changes'
+POLL_INTERVAL = float(os.getenv('LISTING_FEED_POLL', '2'))
+
+# Fields a change can carry new values for; anything else means re-reading
+# the listing (see migrations/013_listing_change_feed.sql).
+PATCHABLE = {'price', 'availablity'}
+
+# Added to by session threads, read by the listener thread.
+_views = weakref.WeakSet()
+_views_lock = threading.Lock()
+
+
+class View:
+    # One session's current listing page, kept current by the change feed.
+    # The listener thread queues changes for the listings on the page;
+    # refresh() then patches price and availability into the rows in place
+    # and re-reads only listings that changed otherwise or were deleted.
+    # A missed-notification signal marks the view for a full re-query.
+
+    def __init__(self, key, rows, has_prev, has_next, facets):
+        self.key       = key
+        self.rows      = list(rows)
+        self.has_prev  = has_prev
+        self.has_next  = has_next
+        self.facets    = facets
+        self.loaded_at = time.monotonic()
+        self.resync    = False
+        self._lock     = threading.Lock()
+        self._watch    = {r[0] for r in self.rows}
+        self._pending  = {}     # pid -> change merged from every notification
+        with _views_lock:
+            _views.add(self)
+
+    def offer(self, changes):
+        with self._lock:
+            for change in changes:
+                pid = change['pid']
+                if pid not in self._watch:
+                    continue
+                merged = self._pending.setdefault(pid, {'changed': set()})
+                merged['changed'].update(change.get('changed', ()))
+                for k in ('op', 'price', 'available'):
+                    if k in change:
+                        merged[k] = change[k]
+
+    def pending(self):
+        return self.resync or bool(self._pending)
+
+    def stale(self):
+        return self.resync or time.monotonic() - self.loaded_at > cache.CACHE_TTL
+
+    def refresh(self, conn):
+        # conn: the caller's connection, reused if it is on the primary.
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        if not pending:
+            return 0
+        reread = [pid for pid, c in pending.items()
+                  if c.get('op') == 'delete' or c['changed'] - PATCHABLE]
+        fresh = {}
+        if reread:
+            # From the primary: a replica may not have replayed the change yet.
+            with db.primary(conn) as c, c.cursor() as primary:
+                fresh = {r[0]: r for r in queries.fetch_listings_by_id(primary, reread)}
+        rows = []
+        for row in self.rows:
+            change = pending.get(row[0])
+            if change is None:
+                rows.append(row)
+            elif row[0] in fresh:
+                rows.append(fresh[row[0]])
+            elif row[0] not in reread:
+                rows.append(row[:5] + (change.get('price', row[5]),
+                                       change.get('available', row[6])) + row[7:])
+            # else: gone since the page was read
+        with self._lock:
+            self.rows = rows
+            self._watch = {r[0] for r in rows}
+        return len(pending)
+
+
+def _dispatch(payload):
+    # Runs on the cache listener thread for every 'listing_changes' NOTIFY.
+    with _views_lock:
+        views = list(_views)
+    try:
+        changes = None if payload is None else json.loads(payload)
+    except ValueError:
+        changes = None
+    for view in views:
+        try:
+            if changes is None:
+                view.resync = True
+            else:
+                view.offer(changes)
+        except Exception as e:
+            print(f"listing feed: bad change ({e!r}); resyncing the view", file=sys.stderr)
+            view.resync = True
+
+
+def start():
+    # Safe to call on every rerun; must run before cache.start_listener().
+    cache.on_notify(CHANNEL, _dispatch)
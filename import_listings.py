@@ -0,0 +1,239 @@
+import os
+import sys
+import csv
+import json
+import time
+import argparse
+from decimal import Decimal, InvalidOperation
+
+import db
+import cache
+import queries
+
+
+FIELDS = ['agent_id', 'type', 'description', 'city', 'state', 'address', 'rooms',
+          'sqft', 'price', 'available', 'btype', 'crime_rate', 'school', 'hospital',
+          'park', 'mart']
+ALIASES = {'building_type': 'btype', 'business_type': 'btype', 'proptype': 'type',
+           'agentid': 'agent_id', 'crimerate': 'crime_rate', 'nearbyschool': 'school'}
+
+STAGING_SQL = """
+    CREATE TEMP TABLE IF NOT EXISTS import_staging
+        (line_no BIGINT,
+         pid VARCHAR(10) DEFAULT next_id('property'),
+         agent_id VARCHAR(10), ptype VARCHAR(15), description VARCHAR(50),
+         city VARCHAR(12), state VARCHAR(12), address VARCHAR(50),
+         rooms numeric(2,0), sqft numeric(7,2), price numeric(12,2),
+         available BOOLEAN, btype VARCHAR(25), crime_rate numeric(4,2),
+         school VARCHAR(12), hospital VARCHAR(12), park VARCHAR(12), mart VARCHAR(12))
+    ON COMMIT DELETE ROWS
+"""
+STAGING_COLUMNS = ['line_no'] + ['agent_id', 'ptype'] + FIELDS[2:]
+
+LOAD_SQL = [
+    "INSERT INTO Property(PropId, PropType, Description, City, State_, AgentID) "
+    "SELECT pid, ptype, description, city, state, agent_id FROM import_staging",
+    "INSERT INTO VacHome SELECT pid, rooms, address, sqft, price, available "
+    "FROM import_staging WHERE ptype = 'VacHome'",
+    "INSERT INTO Houses SELECT pid, rooms, address, sqft, price, available "
+    "FROM import_staging WHERE ptype = 'Houses'",
+    "INSERT INTO Apartments SELECT pid, rooms, address, sqft, price, available, btype "
+    "FROM import_staging WHERE ptype = 'Apartments'",
+    "INSERT INTO CommBuildings SELECT pid, address, btype, sqft, price, available "
+    "FROM import_staging WHERE ptype = 'CommBuildings'",
+    "INSERT INTO Neighbourhood(PropId, CrimeRate, NearbySchool, Hospital, Park, mart) "
+    "SELECT pid, crime_rate, school, hospital, park, mart FROM import_staging",
+]
+
+
+class RowError(ValueError):
+    pass
+
+
+def _text(row, name, limit, required=False):
+    # JSONL may carry numbers ("zip": 33101) where CSV has text.
+    raw = row.get(name)
+    value = '' if raw is None else str(raw).strip()
+    if required and not value:
+        raise RowError(f'{name} is required')
+    if len(value) > limit:
+        raise RowError(f'{name} longer than {limit} characters')
+    return value
+
+
+def _numeric(row, name, precision, scale, required=True, minimum=0):
+    # Mirrors numeric(precision, scale): rounded to scale, and the integer
+    # part must fit in precision - scale digits.
+    raw = row.get(name)
+    if raw is None or str(raw).strip() == '':
+        if required:
+            raise RowError(f'{name} is required')
+        return None
+    try:
+        value = Decimal(str(raw).strip())
+        if not value.is_finite():
+            raise RowError(f'{name} is not a finite number: {raw!r}')
+        value = value.quantize(Decimal(1).scaleb(-scale))
+    except InvalidOperation:
+        raise RowError(f'{name} is not a number: {raw!r}')
+    if abs(value) >= Decimal(10) ** (precision - scale):
+        raise RowError(f'{name} does not fit numeric({precision},{scale})')
+    if minimum is not None and value < minimum:
+        raise RowError(f'{name} must be >= {minimum}')
+    return value
+
+
+def _bool(row, name):
+    raw = str(row.get(name, '')).strip().lower()
+    if raw in ('', 'true', 't', '1', 'yes', 'y'):
+        return True
+    if raw in ('false', 'f', '0', 'no', 'n'):
+        return False
+    raise RowError(f'{name} is not a boolean: {raw!r}')
+
+
+def validate(row, default_agent=None):
+    if not isinstance(row, dict):
+        raise RowError(f'expected an object, got {type(row).__name__}')
+    row = {ALIASES.get(k.strip().lower(), k.strip().lower()): v for k, v in row.items() if k}
+    ptype = _text(row, 'type', 15, required=True)
+    if ptype not in queries.TYPE_MAP:
+        raise RowError(f'unknown type {ptype!r}')
+    if not row.get('agent_id') and default_agent:
+        row['agent_id'] = default_agent
+    commercial = ptype == 'CommBuildings'
+    return [
+        _text(row, 'agent_id', 10, required=True),
+        ptype,
+        _text(row, 'description', 50),
+        _text(row, 'city', 12, required=True),
+        _text(row, 'state', 12, required=True),
+        _text(row, 'address', 50),
+        None if commercial else _numeric(row, 'rooms', 2, 0, minimum=1),
+        _numeric(row, 'sqft', 7, 2),
+        _numeric(row, 'price', 12, 2),
+        _bool(row, 'available'),
+        _text(row, 'btype', 25 if commercial else 15) or None,
+        _numeric(row, 'crime_rate', 4, 2),
+        # Neighbourhood's primary key spans every column, so blanks not NULLs.
+        _text(row, 'school', 12),
+        _text(row, 'hospital', 12),
+        _text(row, 'park', 12),
+        _text(row, 'mart', 12),
+    ]
+
+
+def read_records(path, fmt):
+    if fmt == 'csv':
+        with open(path, newline='', encoding='utf-8') as f:
+            yield from csv.DictReader(f)
+    else:
+        with open(path, encoding='utf-8') as f:
+            for line in f:
+                if line.strip():
+                    try:
+                        yield json.loads(line)
+                    except ValueError as e:
+                        yield e
+
+
+def load_chunk(conn, cur, source, chunk, done, totals):
+    db.copy_rows(cur, 'import_staging', STAGING_COLUMNS, chunk)
+    cur.execute(
+        "DELETE FROM import_staging s WHERE NOT EXISTS "
+        "(SELECT 1 FROM Agent a WHERE a.AgentID = s.agent_id) RETURNING line_no, agent_id"
+    )
+    missing = cur.fetchall()
+    for sql in LOAD_SQL:
+        cur.execute(sql)
+    loaded = len(chunk) - len(missing)
+    cur.execute(
+        "INSERT INTO import_checkpoints(Source, RowsDone, RowsLoaded, RowsRejected) "
+        "VALUES (%s, %s, %s, %s) ON CONFLICT (Source) DO UPDATE SET "
+        "RowsDone = EXCLUDED.RowsDone, RowsLoaded = import_checkpoints.RowsLoaded + %s, "
+        "RowsRejected = EXCLUDED.RowsRejected, UpdatedAt = now()",
+        (source, done, loaded, totals['rejected'] + len(missing), loaded)
+    )
+    cache.commit(conn, cur, cache.flush_event())
+    return loaded, missing
+
+
+def run_import(args):
+    fmt = args.format or ('csv' if args.path.lower().endswith('.csv') else 'jsonl')
+    source = args.job or os.path.abspath(args.path)
+    conn = db.connect()
+    rejects = open(args.rejects, 'a', encoding='utf-8') if args.rejects else None
+    totals = {'read': 0, 'loaded': 0, 'rejected': 0}
+    started = time.monotonic()
+
+    def reject(line_no, reason, record):
+        totals['rejected'] += 1
+        if rejects:
+            rejects.write(json.dumps({'line': line_no, 'reason': reason, 'row': record},
+                                     default=str) + '\n')
+
+    try:
+        with conn.cursor() as cur:
+            skip = 0
+            if args.resume:
+                cur.execute("SELECT RowsDone, RowsRejected FROM import_checkpoints WHERE Source = %s",
+                            (source,))
+                row = cur.fetchone()
+                if row:
+                    skip, totals['rejected'] = row
+            cur.execute(STAGING_SQL)
+            conn.commit()
+
+            chunk = []
+            for line_no, record in enumerate(read_records(args.path, fmt), 1):
+                if line_no <= skip:
+                    continue
+                totals['read'] += 1
+                if isinstance(record, Exception):
+                    reject(line_no, f'invalid JSON: {record}', None)
+                else:
+                    try:
+                        chunk.append([line_no] + validate(record, args.agent))
+                    except RowError as e:
+                        reject(line_no, str(e), record)
+                if len(chunk) >= args.chunk_size:
+                    _flush(conn, cur, source, chunk, line_no, totals, reject, started)
+                    chunk = []
+            # The last chunk also records rows rejected after the final flush.
+            _flush(conn, cur, source, chunk, skip + totals['read'], totals, reject, started)
+    finally:
+        conn.close()
+        if rejects:
+            rejects.close()
+
+    elapsed = time.monotonic() - started
+    report = dict(totals, source=source, resumed_from=skip, elapsed_s=round(elapsed, 2),
+                  rows_per_s=round(totals['loaded'] / elapsed, 1) if elapsed else None)
+    print(json.dumps(report))
+    return 0
+
+
+def _flush(conn, cur, source, chunk, done, totals, reject, started):
+    loaded, missing = load_chunk(conn, cur, source, chunk, done, totals)
+    for line_no, agent_id in missing:
+        reject(line_no, f'unknown agent {agent_id!r}', None)
+    totals['loaded'] += loaded
+    elapsed = time.monotonic() - started
+    print(f"{done:>12} rows read  {totals['loaded']:>12} loaded  {totals['rejected']:>8} rejected  "
+          f"{totals['loaded'] / elapsed if elapsed else 0:10.0f} rows/s", file=sys.stderr)
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description='Bulk-import listings from CSV or JSONL.')
+    ap.add_argument('path')
+    ap.add_argument('--format', choices=['csv', 'jsonl'])
+    ap.add_argument('--agent', help='AgentID for rows without an agent_id column')
+    ap.add_argument('--chunk-size', type=int, default=20000)
+    ap.add_argument('--resume', action='store_true', help='continue from the last checkpoint')
+    ap.add_argument('--job', help='checkpoint key (defaults to the absolute file path)')
+    ap.add_argument('--rejects', help='append rejected rows to this JSONL file')
+    return run_import(ap.parse_args(argv))
+
+
+if __name__ == '__main__':
+    sys.exit(main())
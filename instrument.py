@@ -0,0 +1,244 @@
+import os
+import re
+import time
+import threading
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import psycopg2.extensions
+
+
+NPLUS1_THRESHOLD = int(os.getenv('DB_NPLUS1_THRESHOLD', '5'))
+DEBUG_PANEL      = os.getenv('DB_DEBUG_PANEL', '') not in ('', '0')
+METRICS_FILE     = os.getenv('DB_METRICS_FILE', '')
+METRICS_HOST     = os.getenv('DB_METRICS_HOST', '127.0.0.1')
+METRICS_PORT     = int(os.getenv('DB_METRICS_PORT', '0'))
+METRICS_INTERVAL = float(os.getenv('DB_METRICS_INTERVAL', '15'))
+
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+_STRING  = re.compile(r"'(?:[^']|'')*'")
+_NUMBER  = re.compile(r"\b\d+(?:\.\d+)?\b")
+_INLIST  = re.compile(r"\(\s*(?:\?\s*,\s*)+\?\s*\)")
+_SPACE   = re.compile(r"\s+")
+
+
+def fingerprint(sql):
+    # Literals and placeholders collapse to '?', so the same statement with
+    # different parameters (or dynamic IN lists) groups together.
+    if isinstance(sql, bytes):
+        sql = sql.decode('utf-8', 'replace')
+    sql = _STRING.sub('?', sql)
+    sql = sql.replace('%s', '?')
+    sql = _NUMBER.sub('?', sql)
+    sql = _INLIST.sub('(?...)', sql)
+    return _SPACE.sub(' ', sql).strip()
+
+
+class RerunStats:
+
+    def __init__(self, page):
+        self.page       = page
+        self.started    = time.perf_counter()
+        self.elapsed    = None
+        self.statements = {}    # fingerprint -> [calls, seconds, rows]
+
+    def record(self, fp, seconds, rows):
+        s = self.statements.get(fp)
+        if s is None:
+            s = self.statements[fp] = [0, 0.0, 0]
+        s[0] += 1
+        s[1] += seconds
+        s[2] += max(rows, 0)
+
+    def nplus1(self, threshold=None):
+        k = NPLUS1_THRESHOLD if threshold is None else threshold
+        return {fp: s[0] for fp, s in self.statements.items() if s[0] > k}
+
+    def rows(self):
+        flagged = self.nplus1()
+        return sorted(
+            ({'statement': fp, 'calls': s[0], 'total_ms': round(s[1] * 1000, 2),
+              'rows': s[2], 'n_plus_1': fp in flagged}
+             for fp, s in self.statements.items()),
+            key=lambda r: -r['total_ms']
+        )
+
+    @property
+    def total_queries(self):
+        return sum(s[0] for s in self.statements.values())
+
+    @property
+    def total_seconds(self):
+        return sum(s[1] for s in self.statements.values())
+
+
+class Registry:
+    # Process-wide aggregates, exported as Prometheus histograms.
+
+    def __init__(self):
+        self._lock      = threading.Lock()
+        self.histograms = {}    # (page, fingerprint) -> [bucket counts..., count, sum]
+        self.rows       = {}    # (page, fingerprint) -> rows returned/affected
+        self.reruns     = {}    # page -> [count, seconds, queries]
+        self.nplus1     = {}    # (page, fingerprint) -> reruns flagged
+
+    def observe(self, page, fp, seconds, rows):
+        key = (page, fp)
+        with self._lock:
+            h = self.histograms.get(key)
+            if h is None:
+                h = self.histograms[key] = [0] * len(BUCKETS) + [0, 0.0]
+            for i, bound in enumerate(BUCKETS):
+                if seconds <= bound:
+                    h[i] += 1
+            h[-2] += 1
+            h[-1] += seconds
+            self.rows[key] = self.rows.get(key, 0) + max(rows, 0)
+
+    def finish(self, stats):
+        with self._lock:
+            r = self.reruns.setdefault(stats.page, [0, 0.0, 0])
+            r[0] += 1
+            r[1] += stats.elapsed
+            r[2] += stats.total_queries
+            for fp in stats.nplus1():
+                key = (stats.page, fp)
+                self.nplus1[key] = self.nplus1.get(key, 0) + 1
+
+    def render(self, extra_gauges=None):
+        out = []
+
+        def esc(v):
+            return str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', ' ')
+
+        with self._lock:
+            out.append('# HELP dbo_query_seconds Statement latency by page and fingerprint.')
+            out.append('# TYPE dbo_query_seconds histogram')
+            for (page, fp), h in sorted(self.histograms.items()):
+                labels = f'page="{esc(page)}",statement="{esc(fp)}"'
+                for bound, n in zip(BUCKETS, h):
+                    out.append(f'dbo_query_seconds_bucket{{{labels},le="{bound}"}} {n}')
+                out.append(f'dbo_query_seconds_bucket{{{labels},le="+Inf"}} {h[-2]}')
+                out.append(f'dbo_query_seconds_count{{{labels}}} {h[-2]}')
+                out.append(f'dbo_query_seconds_sum{{{labels}}} {h[-1]:.6f}')
+            out.append('# TYPE dbo_query_rows_total counter')
+            for (page, fp), n in sorted(self.rows.items()):
+                out.append(f'dbo_query_rows_total{{page="{esc(page)}",statement="{esc(fp)}"}} {n}')
+            for i, name in enumerate(('rerun_total', 'rerun_seconds_total', 'rerun_queries_total')):
+                out.append(f'# TYPE dbo_{name} counter')
+                for page, values in sorted(self.reruns.items()):
+                    out.append(f'dbo_{name}{{page="{esc(page)}"}} {values[i]:g}')
+            out.append('# TYPE dbo_nplus1_reruns_total counter')
+            for (page, fp), n in sorted(self.nplus1.items()):
+                out.append(f'dbo_nplus1_reruns_total{{page="{esc(page)}",statement="{esc(fp)}"}} {n}')
+        for name, values in (extra_gauges or {}).items():
+            out.append(f'# TYPE dbo_{name} gauge')
+            for key, value in sorted(values.items()):
+                out.append(f'dbo_{name}{{key="{esc(key)}"}} {value}')
+        return '\n'.join(out) + '\n'
+
+
+registry = Registry()
+_current = threading.local()
+_gauges  = {}
+
+
+def register_gauges(name, fn):
+    # fn() -> {key: number}; sampled whenever metrics are rendered.
+    _gauges[name] = fn
+
+
+def render_metrics():
+    extra = {}
+    for name, fn in _gauges.items():
+        try:
+            extra[name] = {k: v for k, v in fn().items() if isinstance(v, (int, float))}
+        except Exception:
+            continue
+    return registry.render(extra)
+
+
+class InstrumentedCursor(psycopg2.extensions.cursor):
+
+    def _timed(self, call, query, *args):
+        t0 = time.perf_counter()
+        try:
+            return call(query, *args)
+        finally:
+            seconds = time.perf_counter() - t0
+            fp = fingerprint(query)
+            stats = getattr(_current, 'stats', None)
+            page = stats.page if stats else '-'
+            if stats:
+                stats.record(fp, seconds, self.rowcount)
+            registry.observe(page, fp, seconds, self.rowcount)
+
+    def execute(self, query, vars=None):
+        return self._timed(super().execute, query, vars)
+
+    def executemany(self, query, vars_list):
+        return self._timed(super().executemany, query, vars_list)
+
+
+_last_flush = 0.0
+_flush_lock = threading.Lock()
+
+
+def _flush_file():
+    global _last_flush
+    now = time.monotonic()
+    if not METRICS_FILE or now - _last_flush < METRICS_INTERVAL:
+        return
+    with _flush_lock:
+        if now - _last_flush < METRICS_INTERVAL:
+            return
+        _last_flush = now
+        tmp = METRICS_FILE + '.tmp'
+        with open(tmp, 'w', encoding='utf-8') as f:
+            f.write(render_metrics())
+        os.replace(tmp, METRICS_FILE)
+
+
+@contextmanager
+def rerun(page):
+    stats = RerunStats(page)
+    _current.stats = stats
+    try:
+        yield stats
+    finally:
+        stats.elapsed = time.perf_counter() - stats.started
+        _current.stats = None
+        registry.finish(stats)
+        _flush_file()
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+
+    def do_GET(self):
+        body = render_metrics().encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+_server = None
+_server_lock = threading.Lock()
+
+
+def start_metrics_server():
+    global _server
+    if not METRICS_PORT or _server is not None:
+        return
+    with _server_lock:
+        if _server is None:
+            # Loopback by default; set DB_METRICS_HOST (e.g. 0.0.0.0) for a
+            # scraper on another host.
+            _server = ThreadingHTTPServer((METRICS_HOST, METRICS_PORT), _MetricsHandler)
+            threading.Thread(target=_server.serve_forever, name='metrics-http',
+                             daemon=True).start()
@@ -1,24 +1,48 @@
-import os
-import uuid
+import time
+
 import streamlit as st
+import pandas as pd
 import psycopg2
 from datetime import date, timedelta
 
-
-DB_HOST     = os.getenv('DB_HOST', 'localhost')
-DB_PORT     = os.getenv('DB_PORT', '5432')
-DB_NAME     = os.getenv('DB_NAME', 'DBOSchema')
-DB_USER     = os.getenv('DB_USER', 'postgres')
-DB_PASSWORD = os.getenv('DB_PASSWORD', 'tgms1402')
-
-def get_connection():
-    return psycopg2.connect(
-        host=DB_HOST,
-        port=DB_PORT,
-        dbname=DB_NAME,
-        user=DB_USER,
-        password=DB_PASSWORD
-    )
+import db
+import cache
+import queries
+import instrument
+import recommend
+import feed
+import analytics
+
+
+def read_connection():
+    # Pages that only read use a replica, except for db.READ_YOUR_WRITES
+    # seconds after this session last wrote, so it always sees its writes.
+    wrote_at = st.session_state.get('wrote_at')
+    recent = wrote_at is not None and time.monotonic() - wrote_at < db.READ_YOUR_WRITES
+    return db.connection(replica=not recent)
+
+def commit(conn, cur, *events):
+    # Every page write commits through here (on a primary connection).
+    cache.commit(conn, cur, *events)
+    st.session_state.wrote_at = time.monotonic()
+
+IDENTITY_TTL = 60
+
+def identity(cur):
+    # The logged-in user (queries.load_identity), resolved at login and
+    # kept in session_state. Reloaded when the email changes, once this
+    # session has written since (reward points, profile edits), or after
+    # IDENTITY_TTL seconds. None if there is no such user.
+    me = st.session_state.get('identity')
+    wrote_at = st.session_state.get('wrote_at')
+    if (me is None or me['email'] != st.session_state.get('email')
+            or (wrote_at is not None and wrote_at > me['loaded_at'])
+            or time.monotonic() - me['loaded_at'] > IDENTITY_TTL):
+        me = queries.load_identity(cur, st.session_state.get('email'))
+        if me is not None:
+            me['loaded_at'] = time.monotonic()
+        st.session_state.identity = me
+    return me
 
 
 def signup_page():
@@ -48,42 +72,37 @@ def signup_page():
                 st.error("Please enter your Agency and Job Title.")
                 return
 
-            conn = get_connection()
-            cur  = conn.cursor()
-
-            cur.execute(
-                """
-                INSERT INTO Users(Name_, address, Email, UserType)
-                VALUES (%s, %s, %s, %s)
-                ON CONFLICT (Email) DO NOTHING
-                """,
-                (name, address, email, role)
-            )
-
-            new_id = uuid.uuid4().hex[:8]
-
-            if role == 'Renter':
+            with db.connection() as conn, conn.cursor() as cur:
                 cur.execute(
                     """
-                    INSERT INTO Renter(RenterID, Email)
-                    VALUES (%s, %s)
-                    ON CONFLICT (RenterID) DO NOTHING
-                    """,
-                    (new_id, email)
-                )
-            else:
-                cur.execute(
-                    """
-                    INSERT INTO Agent(AgentID, JobTitle, Email, AgencyName)
+                    INSERT INTO Users(Name_, address, Email, UserType)
                     VALUES (%s, %s, %s, %s)
-                    ON CONFLICT (AgentID) DO NOTHING
+                    ON CONFLICT (Email) DO NOTHING
                     """,
-                    (new_id, job_title, email, agency)
+                    (name, address, email, role)
                 )
 
-            conn.commit()
-            cur.close()
-            conn.close()
+                if role == 'Renter':
+                    cur.execute(
+                        """
+                        INSERT INTO Renter(Email)
+                        VALUES (%s)
+                        RETURNING RenterID
+                        """,
+                        (email,)
+                    )
+                else:
+                    cur.execute(
+                        """
+                        INSERT INTO Agent(JobTitle, Email, AgencyName)
+                        VALUES (%s, %s, %s)
+                        RETURNING AgentID
+                        """,
+                        (job_title, email, agency)
+                    )
+                new_id = cur.fetchone()[0]
+
+                commit(conn, cur)
 
             st.success(f'Signed up! Your {role} ID is {new_id}')
             st.session_state.page = 'login'
@@ -103,15 +122,17 @@ def login_page():
     col1, col2 = st.columns(2)
     with col1:
         if st.button('Login'):
-            conn = get_connection(); cur = conn.cursor()
-            cur.execute("SELECT UserType FROM Users WHERE Email = %s", (email,))
-            row = cur.fetchone(); cur.close(); conn.close()
-            if row:
-                st.session_state.email = email; st.session_state.role = row[0]
-                st.success(f"Logged in as {row[0]}")
-                st.session_state.page = ('add' if row[0] == 'Agent' else 'view')
+            st.session_state.email = email
+            st.session_state.pop('history_keys', None)
+            with read_connection() as conn, conn.cursor() as cur:
+                me = identity(cur)
+            if me:
+                st.session_state.role = me['role']
+                st.success(f"Logged in as {me['role']}")
+                st.session_state.page = ('add' if me['role'] == 'Agent' else 'view')
                 st.rerun()
             else:
+                del st.session_state.email
                 st.error('No such user')
     with col2:
         if st.button('Go to Sign Up'):
@@ -125,247 +146,262 @@ def profile_page():
         st.error("No user logged in.")
         return
 
-    conn = get_connection()
-    cur  = conn.cursor()
-
-    cur.execute(
-        "SELECT Name_, address, UserType FROM Users WHERE Email = %s",
-        (current_email,)
-    )
-    row = cur.fetchone() or ('', '', '')
-    name, addr, role = row
-
-    st.subheader('Account Details')
-    new_email = st.text_input("Email",   value=current_email)
-    new_addr  = st.text_input("Address", value=addr)
-
-    if st.button('Save Changes'):
-        if not new_email.strip() or not new_addr.strip():
-            st.error('Email and Address cannot be empty')
-        else:
-            if new_email != current_email:
-                if role == 'Renter':
-                    cur.execute(
-                        "UPDATE Renter SET Email = %s WHERE Email = %s",
-                        (new_email, current_email)
-                    )
-                else:
-                    cur.execute(
-                        "UPDATE Agent SET Email = %s WHERE Email = %s",
-                        (new_email, current_email)
-                    )
-                st.session_state.email = new_email
-
-            cur.execute(
-                "UPDATE Users SET Email = %s, address = %s WHERE Email = %s",
-                (new_email, new_addr, current_email)
-            )
-            conn.commit()
-            st.success("Profile updated!")
-            st.rerun()
-
-    st.write(f"**Name:** {name}")
-    st.write(f"**Role:** {role}")
-    if role == 'Renter':
-        cur.execute("SELECT RenterID FROM Renter WHERE Email = %s", (st.session_state['email'],))
-        renter = cur.fetchone()
-        if renter:
-            r_id = renter[0]
-            st.write(f"**Renter ID:** {r_id}")
-            cur.execute("SELECT Reward_Points FROM Rewards WHERE R_id = %s", (r_id,))
-            pts = cur.fetchone(); pts = pts[0] if pts else 0
-            st.write(f"**Reward Points:** {pts}")
-            st.subheader('Your Bookings')
-            cur.execute("""
-                SELECT
-                  b.BookID,
-                  b.PropId,
-                  p.PropType,
-                  b.StartDate,
-                  b.EndDate,
-                  b.Mode_of_pay,
-                  b.TotalCost
-                FROM Booking b
-                JOIN Property p ON b.PropId = p.PropId
-                WHERE b.RenterID = %s
-            """, (r_id,))
-            bookings = cur.fetchall()
-
-            for book_id, prop_id, prop_type, start, end, mode, cost in bookings:
-                st.write(
-                    f"• **{book_id}**: {prop_type} ({prop_id}), "
-                    f"{start}–{end}, {mode}, **${cost:.2f}**"
-                )
+    with read_connection() as conn, conn.cursor() as cur:
+        me = identity(cur)
+        if me is None:
+            st.error("User not found.")
+            return
+        name, addr, role = me['name'], me['address'], me['role']
 
-                with st.expander(f"View Receipt for {book_id}"):
-                    st.markdown("#### Receipt Details")
-                    st.write(f"**Booking ID:** {book_id}")
-                    st.write(f"**Property ID:** {prop_id}")
-                    st.write(f"**Property Type:** {prop_type}")
-                    st.write(f"**Period:** {start} → {end}")
-                    st.write(f"**Payment Mode:** {mode}")
-                    st.write(f"**Total Cost:** ${cost:.2f}")
-                    st.write("---")
-
-                    if st.button("Cancel Booking", key=f"cancel_{book_id}"):
-                        cur.execute("DELETE FROM Booking WHERE BookID = %s", (book_id,))
-                        cur.execute("SELECT PropType FROM Property WHERE PropId = %s", (prop_id,))
-                        ptype = cur.fetchone()[0]
-                        table, col = {
-                            'VacHome': ('VacHome', 'VacHomeId'),
-                            'Houses': ('Houses', 'HouseId'),
-                            'Apartments': ('Apartments', 'AptId'),
-                            'CommBuildings': ('CommBuildings', 'BuildId'),
-                        }[ptype]
-                        cur.execute(
-                            f"UPDATE {table} SET Availablity = TRUE WHERE {col} = %s",
-                            (prop_id,)
-                        )
-                        cur.execute(
-                            "SELECT RenterID FROM Renter WHERE Email = %s",
-                            (st.session_state['email'],)
-                        )
-                        r_id = cur.fetchone()[0]
-                        cur.execute(
-                            "UPDATE Rewards "
-                            "SET Reward_Points = GREATEST(Reward_Points - 100, 0) "
-                            "WHERE R_id = %s",
-                            (r_id,)
-                        )
-                        conn.commit()
-                        st.warning(
-                            f"Your booking **{book_id}** has been cancelled. "
-                            f"A refund of **${cost:.2f}** will be processed."
-                        )
-                        cur.close()
-                        conn.close()
-                        st.rerun()
-                        return
-    if role == 'Agent':
-        cur.execute(
-            "SELECT AgentID, AgencyName FROM Agent WHERE Email = %s",
-            (current_email,)
-        )
-        agent_row = cur.fetchone()
-        if not agent_row:
-            st.error("Agent record not found.")
-        else:
-            agent_id, agency_name = agent_row
-            st.write(f"**Agent ID:** {agent_id}")
-            st.write(f"**Agency:** {agency_name}")
-            st.subheader("Properties in Your Agency")
-
-            cur.execute("""
-                    SELECT PropId, PropType, Description, City, State_
-                    FROM Property
-                    WHERE AgentID IN (
-                        SELECT AgentID FROM Agent WHERE AgencyName = %s
-                    )
-                """, (agency_name,))
-            props = cur.fetchall()
+        st.subheader('Account Details')
+        new_email = st.text_input("Email",   value=current_email)
+        new_addr  = st.text_input("Address", value=addr)
 
-            if not props:
-                st.write("No listings found for your agency.")
+        if st.button('Save Changes'):
+            if not new_email.strip() or not new_addr.strip():
+                st.error('Email and Address cannot be empty')
             else:
-                type_map = {
-                    'VacHome': ('VacHome', 'VacHomeId'),
-                    'Houses': ('Houses', 'HouseId'),
-                    'Apartments': ('Apartments', 'AptId'),
-                    'CommBuildings': ('CommBuildings', 'BuildId'),
-                }
-                for pid, ptype, desc, city, state in props:
-                    table, col = type_map[ptype]
-                    cur.execute(
-                        f"SELECT Price, Availablity FROM {table} WHERE {col} = %s",
-                        (pid,)
+                with db.primary(conn) as wconn, wconn.cursor() as wcur:
+                    if new_email != current_email:
+                        if role == 'Renter':
+                            wcur.execute(
+                                "UPDATE Renter SET Email = %s WHERE Email = %s",
+                                (new_email, current_email)
+                            )
+                        else:
+                            wcur.execute(
+                                "UPDATE Agent SET Email = %s WHERE Email = %s",
+                                (new_email, current_email)
+                            )
+                        st.session_state.email = new_email
+
+                    wcur.execute(
+                        "UPDATE Users SET Email = %s, address = %s WHERE Email = %s",
+                        (new_email, new_addr, current_email)
                     )
-                    price, available = cur.fetchone()
+                    commit(wconn, wcur)
+                st.session_state.pop('identity', None)
+                st.success("Profile updated!")
+                st.rerun()
 
-                    st.markdown(f"**{pid}**: {ptype} in {city}, {state}")
-                    st.write(f"- Description: {desc}")
-                    st.write(f"- Price: ${price:.2f}")
-                    st.write(f"- Available: {'✅' if available else '❌'}")
-                    st.write("---")
+        st.write(f"**Name:** {name}")
+        st.write(f"**Role:** {role}")
+        if role == 'Renter':
+            if me['renter_id']:
+                r_id = me['renter_id']
+                st.write(f"**Renter ID:** {r_id}")
+                st.write(f"**Reward Points:** {me['rewards']}")
+                st.subheader('Your Bookings')
+                bookings = queries.renter_bookings(cur, r_id)
+                if not bookings:
+                    st.write("No current or upcoming stays.")
+
+                for booking in bookings:
+                    book_id, prop_id, _, _, _, _, cost, _ = booking
+                    with booking_entry(booking):
+                        if st.button("Cancel Booking", key=f"cancel_{book_id}"):
+                            with db.primary(conn) as wconn, wconn.cursor() as wcur:
+                                if not queries.cancel_booking(wcur, book_id, r_id):
+                                    st.error(f"Booking {book_id} was already cancelled.")
+                                    return
+                                commit(wconn, wcur, cache.booking_event(prop_id))
+                            st.warning(
+                                f"Your booking **{book_id}** has been cancelled. "
+                                f"A refund of **${cost:.2f}** will be processed."
+                            )
+                            st.rerun()
+                            return
+
+                if st.toggle('Show past stays', key='show_history'):
+                    booking_history(conn, r_id)
+        if role == 'Agent':
+            if not me['agent_id']:
+                st.error("Agent record not found.")
+            else:
+                agent_id, agency_name = me['agent_id'], me['agency']
+                st.write(f"**Agent ID:** {agent_id}")
+                st.write(f"**Agency:** {agency_name}")
+                st.subheader("Properties in Your Agency")
+
+                props = cache.agency_listings(cur, agency_name)
+
+                if not props:
+                    st.write("No listings found for your agency.")
+                elif st.session_state.get('listing_layout') == 'Table':
+                    st.dataframe(listing_frame(props, LISTING_COLUMNS[:7]), hide_index=True,
+                                 column_config=TABLE_CONFIG, use_container_width=True)
+                else:
+                    for pid, ptype, desc, city, state, price, available in props:
+                        st.markdown(f"**{pid}**: {ptype} in {city}, {state}")
+                        st.write(f"- Description: {desc}")
+                        st.write(f"- Price: ${price:.2f}")
+                        st.write(f"- Available: {'✅' if available else '❌'}")
+                        st.write("---")
 
-    cur.close()
-    conn.close()
     if st.button('Back'):
         st.session_state.page = 'view'
         st.rerun()
 
 
-def view_page():
-    st.header('Available Properties')
-
-
-
-    city_search  = st.text_input('Search by City')
-    state_search = st.text_input('Search by State')
-
-    conn = get_connection()
-    cur  = conn.cursor()
-
-    agent_id = None
-    if st.session_state.role == 'Agent':
-        cur.execute("SELECT AgentID FROM Agent WHERE Email = %s",
-                    (st.session_state.email,))
-        row = cur.fetchone()
-        agent_id = row[0] if row else None
-
-
-    base_q = "SELECT PropId, PropType, Description, City, State_ FROM Property"
-    filters, params = [], []
-
-    if city_search.strip():
-        filters.append("City ILIKE %s")
-        params.append(f"%{city_search.strip()}%")
-    if state_search.strip():
-        filters.append("State_ ILIKE %s")
-        params.append(f"%{state_search.strip()}%")
+def booking_entry(booking):
+    # One booking line plus its receipt; returns the expander so callers
+    # can add actions inside it.
+    book_id, prop_id, prop_type, start, end, mode, cost, receipt = booking
+    st.write(
+        f"• **{book_id}**: {prop_type} ({prop_id}), "
+        f"{start}–{end}, {mode}, **${cost:.2f}**"
+    )
+    expander = st.expander(f"View Receipt for {book_id}")
+    with expander:
+        st.markdown("#### Receipt Details")
+        st.write(f"**Booking ID:** {book_id}")
+        st.write(f"**Property ID:** {prop_id}")
+        st.write(f"**Property Type:** {prop_type}")
+        st.write(f"**Period:** {start} → {end}")
+        st.write(f"**Payment Mode:** {mode}")
+        st.write(f"**Total Cost:** ${cost:.2f}")
+        if receipt is None:
+            st.caption("Your receipt is being prepared.")
+        elif receipt.get('card_last4'):
+            st.write(f"**Card:** •••• {receipt['card_last4']}")
+        st.write("---")
+    return expander
+
+
+HISTORY_PAGE = 10
+
+def booking_history(conn, renter_id):
+    # Keyset-paged past stays; history_keys is the stack of page keys
+    # walked so far, the last one being the page shown.
+    keys = st.session_state.setdefault('history_keys', [None])
+    rows, has_more = queries.booking_history(conn, renter_id, keys[-1], HISTORY_PAGE)
+    st.subheader('Past Stays')
+    if not rows:
+        st.write("No past stays.")
+    for booking in rows:
+        booking_entry(booking)
+    newer, older = st.columns(2)
+    if newer.button('Newer', disabled=len(keys) == 1, key='history_newer'):
+        keys.pop()
+        st.rerun()
+    if older.button('Older', disabled=not has_more, key='history_older'):
+        keys.append((rows[-1][3], rows[-1][0]))
+        st.rerun()
 
-    if filters:
-        sql = base_q + " WHERE " + " AND ".join(filters)
-    else:
-        sql = base_q
 
-    cur.execute(sql, params)
-    props = cur.fetchall()
+def recommendations(cur, me):
+    if not me['renter_id']:
+        return
+    picks = recommend.for_renter(cur, me['renter_id'], me['pref_location'], me['budget'], k=5)
+    if not picks:
+        return
+    listings = {r[0]: r for r in queries.fetch_listings_by_id(cur, [pid for pid, _ in picks])}
+    st.subheader('Recommended for you')
+    for pid, _ in picks:
+        if pid not in listings:
+            continue
+        _, ptype, desc, city, state, price, available, _, _ = listings[pid]
+        st.write(f"**{pid}**: {ptype} in {city}, {state} — ${price:.2f} — {desc}")
+        if available and st.button(f"Buy {pid}", key=f"rec_buy_{pid}"):
+            st.session_state.selected_prop = pid
+            st.session_state.page = 'buy'
+            st.rerun()
+    st.divider()
 
-    if not props:
-        st.warning("No properties match that location.")
 
-    type_map = {
-        'VacHome':      ('VacHome',      'VacHomeId'),
-        'Houses':       ('Houses',       'HouseId'),
-        'Apartments':   ('Apartments',   'AptId'),
-        'CommBuildings':('CommBuildings','BuildId'),
-    }
+FACET_TITLES = [('type', 'Type'), ('price', 'Price'), ('rooms', 'Rooms'),
+                ('sqft', 'Sq ft'), ('crime', 'Crime rate')]
 
-    for pid, ptype, desc, city, state in props:
-        table, col = type_map[ptype]
-
-
-        cur.execute(
-            f"SELECT Price, Availablity FROM {table} WHERE {col} = %s",
-            (pid,)
-        )
-        price, available = cur.fetchone()
-
-        cur.execute(
-            "SELECT u.Name_, a.AgentID "
-            "FROM Property p "
-            " JOIN Agent a ON p.AgentID = a.AgentID "
-            " JOIN Users u ON a.Email = u.Email "
-            "WHERE p.PropId = %s",
-            (pid,)
-        )
-        owner = cur.fetchone()
-        if owner:
-            added_by_name, added_by_id = owner
-        else:
+def facet_summary(facets):
+    if facets['capped']:
+        # Counted over the first queries.FACET_LIMIT matches only.
+        st.caption(f"**{queries.FACET_LIMIT:,}+** matching properties; "
+                   "narrow the search to see how they break down")
+        return
+    st.caption(f"**{facets['total']}** matching properties, {facets['available']} available")
+    for name, title in FACET_TITLES:
+        if facets[name]:
+            st.caption(f"{title}: " + " · ".join(f"{k} ({n})" for k, n in facets[name].items()))
+    st.caption("Nearby: " + " · ".join(f"{k} ({n})" for k, n in facets['amenities'].items()))
+
+
+LAYOUTS    = ['Cards', 'Table']
+PAGE_SIZES = {'Cards': [10, 20, 50, 100], 'Table': [100, 1000, 5000, 10000]}
+LISTING_COLUMNS = ['ID', 'Type', 'Description', 'City', 'State', 'Price', 'Available',
+                   'Added by', 'Agent ID']
+TABLE_CONFIG = {
+    'Price':     st.column_config.NumberColumn(format='$%.2f'),
+    'Available': st.column_config.CheckboxColumn(),
+}
+
+def listing_frame(rows, columns):
+    # Built column-wise from the query rows; display formatting is left to
+    # column_config so no Python code runs per row.
+    df = pd.DataFrame.from_records(rows, columns=columns)
+    if 'Price' in df:
+        df['Price'] = df['Price'].astype(float)
+    return df
+
+def listing_table(props, key):
+    # One dataframe element for the whole page; returns the selected rows.
+    event = st.dataframe(listing_frame(props, LISTING_COLUMNS), key=key, hide_index=True,
+                         column_config=TABLE_CONFIG, on_select='rerun',
+                         selection_mode='multi-row', use_container_width=True)
+    return [props[i] for i in event.selection.rows]
+
+def table_actions(conn, selected, agent_id):
+    # Buy/Edit/Delete for the rows selected in listing_table, writing
+    # through the page's connection conn. Returns True when the page has
+    # been left or must be redrawn.
+    if not selected:
+        st.caption("Select rows to buy, edit or delete.")
+        return False
+    single = selected[0] if len(selected) == 1 else None
+    if st.session_state.role == 'Renter':
+        if st.button('Buy selected', disabled=not (single and single[6])):
+            st.session_state.selected_prop = single[0]
+            st.session_state.page = 'buy'
+            st.rerun()
+            return True
+        return False
+
+    own = [row for row in selected if row[8] is not None and row[8] == agent_id]
+    if len(own) < len(selected):
+        st.caption(f"{len(selected) - len(own)} selected listing(s) belong to other agents.")
+    edit_col, del_col = st.columns(2)
+    with edit_col:
+        if st.button('Edit selected', disabled=not (single and own)):
+            st.session_state.edit_prop = single[0]
+            st.session_state.page = 'edit'
+            st.rerun()
+            return True
+    with del_col:
+        if st.button(f'Delete {len(own)} selected', disabled=not own):
+            by_type = {}
+            for row in own:
+                by_type.setdefault(row[1], []).append(row[0])
+            try:
+                with db.primary(conn) as wconn, wconn.cursor() as cur:
+                    queries.bulk_delete(cur, agent_id, by_type)
+                    commit(wconn, cur, cache.batch_event([row[0] for row in own],
+                                                         [(row[3], row[4]) for row in own]))
+                st.session_state.pop('listing_view', None)
+            except psycopg2.IntegrityError:
+                conn.rollback()
+                st.error("Nothing was deleted: some of the selected listings have bookings.")
+                return True
+            st.rerun()
+            return True
+    return False
+
+def listing_cards(conn, props, agent_id):
+    # One block of elements per listing, writing through the page's
+    # connection conn. Returns True when the page has been left or must be
+    # redrawn.
+    for pid, ptype, desc, city, state, price, available, added_by_name, added_by_id in props:
+        if added_by_name is None:
             added_by_name, added_by_id = "Unknown", None
 
-
         st.subheader(f"{pid}: {ptype} in {city}, {state}")
         st.write(f"**Description:** {desc}")
         st.write(f"**Price:** ${price:.2f}")
@@ -379,7 +415,7 @@ def view_page():
                 st.session_state.selected_prop = pid
                 st.session_state.page = 'buy'
                 st.rerun()
-                return
+                return True
 
         if st.session_state.role == 'Agent' and added_by_id == agent_id:
             edit_col, del_col = st.columns(2)
@@ -388,38 +424,178 @@ def view_page():
                     st.session_state.edit_prop = pid
                     st.session_state.page = 'edit'
                     st.rerun()
-                    return
+                    return True
             with del_col:
                 if st.button("Delete", key=f"del_{pid}"):
-                    cur.execute(f"DELETE FROM {table} WHERE {col} = %s", (pid,))
-                    cur.execute("DELETE FROM Neighbourhood WHERE PropId = %s", (pid,))
-                    cur.execute("DELETE FROM Property WHERE PropId = %s",   (pid,))
-                    conn.commit()
+                    with db.primary(conn) as wconn, wconn.cursor() as cur:
+                        try:
+                            queries.delete_listing(cur, pid, ptype)
+                            commit(wconn, cur, cache.change_event(pid, locations=[(city, state)]))
+                        except psycopg2.IntegrityError:
+                            wconn.rollback()
+                            st.error(f"{pid} was not deleted: it has bookings.")
+                            return True
+                    st.session_state.pop('listing_view', None)
                     st.success("Property deleted.")
                     st.rerun()
-                    return
+                    return True
+    return False
+
+
+def live_view(cur, search, page_size):
+    # The page this session last read, patched from the change feed on
+    # later reruns instead of searching again; a new search or page, a feed
+    # resync, or the cache TTL passing reads it afresh.
+    key = (st.session_state.listing_search, st.session_state.listing_after,
+           st.session_state.listing_before)
+    view = st.session_state.get('listing_view')
+    if view is None or view.key != key or view.stale():
+        view = feed.View(key, *cache.search_page(
+            cur, search,
+            after=st.session_state.listing_after,
+            before=st.session_state.listing_before,
+            limit=page_size
+        ))
+        st.session_state.listing_view = view
+    else:
+        view.refresh(cur.connection)
+    return view
+
+@st.fragment(run_every=feed.POLL_INTERVAL)
+def listing_feed_watch():
+    # Polls this session's view without touching the database and reruns
+    # the page only once a listing on it has changed.
+    view = st.session_state.get('listing_view')
+    if view is not None and view.pending():
+        st.rerun()
 
 
-    if st.session_state.role == 'Agent' and st.button('Add Property'):
-        st.session_state.page = 'add'
-        st.rerun()
-        return
+def view_page():
+    st.header('Available Properties')
+
 
 
-    c1, c2 = st.columns(2)
-    with c1:
-        if st.button('Profile'):
-            st.session_state.page = 'profile'
+    text_search  = st.text_input('Search descriptions and amenities',
+                                 placeholder='e.g. near park 3 bedroom')
+    city_search  = st.text_input('Search by City')
+    state_search = st.text_input('Search by State')
+    with st.expander('Filters'):
+        f1, f2 = st.columns(2)
+        with f1:
+            types     = st.multiselect('Type', list(queries.TYPE_MAP))
+            price_min = st.number_input('Min price', min_value=0.0, step=500.0)
+            price_max = st.number_input('Max price (0 = any)', min_value=0.0, step=500.0)
+            rooms_min = st.number_input('Min rooms', min_value=0, max_value=99)
+        with f2:
+            sqft_min  = st.number_input('Min sq ft', min_value=0.0, step=100.0)
+            sqft_max  = st.number_input('Max sq ft (0 = any)', min_value=0.0, step=100.0)
+            max_crime = st.slider('Max crime rate', 0.0, 99.99, 99.99)
+            avail     = st.radio('Availability', ['Any', 'Available', 'Unavailable'], horizontal=True)
+        amenities = st.multiselect('Must have nearby', list(queries.AMENITY_BITS))
+        free_for  = st.checkbox('Only listings free for my dates')
+        if free_for:
+            d1, d2 = st.columns(2)
+            with d1:
+                free_from = st.date_input('Check-in', value=date.today(), min_value=date.today())
+            with d2:
+                free_to = st.date_input('Check-out', value=date.today() + timedelta(days=30),
+                                        min_value=date.today() + timedelta(days=1))
+    layout       = st.radio('Layout', LAYOUTS, horizontal=True,
+                            index=LAYOUTS.index(st.session_state.get('listing_layout', 'Cards')))
+    st.session_state.listing_layout = layout
+    page_size    = st.selectbox('Per page', PAGE_SIZES[layout], index=1 if layout == 'Cards' else 0)
+
+    search = {
+        'text': text_search, 'city': city_search, 'state': state_search, 'types': types,
+        'price_min': price_min or None, 'price_max': price_max or None,
+        'rooms_min': rooms_min or None, 'sqft_min': sqft_min or None,
+        'sqft_max': sqft_max or None, 'max_crime': max_crime if max_crime < 99.99 else None,
+        'available': None if avail == 'Any' else avail == 'Available',
+        'amenities': amenities,
+        'free_from': free_from if free_for else None,
+        'free_to':   free_to if free_for else None,
+    }
+
+    # Keyset cursors; any change to the search resets to the first page.
+    search_key = (cache.search_key(search), page_size)
+    if st.session_state.get('listing_search') != search_key:
+        st.session_state.listing_search = search_key
+        st.session_state.listing_after  = None
+        st.session_state.listing_before = None
+
+    with read_connection() as conn, conn.cursor() as cur:
+        me = identity(cur)
+        agent_id = me['agent_id'] if me else None
+
+        first_page = not (st.session_state.listing_after or st.session_state.listing_before)
+        if me and me['role'] == 'Renter' and first_page and not cache.search_key(search):
+            recommendations(cur, me)
+
+        view = live_view(cur, search, page_size)
+        props, has_prev, has_next, facets = view.rows, view.has_prev, view.has_next, view.facets
+        listing_feed_watch()
+
+        if not props and (st.session_state.listing_after or st.session_state.listing_before):
+            st.session_state.listing_after  = None
+            st.session_state.listing_before = None
             st.rerun()
             return
-    with c2:
-        if st.button('Logout'):
-            st.session_state.page = 'login'
+
+        if not props:
+            st.warning("No properties match that search.")
+        else:
+            if text_search.strip():
+                st.caption("Sorted by relevance")
+            facet_summary(facets)
+
+        if layout == 'Table':
+            if props and table_actions(conn, listing_table(props, 'listing_table'), agent_id):
+                return
+        elif listing_cards(conn, props, agent_id):
+            return
+
+        if props:
+            prev_col, next_col = st.columns(2)
+            with prev_col:
+                if has_prev and st.button('← Previous'):
+                    st.session_state.listing_after  = None
+                    st.session_state.listing_before = props[0][0]
+                    st.rerun()
+                    return
+            with next_col:
+                if has_next and st.button('Next →'):
+                    st.session_state.listing_after  = props[-1][0]
+                    st.session_state.listing_before = None
+                    st.rerun()
+                    return
+
+        if st.session_state.role == 'Agent' and st.button('Add Property'):
+            st.session_state.page = 'add'
             st.rerun()
             return
 
-    cur.close()
-    conn.close()
+        if st.session_state.role == 'Agent' and st.button('Manage My Listings'):
+            st.session_state.page = 'bulk'
+            st.rerun()
+            return
+
+        if st.session_state.role == 'Agent' and st.button('Agency Analytics'):
+            st.session_state.page = 'analytics'
+            st.rerun()
+            return
+
+
+        c1, c2 = st.columns(2)
+        with c1:
+            if st.button('Profile'):
+                st.session_state.page = 'profile'
+                st.rerun()
+                return
+        with c2:
+            if st.button('Logout'):
+                st.session_state.page = 'login'
+                st.rerun()
+                return
 
 
 def edit_page():
@@ -428,126 +604,101 @@ def edit_page():
         st.error("No property selected to edit.")
         return
 
-    conn = get_connection()
-    cur = conn.cursor()
-
-    cur.execute(
-        "SELECT PropType, Description, City, State_ FROM Property WHERE PropId = %s",
-        (pid,)
-    )
-    ptype, desc, city, state = cur.fetchone()
-
-    type_map = {
-        'VacHome':      ('VacHome',      'VacHomeId'),
-        'Houses':       ('Houses',       'HouseId'),
-        'Apartments':   ('Apartments',   'AptId'),
-        'CommBuildings':('CommBuildings','BuildId'),
-    }
-    table, col = type_map[ptype]
-    cur.execute(
-        f"SELECT * FROM {table} WHERE {col} = %s",
-        (pid,)
-    )
-
-    subtype_row = cur.fetchone()
-
-    cur.execute(
-      "SELECT CrimeRate, NearbySchool, Hospital, Park, mart "
-      "FROM Neighbourhood WHERE PropId = %s",
-      (pid,)
-    )
-    n_row = cur.fetchone()
-
-
-    st.header(f"Edit {ptype} {pid}")
-    new_desc  = st.text_input("Description", value=desc)
-    new_city  = st.text_input("City", value=city)
-    new_state = st.text_input("State", value=state)
-
-
-    if ptype in ('VacHome','Houses','Apartments'):
-        _, rooms, addr, sqft, price, avail, *rest = subtype_row
-        rooms = int(rooms)
-        sqft = float(sqft)
-        price = float(price)
-        new_rooms = st.number_input(
-            "No of Rooms",
-            min_value=1,
-            value=rooms
-        )
-        new_addr = st.text_input("Address", value=addr)
-        new_sqft = st.number_input(
-            "SqFootage",
-            min_value=0.0,
-            value=sqft,
-            format="%.2f"
-        )
-        new_price = st.number_input(
-            "Price",
-            min_value=0.0,
-            value=price,
-            format="%.2f"
-        )
-        new_avail = st.checkbox("Available", value=avail)
-        if ptype == 'Apartments':
-            building_type = rest[0]
-            new_btype = st.text_input("BuildingType", value=building_type)
-    else:  #commBuildings
-        _, addr, btype, sqft, price, avail = subtype_row
-        new_addr  = st.text_input("Address", value=addr)
-        new_btype = st.text_input("BusinessType", value=btype)
-        new_sqft  = st.number_input("SqFootage", value=float(sqft))
-        new_price = st.number_input("Price", value=float(price))
-        new_avail = st.checkbox("Available", value=avail)
+    with db.connection() as conn, conn.cursor() as cur:
+        listing = queries.load_listing(cur, pid)
+        if listing is None:
+            st.error(f"Property {pid} no longer exists.")
+            return
+        ptype, desc, city, state, version, d, hood = listing
 
+        # The version the form was opened at; later reruns keep it so a save
+        # only goes through if nobody else saved in between.
+        if st.session_state.get('edit_version', (None, None))[0] != pid:
+            st.session_state.edit_version = (pid, version)
+        opened_at = st.session_state.edit_version[1]
 
-    crime, school, hosp, park, mart = n_row
-    new_crime  = st.number_input('Crime Rate (0–99.99)', min_value=0.0, max_value=99.99, value=float(crime), format="%.2f")
-    new_school = st.text_input('Nearby School', value=school)
-    new_hosp   = st.text_input('Nearest Hospital', value=hosp)
-    new_park   = st.text_input('Closest Park', value=park)
-    new_mart   = st.text_input('Nearby Mart', value=mart)
+        st.header(f"Edit {ptype} {pid}")
+        new_desc  = st.text_input("Description", value=desc)
+        new_city  = st.text_input("City", value=city)
+        new_state = st.text_input("State", value=state)
 
-    if st.button("Save Changes"):
-        cur.execute(
-            "UPDATE Property SET Description=%s, City=%s, State_=%s WHERE PropId=%s",
-            (new_desc, new_city, new_state, pid)
-        )
 
         if ptype in ('VacHome','Houses','Apartments'):
-            cols = "(NoOfRooms, address, SqFootage, Price, Availablity" + (", BuildingType)" if ptype=='Apartments' else ")")
-            vals = [new_rooms, new_addr, new_sqft, new_price, new_avail]
-            if ptype == 'Apartments': vals.append(new_btype)
-            cur.execute(
-                f"UPDATE {table} SET NoOfRooms=%s, address=%s, SqFootage=%s, Price=%s, Availablity=%s"
-                + (", BuildingType=%s" if ptype=='Apartments' else "")
-                + f" WHERE {col}=%s",
-                (*vals, pid)
+            new_rooms = st.number_input(
+                "No of Rooms",
+                min_value=1,
+                value=int(d['rooms'])
             )
-        else:
-            cur.execute(
-                f"UPDATE CommBuildings SET address=%s, BusinessType=%s, SqFootage=%s, Price=%s, Availablity=%s WHERE BuildId=%s",
-                (new_addr, new_btype, new_sqft, new_price, new_avail, pid)
+            new_addr = st.text_input("Address", value=d['address'])
+            new_sqft = st.number_input(
+                "SqFootage",
+                min_value=0.0,
+                value=float(d['sqft']),
+                format="%.2f"
             )
+            new_price = st.number_input(
+                "Price",
+                min_value=0.0,
+                value=float(d['price']),
+                format="%.2f"
+            )
+            new_avail = st.checkbox("Available", value=d['available'])
+            if ptype == 'Apartments':
+                new_btype = st.text_input("BuildingType", value=d['btype'])
+        else:  #commBuildings
+            new_addr  = st.text_input("Address", value=d['address'])
+            new_btype = st.text_input("BusinessType", value=d['btype'])
+            new_sqft  = st.number_input("SqFootage", value=float(d['sqft']))
+            new_price = st.number_input("Price", value=float(d['price']))
+            new_avail = st.checkbox("Available", value=d['available'])
+
+
+        crime, school, hosp, park, mart = hood
+        new_crime  = st.number_input('Crime Rate (0–99.99)', min_value=0.0, max_value=99.99, value=float(crime), format="%.2f")
+        new_school = st.text_input('Nearby School', value=school)
+        new_hosp   = st.text_input('Nearest Hospital', value=hosp)
+        new_park   = st.text_input('Closest Park', value=park)
+        new_mart   = st.text_input('Nearby Mart', value=mart)
+
+        if version != opened_at:
+            st.warning("Someone else has changed this listing since you opened it. "
+                       "Reload to edit the latest version; saving now will fail.")
+            if st.button("Reload"):
+                st.session_state.edit_version = (pid, version)
+                st.rerun()
+                return
 
-        cur.execute(
-            "UPDATE Neighbourhood SET CrimeRate=%s, NearbySchool=%s, Hospital=%s, Park=%s, mart=%s WHERE PropId=%s",
-            (new_crime, new_school, new_hosp, new_park, new_mart, pid)
-        )
-
-        conn.commit()
-        st.success("Property updated!")
-        st.session_state.page = 'view'
-        st.rerun()
-        return
+        if st.button("Save Changes"):
+            details = {'rooms': locals().get('new_rooms'), 'address': new_addr,
+                       'sqft': new_sqft, 'price': new_price, 'available': new_avail,
+                       'btype': locals().get('new_btype')}
+            status, _ = queries.save_listing(
+                cur, pid, ptype, new_desc, new_city, new_state, details,
+                (new_crime, new_school, new_hosp, new_park, new_mart), opened_at
+            )
+            if status != 'saved':
+                conn.rollback()
+                st.error({
+                    'conflict': "Not saved: someone else changed this listing first. "
+                                "Reload to see their changes, then edit again.",
+                    'deleted':  f"Not saved: property {pid} has been deleted.",
+                }[status])
+                return
 
-    if st.button("Cancel"):
-        st.session_state.page = 'view'
-        st.rerun()
-        return
+            commit(conn, cur, cache.change_event(
+                pid, locations=[(city, state), (new_city, new_state)]
+            ))
+            del st.session_state.edit_version
+            st.success("Property updated!")
+            st.session_state.page = 'view'
+            st.rerun()
+            return
 
-    cur.close()
-    conn.close()
+        if st.button("Cancel"):
+            del st.session_state.edit_version
+            st.session_state.page = 'view'
+            st.rerun()
+            return
 
 
 
@@ -556,6 +707,17 @@ def buy_page():
     st.header('Buy Property')
     default_prop = st.session_state.get('selected_prop', '')
     prop_id       = st.text_input('Property ID to buy', value=default_prop)
+    if prop_id:
+        with db.connection() as conn, conn.cursor() as cur:
+            taken = queries.booked_periods(cur, prop_id)
+        if taken:
+            st.write("**Already booked:** " + ", ".join(f"{s} → {e}" for s, e in taken))
+    d1, d2 = st.columns(2)
+    with d1:
+        start_date = st.date_input('Check-in', value=date.today(), min_value=date.today())
+    with d2:
+        end_date   = st.date_input('Check-out', value=start_date + timedelta(days=30),
+                                   min_value=start_date + timedelta(days=1))
     mode_of_pay   = st.selectbox('Mode of Pay', ['Cash', 'Credit'])
     if mode_of_pay == 'Credit':
         card_name = st.text_input('Card Holder Name')
@@ -573,59 +735,27 @@ def buy_page():
                 st.error("Credit card number must be exactly 16 digits")
                 return
 
-        conn = get_connection(); cur = conn.cursor()
-        booking_id = uuid.uuid4().hex[:10]
-        cur.execute("SELECT RenterID FROM Renter WHERE Email = %s",
-                    (st.session_state['email'],))
-        r_id = cur.fetchone()[0]
-
-        cur.execute("SELECT PropType FROM Property WHERE PropId = %s",
-                    (prop_id,))
-        ptype = cur.fetchone()[0]
-        table, col = {
-            'VacHome':     ('VacHome',    'VacHomeId'),
-            'Houses':      ('Houses',     'HouseId'),
-            'Apartments':  ('Apartments', 'AptId'),
-            'CommBuildings':('CommBuildings','BuildId'),
-        }[ptype]
-
-        cur.execute(f"SELECT Price FROM {table} WHERE {col} = %s",
-                    (prop_id,))
-        total_cost = cur.fetchone()[0]
-
-        start_date = date.today()
-        end_date   = start_date + timedelta(days=30)
-
-        cur.execute(
-            """
-            INSERT INTO Booking
-              (RenterID, BookID, PropId, StartDate, EndDate, Mode_of_pay, TotalCost)
-            VALUES (%s, %s, %s, %s, %s, %s, %s)
-            """,
-            (r_id, booking_id, prop_id, start_date, end_date, mode_of_pay, total_cost)
-        )
-        cur.execute(
-            f"UPDATE {table} SET Availablity = FALSE WHERE {col} = %s",
-            (prop_id,)
-        )
+        card = (card_name, card_no, exp_date, cvv) if mode_of_pay == 'Credit' else None
 
-        if mode_of_pay == 'Credit':
-            cur.execute(
-                "INSERT INTO CreditCard(RenterID, Card_name, Card_no, exp_date, cvv) "
-                "VALUES (%s, %s, %s, %s, %s)",
-                (r_id, card_name, card_no, exp_date, cvv)
+        with db.connection() as conn, conn.cursor() as cur:
+            status, booking_id, r_id, total_cost, _ = queries.book_property(
+                cur, st.session_state['email'], prop_id, None,
+                start_date, end_date, mode_of_pay, card
             )
-
-        cur.execute(
-            "INSERT INTO Rewards(R_id, Reward_Points) VALUES (%s, 100) "
-            "ON CONFLICT (R_id) DO UPDATE "
-            "  SET Reward_Points = Rewards.Reward_Points + 100",
-            (r_id,)
-        )
-
-        conn.commit()
-        cur.close()
-        conn.close()
+            if status == 'booked':
+                commit(conn, cur, cache.booking_event(prop_id))
+            else:
+                conn.rollback()
+
+        if status != 'booked':
+            st.error({
+                'unavailable': f"Property {prop_id} is not available for those dates.",
+                'bad_dates':   "Check-out must be after check-in.",
+                'busy':        f"Property {prop_id} is being booked by someone else, try again.",
+                'not_found':   f"No property with ID {prop_id}.",
+                'no_renter':   "Only renters can book properties.",
+            }[status])
+            return
 
         st.session_state.receipt = {
             'booking_id': booking_id,
@@ -664,35 +794,154 @@ def add_page():
     park=st.text_input('Closest Park')
     mart=st.text_input('Nearby Mart')
     if st.button('Add Property'):
-        conn=get_connection(); cur=conn.cursor()
-        cur.execute("SELECT MAX(CAST(PropId AS bigint)) FROM Property")
-        max_id=cur.fetchone()[0] or 0; prop_id=str(int(max_id)+1).zfill(10)
-        cur.execute("SELECT AgentID FROM Agent WHERE Email = %s",
-                    (st.session_state.email,))
-        agent_id = cur.fetchone()[0]
-        cur.execute(
-            "INSERT INTO Property(PropId, PropType, Description, City, State_, AgentID) "
-            "VALUES (%s,%s,%s,%s,%s,%s)",
-            (prop_id, type_, description, city, state, agent_id)
-        )
-        if type_=='VacHome': cur.execute("INSERT INTO VacHome VALUES(%s,%s,%s,%s,%s,%s)",(prop_id,rooms,addr,sqft,price,availability))
-        elif type_=='Houses': cur.execute("INSERT INTO Houses VALUES(%s,%s,%s,%s,%s,%s)",(prop_id,rooms,addr,sqft,price,availability))
-        elif type_=='Apartments': cur.execute("INSERT INTO Apartments VALUES(%s,%s,%s,%s,%s,%s,%s)",(prop_id,rooms,addr,sqft,price,availability,btype))
-        else:cur.execute("INSERT INTO CommBuildings VALUES(%s,%s,%s,%s,%s,%s)",(prop_id,addr,btype,sqft,price,availability))
-        cur.execute("INSERT INTO Neighbourhood(PropId,CrimeRate,NearbySchool,Hospital,Park,mart) VALUES(%s,%s,%s,%s,%s,%s)",
-                    (prop_id,crime_rate,nearby_school,hospital,park,mart))
-        conn.commit();cur.close();conn.close();st.success(f"Added property {prop_id} with neighbourhood info")
+        with db.connection() as conn, conn.cursor() as cur:
+            me = identity(cur)
+            agent_id, agency_name = me['agent_id'], me['agency']
+            details={'rooms':locals().get('rooms'),'address':addr,'sqft':sqft,'price':price,
+                     'available':availability,'btype':locals().get('btype')}
+            prop_id=queries.insert_listing(cur,agent_id,type_,description,city,state,details,
+                                           (crime_rate,nearby_school,hospital,park,mart))
+            commit(conn, cur, cache.change_event(
+                prop_id, locations=[(city, state)], agency=agency_name
+            ))
+        st.success(f"Added property {prop_id} with neighbourhood info")
         st.session_state.page='view';st.rerun()
 
+BULK_ACTIONS = ['Change price by %', 'Change price by amount', 'Set availability', 'Delete']
+
+def bulk_page():
+    st.header('Manage My Listings')
+    if st.button('View Properties'): st.session_state.page='view'; st.rerun()
+
+    with db.connection() as conn, conn.cursor() as cur:
+        me = identity(cur)
+        if not (me and me['agent_id']):
+            st.error("Agent record not found.")
+            return
+        agent_id = me['agent_id']
+
+        props = queries.fetch_agent_listings(cur, agent_id)
+        if not props:
+            st.write("You have no listings yet.")
+            return
+
+        labels = {pid: f"{pid}: {ptype} in {city}, {state} — ${price:.2f} "
+                       f"{'✅' if available else '❌'}"
+                  for pid, ptype, desc, city, state, price, available in props}
+        select_all = st.checkbox(f'Select all {len(props)} listings')
+        selected   = st.multiselect('Listings', list(labels), format_func=labels.get,
+                                    default=list(labels) if select_all else [])
+
+        action = st.radio('Action', BULK_ACTIONS, horizontal=True)
+        if action == 'Change price by %':
+            percent = st.number_input('Percent change (negative to lower)',
+                                      min_value=-100.0, value=0.0, step=1.0)
+        elif action == 'Change price by amount':
+            amount = st.number_input('Amount to add (negative to lower)', value=0.0, step=100.0)
+        elif action == 'Set availability':
+            available = st.radio('Availability', ['Available', 'Unavailable'],
+                                 horizontal=True) == 'Available'
+        else:
+            st.warning(f"This permanently deletes {len(selected)} listing(s).")
+
+        if st.button('Apply', disabled=not selected):
+            types = {pid: ptype for pid, ptype, *_ in props}
+            by_type = {}
+            for pid in selected:
+                by_type.setdefault(types[pid], []).append(pid)
+            try:
+                if action == 'Change price by %':
+                    done = queries.bulk_reprice(cur, agent_id, by_type, factor=1 + percent / 100)
+                elif action == 'Change price by amount':
+                    done = queries.bulk_reprice(cur, agent_id, by_type, delta=amount)
+                elif action == 'Set availability':
+                    done = queries.bulk_set_availability(cur, agent_id, by_type, available)
+                else:
+                    done = queries.bulk_delete(cur, agent_id, by_type)
+                places = {pid: (city, state) for pid, _, _, city, state, *_ in props}
+                commit(conn, cur, cache.batch_event(selected, [places[pid] for pid in selected]))
+            except psycopg2.IntegrityError:
+                conn.rollback()
+                st.error("Nothing was changed: some of the selected listings have bookings.")
+                return
+            st.success(f"{action}: {done} listing(s) updated.")
+            st.rerun()
+
+DIMENSION_TITLES = {'agency': 'Agency', 'city': 'City', 'type': 'Type'}
+ROLLUP_COLUMNS = ['Listings', 'Available', 'Avg price', 'Avg sq ft', 'Bookings', 'Revenue']
+ROLLUP_CONFIG = {
+    'Available': st.column_config.ProgressColumn(format='%.0f%%', min_value=0, max_value=100),
+    'Avg price': st.column_config.NumberColumn(format='$%.2f'),
+    'Avg sq ft': st.column_config.NumberColumn(format='%.0f'),
+    'Revenue':   st.column_config.NumberColumn(format='$%.2f'),
+}
+
+def rollup_frame(rows, by):
+    df = pd.DataFrame.from_records(rows, columns=[DIMENSION_TITLES[d] for d in by] + ROLLUP_COLUMNS)
+    for d in by:
+        df[DIMENSION_TITLES[d]] = df[DIMENSION_TITLES[d]].replace('', '(none)')
+    for col in ROLLUP_COLUMNS[1:]:
+        df[col] = df[col].astype(float)
+    df['Available'] *= 100
+    return df
+
+def analytics_page():
+    # Reads only the analytics rollups, never the listing or booking tables.
+    st.header('Agency Analytics')
+    with read_connection() as conn, conn.cursor() as cur:
+        me = identity(cur)
+        if me is None or not me['agent_id']:
+            st.error("Analytics are available to agents only.")
+        else:
+            as_of = analytics.updated_at(cur)
+            st.caption(f"As of {as_of:%Y-%m-%d %H:%M:%S}" if as_of else "Not computed yet.")
+            agency_tab, market_tab = st.tabs([me['agency'] or 'Your agency', 'Market'])
+            with agency_tab:
+                by = ['city', 'type']
+                st.dataframe(rollup_frame(analytics.rollup(cur, by, me['agency'] or ''), by),
+                             hide_index=True, column_config=ROLLUP_CONFIG,
+                             use_container_width=True)
+            with market_tab:
+                by = st.multiselect('Group by', list(DIMENSION_TITLES), default=['city', 'type'],
+                                    format_func=DIMENSION_TITLES.get) or ['agency']
+                st.dataframe(rollup_frame(analytics.rollup(cur, by), by), hide_index=True,
+                             column_config=ROLLUP_CONFIG, use_container_width=True)
+    if st.button('Back'):
+        st.session_state.page = 'view'
+        st.rerun()
+
+def debug_panel(run):
+    st.sidebar.header('Query stats')
+    st.sidebar.write(f"**Page:** {run.page} — {run.total_queries} queries, "
+                     f"{run.total_seconds * 1000:.1f} ms in SQL")
+    flagged = run.nplus1()
+    if flagged:
+        st.sidebar.warning(f"Possible N+1: {len(flagged)} statement(s) ran more than "
+                           f"{instrument.NPLUS1_THRESHOLD} times this rerun.")
+    st.sidebar.table(run.rows())
+    st.sidebar.write("**Connection pool**", db.pool_stats())
+    st.sidebar.write("**Listing cache**", cache.stats())
+
 def main():
+    feed.start()
+    cache.start_listener()
+    recommend.start()
+    instrument.start_metrics_server()
+    instrument.register_gauges('pool', db.pool_stats)
+    instrument.register_gauges('listing_cache', cache.stats)
+    instrument.register_gauges('replicas', db.replica_stats)
     if 'page' not in st.session_state: st.session_state.page='signup'
-    if st.session_state.page=='signup': signup_page()
-    elif st.session_state.page=='login': login_page()
-    elif st.session_state.page=='view': view_page()
-    elif st.session_state.page=='buy': buy_page()
-    elif st.session_state.page=='add': add_page()
-    elif st.session_state.page == 'edit':edit_page()
-    elif st.session_state.page=='profile': profile_page()
-    else: st.error(f"Unknown page: {st.session_state.page}")
+    with instrument.rerun(st.session_state.page) as run:
+        if st.session_state.page=='signup': signup_page()
+        elif st.session_state.page=='login': login_page()
+        elif st.session_state.page=='view': view_page()
+        elif st.session_state.page=='buy': buy_page()
+        elif st.session_state.page=='add': add_page()
+        elif st.session_state.page=='bulk': bulk_page()
+        elif st.session_state.page == 'edit':edit_page()
+        elif st.session_state.page=='profile': profile_page()
+        elif st.session_state.page=='analytics': analytics_page()
+        else: st.error(f"Unknown page: {st.session_state.page}")
+    if instrument.DEBUG_PANEL: debug_panel(run)
 
 if __name__=='__main__': main()
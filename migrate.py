@@ -0,0 +1,64 @@
+import os
+import sys
+
+import db
+
+
+MIGRATIONS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'migrations')
+
+
+def migration_files():
+    files = sorted(f for f in os.listdir(MIGRATIONS_DIR) if f.endswith('.sql'))
+    return [(f.split('_', 1)[0], f) for f in files]
+
+
+def applied_versions(cur):
+    cur.execute(
+        "CREATE TABLE IF NOT EXISTS schema_migrations ("
+        " version VARCHAR(10) PRIMARY KEY,"
+        " name VARCHAR(100),"
+        " applied_at TIMESTAMP DEFAULT now())"
+    )
+    cur.execute("SELECT version FROM schema_migrations")
+    return {r[0] for r in cur.fetchall()}
+
+
+def migrate(conn, dry_run=False):
+    # Each file runs in its own transaction together with its bookkeeping
+    # row, so a failed migration leaves nothing half-applied.
+    with conn.cursor() as cur:
+        done = applied_versions(cur)
+        conn.commit()
+        applied = []
+        for version, name in migration_files():
+            if version in done:
+                continue
+            if dry_run:
+                applied.append(name)
+                continue
+            with open(os.path.join(MIGRATIONS_DIR, name), encoding='utf-8') as f:
+                cur.execute(f.read())
+            cur.execute(
+                "INSERT INTO schema_migrations(version, name) VALUES (%s, %s)",
+                (version, name)
+            )
+            conn.commit()
+            applied.append(name)
+    return applied
+
+
+def main():
+    dry_run = '--dry-run' in sys.argv[1:]
+    conn = db.connect()
+    try:
+        applied = migrate(conn, dry_run)
+    finally:
+        conn.close()
+    for name in applied:
+        print(('pending: ' if dry_run else 'applied: ') + name)
+    if not applied:
+        print('schema is up to date')
+
+
+if __name__ == '__main__':
+    main()
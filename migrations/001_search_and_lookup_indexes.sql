@@ -0,0 +1,17 @@
+-- Trigram indexes so the City/State ILIKE '%x%' search in view_page can use
+-- an index, plus B-tree indexes for the lookups main.py runs on every page.
+-- Neighbourhood.PropId is already the leading column of its primary key.
+
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+
+CREATE INDEX IF NOT EXISTS property_city_trgm
+    ON Property USING gin (City gin_trgm_ops);
+CREATE INDEX IF NOT EXISTS property_state_trgm
+    ON Property USING gin (State_ gin_trgm_ops);
+
+CREATE INDEX IF NOT EXISTS property_agentid_idx  ON Property (AgentID);
+CREATE INDEX IF NOT EXISTS booking_renterid_idx  ON Booking (RenterID);
+CREATE INDEX IF NOT EXISTS booking_propid_idx    ON Booking (PropId);
+CREATE INDEX IF NOT EXISTS agent_email_idx       ON Agent (Email);
+CREATE INDEX IF NOT EXISTS agent_agencyname_idx  ON Agent (AgencyName);
+CREATE INDEX IF NOT EXISTS renter_email_idx      ON Renter (Email);
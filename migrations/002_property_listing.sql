@@ -0,0 +1,153 @@
+-- Denormalized read model: one row per property with its subtype details,
+-- owning agent and neighbourhood summary. Kept in sync by the triggers
+-- below, so read paths never need the PropType -> subtype table dispatch.
+
+CREATE TABLE property_listing
+	(PropId VARCHAR(10),
+	 PropType VARCHAR(15),
+	 Description VARCHAR(50),
+	 City VARCHAR(12),
+	 State_ VARCHAR(12),
+	 address VARCHAR(50),
+	 NoOfRooms numeric(2,0),
+	 SqFootage numeric(7,2),
+	 Price numeric(12,2),
+	 Availablity Boolean,
+	 AgentID VARCHAR(10),
+	 AgentName VARCHAR(30),
+	 AgencyName VARCHAR(25),
+	 CrimeRate numeric(4,2),
+	 NearbySchool VARCHAR(12),
+	 Hospital VARCHAR(12),
+	 Park VARCHAR(12),
+	 mart VARCHAR(12),
+	 PRIMARY KEY(PropId));
+
+-- AgentName is only filled when the agent has a Users row, matching the
+-- inner Agent/Users join the pages used before.
+CREATE VIEW property_listing_source AS
+	SELECT p.PropId, p.PropType, p.Description, p.City, p.State_,
+	       s.address, s.NoOfRooms, s.SqFootage, s.Price, s.Availablity,
+	       p.AgentID, u.Name_ AS AgentName, a.AgencyName,
+	       n.CrimeRate, n.NearbySchool, n.Hospital, n.Park, n.mart
+	FROM Property p
+	LEFT JOIN (
+		SELECT VacHomeId AS PropId, address, NoOfRooms, SqFootage, Price, Availablity FROM VacHome
+		UNION ALL
+		SELECT HouseId,   address, NoOfRooms, SqFootage, Price, Availablity FROM Houses
+		UNION ALL
+		SELECT AptId,     address, NoOfRooms, SqFootage, Price, Availablity FROM Apartments
+		UNION ALL
+		SELECT BuildId,   address, NULL,      SqFootage, Price, Availablity FROM CommBuildings
+	) s ON s.PropId = p.PropId
+	LEFT JOIN Agent a ON a.AgentID = p.AgentID
+	LEFT JOIN Users u ON u.Email = a.Email
+	LEFT JOIN LATERAL (
+		SELECT CrimeRate, NearbySchool, Hospital, Park, mart
+		FROM Neighbourhood WHERE PropId = p.PropId
+		LIMIT 1
+	) n ON TRUE;
+
+-- Upserts rather than delete-then-insert, so two writers refreshing the
+-- same property cannot collide on the primary key.
+CREATE FUNCTION refresh_property_listing(pid VARCHAR) RETURNS void AS $$
+BEGIN
+	DELETE FROM property_listing l
+	WHERE l.PropId = pid AND NOT EXISTS (SELECT 1 FROM Property p WHERE p.PropId = pid);
+	INSERT INTO property_listing
+		SELECT * FROM property_listing_source WHERE PropId = pid
+	ON CONFLICT (PropId) DO UPDATE SET
+		(PropType, Description, City, State_, address, NoOfRooms, SqFootage, Price,
+		 Availablity, AgentID, AgentName, AgencyName, CrimeRate, NearbySchool, Hospital,
+		 Park, mart)
+		= (EXCLUDED.PropType, EXCLUDED.Description, EXCLUDED.City, EXCLUDED.State_,
+		   EXCLUDED.address, EXCLUDED.NoOfRooms, EXCLUDED.SqFootage, EXCLUDED.Price,
+		   EXCLUDED.Availablity, EXCLUDED.AgentID, EXCLUDED.AgentName, EXCLUDED.AgencyName,
+		   EXCLUDED.CrimeRate, EXCLUDED.NearbySchool, EXCLUDED.Hospital, EXCLUDED.Park,
+		   EXCLUDED.mart);
+END;
+$$ LANGUAGE plpgsql;
+
+-- Used by Property, the subtype tables and Neighbourhood. TG_ARGV[0] names
+-- the column holding the property id.
+CREATE FUNCTION property_listing_row_trigger() RETURNS trigger AS $$
+DECLARE
+	old_id VARCHAR;
+	new_id VARCHAR;
+BEGIN
+	IF TG_OP <> 'INSERT' THEN
+		old_id := to_jsonb(OLD) ->> TG_ARGV[0];
+	END IF;
+	IF TG_OP <> 'DELETE' THEN
+		new_id := to_jsonb(NEW) ->> TG_ARGV[0];
+	END IF;
+	IF old_id IS NOT NULL AND old_id IS DISTINCT FROM new_id THEN
+		PERFORM refresh_property_listing(old_id);
+	END IF;
+	IF new_id IS NOT NULL THEN
+		PERFORM refresh_property_listing(new_id);
+	END IF;
+	RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER property_listing_sync AFTER INSERT OR UPDATE OR DELETE ON Property
+	FOR EACH ROW EXECUTE FUNCTION property_listing_row_trigger('propid');
+CREATE TRIGGER property_listing_sync AFTER INSERT OR UPDATE OR DELETE ON VacHome
+	FOR EACH ROW EXECUTE FUNCTION property_listing_row_trigger('vachomeid');
+CREATE TRIGGER property_listing_sync AFTER INSERT OR UPDATE OR DELETE ON Houses
+	FOR EACH ROW EXECUTE FUNCTION property_listing_row_trigger('houseid');
+CREATE TRIGGER property_listing_sync AFTER INSERT OR UPDATE OR DELETE ON Apartments
+	FOR EACH ROW EXECUTE FUNCTION property_listing_row_trigger('aptid');
+CREATE TRIGGER property_listing_sync AFTER INSERT OR UPDATE OR DELETE ON CommBuildings
+	FOR EACH ROW EXECUTE FUNCTION property_listing_row_trigger('buildid');
+CREATE TRIGGER property_listing_sync AFTER INSERT OR UPDATE OR DELETE ON Neighbourhood
+	FOR EACH ROW EXECUTE FUNCTION property_listing_row_trigger('propid');
+
+-- Agent and user renames touch every listing of that agent, set-based.
+CREATE FUNCTION property_listing_agent_trigger() RETURNS trigger AS $$
+BEGIN
+	UPDATE property_listing pl
+	SET AgentName = u.Name_, AgencyName = a.AgencyName
+	FROM Agent a
+	LEFT JOIN Users u ON u.Email = a.Email
+	WHERE pl.AgentID = a.AgentID
+	  AND (a.AgentID = NEW.AgentID OR a.AgentID = OLD.AgentID);
+	RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE FUNCTION property_listing_user_trigger() RETURNS trigger AS $$
+BEGIN
+	UPDATE property_listing pl
+	SET AgentName = u.Name_, AgencyName = a.AgencyName
+	FROM Agent a
+	LEFT JOIN Users u ON u.Email = a.Email
+	WHERE pl.AgentID = a.AgentID
+	  AND a.Email IN (NEW.Email, OLD.Email);
+	RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER property_listing_sync AFTER UPDATE OF AgentID, Email, AgencyName ON Agent
+	FOR EACH ROW EXECUTE FUNCTION property_listing_agent_trigger();
+CREATE TRIGGER property_listing_sync AFTER UPDATE OF Name_, Email ON Users
+	FOR EACH ROW EXECUTE FUNCTION property_listing_user_trigger();
+
+-- Availability writes still land on the subtype tables; this avoids the
+-- PropType lookup by probing all four primary keys in one call.
+CREATE FUNCTION set_availability(pid VARCHAR, available BOOLEAN) RETURNS void AS $$
+BEGIN
+	UPDATE VacHome       SET Availablity = available WHERE VacHomeId = pid;
+	UPDATE Houses        SET Availablity = available WHERE HouseId   = pid;
+	UPDATE Apartments    SET Availablity = available WHERE AptId     = pid;
+	UPDATE CommBuildings SET Availablity = available WHERE BuildId   = pid;
+END;
+$$ LANGUAGE plpgsql;
+
+INSERT INTO property_listing SELECT * FROM property_listing_source;
+
+CREATE INDEX property_listing_city_trgm  ON property_listing USING gin (City gin_trgm_ops);
+CREATE INDEX property_listing_state_trgm ON property_listing USING gin (State_ gin_trgm_ops);
+CREATE INDEX property_listing_agentid_idx  ON property_listing (AgentID);
+CREATE INDEX property_listing_agency_idx   ON property_listing (AgencyName, PropId);
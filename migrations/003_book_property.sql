@@ -0,0 +1,64 @@
+-- Booking as one server-side call. The Property row is the lock anchor:
+-- concurrent buyers of the same listing queue on it, and everyone after
+-- the winner re-reads availability and gets 'unavailable' back.
+
+CREATE FUNCTION book_property(
+	p_email     VARCHAR,
+	p_prop_id   VARCHAR,
+	p_book_id   VARCHAR,
+	p_start     DATE,
+	p_end       DATE,
+	p_mode      VARCHAR,
+	p_card_name VARCHAR DEFAULT NULL,
+	p_card_no   NUMERIC DEFAULT NULL,
+	p_exp_date  DATE    DEFAULT NULL,
+	p_cvv       NUMERIC DEFAULT NULL)
+RETURNS TABLE(status TEXT, booking_id VARCHAR, renter_id VARCHAR, amount NUMERIC, points NUMERIC)
+AS $$
+DECLARE
+	v_renter VARCHAR;
+	v_price  NUMERIC;
+	v_avail  BOOLEAN;
+	v_points NUMERIC;
+BEGIN
+	SELECT r.RenterID INTO v_renter FROM Renter r WHERE r.Email = p_email;
+	IF v_renter IS NULL THEN
+		RETURN QUERY SELECT 'no_renter', NULL::VARCHAR, NULL::VARCHAR, NULL::NUMERIC, NULL::NUMERIC;
+		RETURN;
+	END IF;
+
+	PERFORM set_config('lock_timeout', '2s', TRUE);
+	PERFORM 1 FROM Property p WHERE p.PropId = p_prop_id FOR UPDATE;
+	IF NOT FOUND THEN
+		RETURN QUERY SELECT 'not_found', NULL::VARCHAR, v_renter, NULL::NUMERIC, NULL::NUMERIC;
+		RETURN;
+	END IF;
+
+	SELECT pl.Price, pl.Availablity INTO v_price, v_avail
+	FROM property_listing pl WHERE pl.PropId = p_prop_id;
+	IF NOT COALESCE(v_avail, FALSE) THEN
+		RETURN QUERY SELECT 'unavailable', NULL::VARCHAR, v_renter, NULL::NUMERIC, NULL::NUMERIC;
+		RETURN;
+	END IF;
+
+	INSERT INTO Booking(RenterID, BookID, PropId, StartDate, EndDate, Mode_of_pay, TotalCost)
+	VALUES (v_renter, p_book_id, p_prop_id, p_start, p_end, p_mode, v_price);
+
+	PERFORM set_availability(p_prop_id, FALSE);
+
+	IF p_mode = 'Credit' THEN
+		INSERT INTO CreditCard(RenterID, Card_name, Card_no, exp_date, cvv)
+		VALUES (v_renter, p_card_name, p_card_no, p_exp_date, p_cvv)
+		ON CONFLICT DO NOTHING;
+	END IF;
+
+	INSERT INTO Rewards AS rw (R_id, Reward_Points) VALUES (v_renter, 100)
+	ON CONFLICT (R_id) DO UPDATE SET Reward_Points = rw.Reward_Points + 100
+	RETURNING rw.Reward_Points INTO v_points;
+
+	RETURN QUERY SELECT 'booked', p_book_id, v_renter, v_price, v_points;
+EXCEPTION
+	WHEN lock_not_available THEN
+		RETURN QUERY SELECT 'busy', NULL::VARCHAR, v_renter, NULL::NUMERIC, NULL::NUMERIC;
+END;
+$$ LANGUAGE plpgsql;
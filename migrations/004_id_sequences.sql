@@ -0,0 +1,96 @@
+-- Collision-free IDs from sequences, sized for the VARCHAR(10) key columns.
+-- Properties keep the zero-padded numeric format add_page always used;
+-- renters, agents and bookings get an upper-case prefix, which can never
+-- clash with the lower-case uuid4 hex IDs issued before this migration.
+
+CREATE SEQUENCE property_id_seq MAXVALUE 9999999999;
+CREATE SEQUENCE renter_id_seq   MAXVALUE 999999999;
+CREATE SEQUENCE agent_id_seq    MAXVALUE 999999999;
+CREATE SEQUENCE booking_id_seq  MAXVALUE 999999999;
+
+SELECT setval('property_id_seq', COALESCE(
+	(SELECT MAX(PropId::bigint) FROM Property WHERE PropId ~ '^[0-9]{1,10}$'), 0) + 1, FALSE);
+SELECT setval('renter_id_seq', COALESCE(
+	(SELECT MAX(substr(RenterID, 2)::bigint) FROM Renter WHERE RenterID ~ '^R[0-9]{9}$'), 0) + 1, FALSE);
+SELECT setval('agent_id_seq', COALESCE(
+	(SELECT MAX(substr(AgentID, 2)::bigint) FROM Agent WHERE AgentID ~ '^A[0-9]{9}$'), 0) + 1, FALSE);
+SELECT setval('booking_id_seq', COALESCE(
+	(SELECT MAX(substr(BookID, 2)::bigint) FROM Booking WHERE BookID ~ '^B[0-9]{9}$'), 0) + 1, FALSE);
+
+CREATE FUNCTION next_id(kind TEXT) RETURNS VARCHAR AS $$
+	SELECT CASE kind
+		WHEN 'property' THEN lpad(nextval('property_id_seq')::text, 10, '0')
+		WHEN 'renter'   THEN 'R' || lpad(nextval('renter_id_seq')::text, 9, '0')
+		WHEN 'agent'    THEN 'A' || lpad(nextval('agent_id_seq')::text, 9, '0')
+		WHEN 'booking'  THEN 'B' || lpad(nextval('booking_id_seq')::text, 9, '0')
+	END;
+$$ LANGUAGE sql;
+
+ALTER TABLE Property ALTER COLUMN PropId   SET DEFAULT next_id('property');
+ALTER TABLE Renter   ALTER COLUMN RenterID SET DEFAULT next_id('renter');
+ALTER TABLE Agent    ALTER COLUMN AgentID  SET DEFAULT next_id('agent');
+ALTER TABLE Booking  ALTER COLUMN BookID   SET DEFAULT next_id('booking');
+
+-- book_property() now allocates the booking id itself when none is given.
+CREATE OR REPLACE FUNCTION book_property(
+	p_email     VARCHAR,
+	p_prop_id   VARCHAR,
+	p_book_id   VARCHAR,
+	p_start     DATE,
+	p_end       DATE,
+	p_mode      VARCHAR,
+	p_card_name VARCHAR DEFAULT NULL,
+	p_card_no   NUMERIC DEFAULT NULL,
+	p_exp_date  DATE    DEFAULT NULL,
+	p_cvv       NUMERIC DEFAULT NULL)
+RETURNS TABLE(status TEXT, booking_id VARCHAR, renter_id VARCHAR, amount NUMERIC, points NUMERIC)
+AS $$
+DECLARE
+	v_renter VARCHAR;
+	v_price  NUMERIC;
+	v_avail  BOOLEAN;
+	v_points NUMERIC;
+	v_book   VARCHAR;
+BEGIN
+	SELECT r.RenterID INTO v_renter FROM Renter r WHERE r.Email = p_email;
+	IF v_renter IS NULL THEN
+		RETURN QUERY SELECT 'no_renter', NULL::VARCHAR, NULL::VARCHAR, NULL::NUMERIC, NULL::NUMERIC;
+		RETURN;
+	END IF;
+
+	PERFORM set_config('lock_timeout', '2s', TRUE);
+	PERFORM 1 FROM Property p WHERE p.PropId = p_prop_id FOR UPDATE;
+	IF NOT FOUND THEN
+		RETURN QUERY SELECT 'not_found', NULL::VARCHAR, v_renter, NULL::NUMERIC, NULL::NUMERIC;
+		RETURN;
+	END IF;
+
+	SELECT pl.Price, pl.Availablity INTO v_price, v_avail
+	FROM property_listing pl WHERE pl.PropId = p_prop_id;
+	IF NOT COALESCE(v_avail, FALSE) THEN
+		RETURN QUERY SELECT 'unavailable', NULL::VARCHAR, v_renter, NULL::NUMERIC, NULL::NUMERIC;
+		RETURN;
+	END IF;
+
+	v_book := COALESCE(p_book_id, next_id('booking'));
+	INSERT INTO Booking(RenterID, BookID, PropId, StartDate, EndDate, Mode_of_pay, TotalCost)
+	VALUES (v_renter, v_book, p_prop_id, p_start, p_end, p_mode, v_price);
+
+	PERFORM set_availability(p_prop_id, FALSE);
+
+	IF p_mode = 'Credit' THEN
+		INSERT INTO CreditCard(RenterID, Card_name, Card_no, exp_date, cvv)
+		VALUES (v_renter, p_card_name, p_card_no, p_exp_date, p_cvv)
+		ON CONFLICT DO NOTHING;
+	END IF;
+
+	INSERT INTO Rewards AS rw (R_id, Reward_Points) VALUES (v_renter, 100)
+	ON CONFLICT (R_id) DO UPDATE SET Reward_Points = rw.Reward_Points + 100
+	RETURNING rw.Reward_Points INTO v_points;
+
+	RETURN QUERY SELECT 'booked', v_book, v_renter, v_price, v_points;
+EXCEPTION
+	WHEN lock_not_available THEN
+		RETURN QUERY SELECT 'busy', NULL::VARCHAR, v_renter, NULL::NUMERIC, NULL::NUMERIC;
+END;
+$$ LANGUAGE plpgsql;
@@ -0,0 +1,69 @@
+-- Keep property_listing in sync with statement-level triggers over
+-- transition tables, so a set-based INSERT/UPDATE/DELETE of N rows
+-- refreshes the read model in one pass instead of N.
+-- Transition tables allow only one event per trigger, hence three each.
+
+CREATE FUNCTION refresh_property_listings(pids VARCHAR[]) RETURNS void AS $$
+BEGIN
+	DELETE FROM property_listing l
+	WHERE l.PropId = ANY(pids)
+	  AND NOT EXISTS (SELECT 1 FROM Property p WHERE p.PropId = l.PropId);
+	INSERT INTO property_listing
+		SELECT * FROM property_listing_source WHERE PropId = ANY(pids)
+	ON CONFLICT (PropId) DO UPDATE SET
+		(PropType, Description, City, State_, address, NoOfRooms, SqFootage, Price,
+		 Availablity, AgentID, AgentName, AgencyName, CrimeRate, NearbySchool, Hospital,
+		 Park, mart)
+		= (EXCLUDED.PropType, EXCLUDED.Description, EXCLUDED.City, EXCLUDED.State_,
+		   EXCLUDED.address, EXCLUDED.NoOfRooms, EXCLUDED.SqFootage, EXCLUDED.Price,
+		   EXCLUDED.Availablity, EXCLUDED.AgentID, EXCLUDED.AgentName, EXCLUDED.AgencyName,
+		   EXCLUDED.CrimeRate, EXCLUDED.NearbySchool, EXCLUDED.Hospital, EXCLUDED.Park,
+		   EXCLUDED.mart);
+END;
+$$ LANGUAGE plpgsql;
+
+-- TG_ARGV[0] names the column holding the property id.
+CREATE FUNCTION property_listing_stmt_trigger() RETURNS trigger AS $$
+DECLARE
+	pids VARCHAR[];
+BEGIN
+	IF TG_OP = 'INSERT' THEN
+		EXECUTE format('SELECT array_agg(DISTINCT %I) FROM new_rows', TG_ARGV[0]) INTO pids;
+	ELSIF TG_OP = 'DELETE' THEN
+		EXECUTE format('SELECT array_agg(DISTINCT %I) FROM old_rows', TG_ARGV[0]) INTO pids;
+	ELSE
+		EXECUTE format('SELECT array_agg(DISTINCT id) FROM '
+		               '(SELECT %1$I AS id FROM new_rows UNION SELECT %1$I FROM old_rows) t',
+		               TG_ARGV[0]) INTO pids;
+	END IF;
+	IF pids IS NOT NULL THEN
+		PERFORM refresh_property_listings(pids);
+	END IF;
+	RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DO $$
+DECLARE
+	t RECORD;
+BEGIN
+	FOR t IN SELECT * FROM (VALUES
+		('property', 'propid'), ('vachome', 'vachomeid'), ('houses', 'houseid'),
+		('apartments', 'aptid'), ('commbuildings', 'buildid'), ('neighbourhood', 'propid')
+	) AS v(tbl, col) LOOP
+		EXECUTE format('DROP TRIGGER property_listing_sync ON %I', t.tbl);
+		EXECUTE format('CREATE TRIGGER property_listing_ins AFTER INSERT ON %I '
+		               'REFERENCING NEW TABLE AS new_rows FOR EACH STATEMENT '
+		               'EXECUTE FUNCTION property_listing_stmt_trigger(%L)', t.tbl, t.col);
+		EXECUTE format('CREATE TRIGGER property_listing_upd AFTER UPDATE ON %I '
+		               'REFERENCING NEW TABLE AS new_rows OLD TABLE AS old_rows FOR EACH STATEMENT '
+		               'EXECUTE FUNCTION property_listing_stmt_trigger(%L)', t.tbl, t.col);
+		EXECUTE format('CREATE TRIGGER property_listing_del AFTER DELETE ON %I '
+		               'REFERENCING OLD TABLE AS old_rows FOR EACH STATEMENT '
+		               'EXECUTE FUNCTION property_listing_stmt_trigger(%L)', t.tbl, t.col);
+	END LOOP;
+END;
+$$;
+
+DROP FUNCTION property_listing_row_trigger();
+DROP FUNCTION refresh_property_listing(VARCHAR);
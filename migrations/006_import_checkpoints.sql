@@ -0,0 +1,11 @@
+-- Progress of bulk listing imports (import_listings.py). Updated in the
+-- same transaction as each loaded chunk, so a resumed import never loads
+-- a row twice or skips one.
+
+CREATE TABLE import_checkpoints
+	(Source VARCHAR(300),
+	 RowsDone BIGINT,
+	 RowsLoaded BIGINT,
+	 RowsRejected BIGINT,
+	 UpdatedAt TIMESTAMP DEFAULT now(),
+	 PRIMARY KEY(Source));
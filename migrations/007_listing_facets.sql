@@ -0,0 +1,28 @@
+-- Faceted search (queries.search_listings). Amenity presence is folded into
+-- a bitmask (1 school, 2 hospital, 4 park, 8 mart) so facet filters and
+-- counts can be answered from the indexes below without visiting the heap.
+-- Neighbourhood stores missing amenities as blanks, older rows as NULLs.
+
+ALTER TABLE property_listing ADD COLUMN Amenities smallint GENERATED ALWAYS AS (
+	(CASE WHEN COALESCE(NearbySchool, '') <> '' THEN 1 ELSE 0 END
+	 | CASE WHEN COALESCE(Hospital, '') <> '' THEN 2 ELSE 0 END
+	 | CASE WHEN COALESCE(Park, '') <> '' THEN 4 ELSE 0 END
+	 | CASE WHEN COALESCE(mart, '') <> '' THEN 8 ELSE 0 END)::smallint
+) STORED;
+
+-- Covers every facet column: type/price filters range-scan it and the facet
+-- aggregate runs as an index-only scan.
+CREATE INDEX property_listing_facet_idx ON property_listing (PropType, Price)
+	INCLUDE (NoOfRooms, SqFootage, CrimeRate, Availablity, Amenities);
+
+-- Renters mostly search available listings only.
+CREATE INDEX property_listing_available_price_idx ON property_listing (Price)
+	INCLUDE (PropType, NoOfRooms, SqFootage, CrimeRate, Amenities)
+	WHERE Availablity;
+
+CREATE INDEX property_listing_rooms_idx ON property_listing (NoOfRooms, Price)
+	WHERE NoOfRooms IS NOT NULL;
+
+CREATE INDEX property_listing_crime_idx ON property_listing (CrimeRate);
+
+ANALYZE property_listing;
@@ -0,0 +1,16 @@
+-- Ranked full-text search over property_listing (queries.search_listings).
+-- Description weighs most, then location, then the neighbourhood amenities,
+-- which are indexed together with what they are ("Lincoln school") so a
+-- search for "near park" finds listings with a park nearby.
+
+ALTER TABLE property_listing ADD COLUMN search_doc tsvector GENERATED ALWAYS AS (
+	setweight(to_tsvector('english', COALESCE(Description, '')), 'A')
+	|| setweight(to_tsvector('english', COALESCE(City, '') || ' ' || COALESCE(State_, '')), 'B')
+	|| setweight(to_tsvector('english',
+		CASE WHEN COALESCE(NearbySchool, '') <> '' THEN NearbySchool || ' school ' ELSE '' END
+		|| CASE WHEN COALESCE(Hospital, '') <> '' THEN Hospital || ' hospital ' ELSE '' END
+		|| CASE WHEN COALESCE(Park, '') <> '' THEN Park || ' park ' ELSE '' END
+		|| CASE WHEN COALESCE(mart, '') <> '' THEN mart || ' mart' ELSE '' END), 'C')
+) STORED;
+
+CREATE INDEX property_listing_search_doc_idx ON property_listing USING GIN (search_doc);
@@ -0,0 +1,12 @@
+-- Top-k listings per renter, precomputed by "python recommend.py batch".
+-- The app scores live from an in-memory snapshot and only reads this
+-- while that snapshot is still loading.
+
+CREATE TABLE renter_recommendations
+	(RenterID VARCHAR(10),
+	 Rank_ smallint,
+	 PropId VARCHAR(10),
+	 Score real,
+	 ComputedAt TIMESTAMP,
+	 PRIMARY KEY(RenterID, Rank_),
+	 FOREIGN KEY (RenterID) references Renter ON DELETE CASCADE);
@@ -0,0 +1,119 @@
+-- Bookings occupy a date range instead of flipping the whole property to
+-- unavailable. Period is [StartDate, EndDate): the end date is check-out,
+-- so back-to-back stays don't conflict. The exclusion constraint rejects
+-- overlapping bookings of one property, and its GiST index answers
+-- "free between X and Y" probes without scanning Booking.
+-- Availablity now only says whether the agent is taking bookings at all.
+
+CREATE EXTENSION IF NOT EXISTS btree_gist;
+
+ALTER TABLE Booking ADD COLUMN Period daterange
+	GENERATED ALWAYS AS (daterange(StartDate, EndDate, '[)')) STORED;
+
+-- Nothing checked for overlaps before this, so existing data may have
+-- some. Stop with the conflicting bookings listed rather than the bare
+-- constraint error. To clean up, cancel one booking of each pair, e.g.
+--   DELETE FROM Booking WHERE BookID IN (<one BookID from each pair>);
+-- then run the migration again.
+DO $$
+DECLARE
+	pairs TEXT;
+BEGIN
+	SELECT string_agg(a.BookID || '/' || b.BookID || ' (' || a.PropId || ')', ', '
+	                  ORDER BY a.PropId, a.BookID, b.BookID)
+	INTO pairs
+	FROM Booking a
+	JOIN Booking b ON b.PropId = a.PropId AND b.BookID > a.BookID AND b.Period && a.Period;
+	IF pairs IS NOT NULL THEN
+		RAISE EXCEPTION 'overlapping bookings (BookID pairs, property): %', pairs
+			USING HINT = 'Cancel one booking of each pair, then re-run this migration.';
+	END IF;
+END;
+$$;
+
+ALTER TABLE Booking ADD CONSTRAINT booking_no_overlap
+	EXCLUDE USING gist (PropId WITH =, Period WITH &&);
+
+-- Listings closed by the old one-booking-per-property rule reopen; their
+-- bookings now hold just the booked dates.
+UPDATE VacHome SET Availablity = TRUE
+	WHERE NOT Availablity AND VacHomeId IN (SELECT PropId FROM Booking);
+UPDATE Houses SET Availablity = TRUE
+	WHERE NOT Availablity AND HouseId IN (SELECT PropId FROM Booking);
+UPDATE Apartments SET Availablity = TRUE
+	WHERE NOT Availablity AND AptId IN (SELECT PropId FROM Booking);
+UPDATE CommBuildings SET Availablity = TRUE
+	WHERE NOT Availablity AND BuildId IN (SELECT PropId FROM Booking);
+
+-- Price covers a 30-day stay, as the fixed-length bookings did; other
+-- lengths are charged pro rata. Overlaps report 'unavailable', and an
+-- empty or inverted range 'bad_dates'.
+CREATE OR REPLACE FUNCTION book_property(
+	p_email     VARCHAR,
+	p_prop_id   VARCHAR,
+	p_book_id   VARCHAR,
+	p_start     DATE,
+	p_end       DATE,
+	p_mode      VARCHAR,
+	p_card_name VARCHAR DEFAULT NULL,
+	p_card_no   NUMERIC DEFAULT NULL,
+	p_exp_date  DATE    DEFAULT NULL,
+	p_cvv       NUMERIC DEFAULT NULL)
+RETURNS TABLE(status TEXT, booking_id VARCHAR, renter_id VARCHAR, amount NUMERIC, points NUMERIC)
+AS $$
+DECLARE
+	v_renter VARCHAR;
+	v_price  NUMERIC;
+	v_avail  BOOLEAN;
+	v_points NUMERIC;
+	v_book   VARCHAR;
+	v_cost   NUMERIC;
+BEGIN
+	SELECT r.RenterID INTO v_renter FROM Renter r WHERE r.Email = p_email;
+	IF v_renter IS NULL THEN
+		RETURN QUERY SELECT 'no_renter', NULL::VARCHAR, NULL::VARCHAR, NULL::NUMERIC, NULL::NUMERIC;
+		RETURN;
+	END IF;
+
+	IF p_start IS NULL OR p_end IS NULL OR p_end <= p_start THEN
+		RETURN QUERY SELECT 'bad_dates', NULL::VARCHAR, v_renter, NULL::NUMERIC, NULL::NUMERIC;
+		RETURN;
+	END IF;
+
+	PERFORM set_config('lock_timeout', '2s', TRUE);
+	PERFORM 1 FROM Property p WHERE p.PropId = p_prop_id FOR UPDATE;
+	IF NOT FOUND THEN
+		RETURN QUERY SELECT 'not_found', NULL::VARCHAR, v_renter, NULL::NUMERIC, NULL::NUMERIC;
+		RETURN;
+	END IF;
+
+	SELECT pl.Price, pl.Availablity INTO v_price, v_avail
+	FROM property_listing pl WHERE pl.PropId = p_prop_id;
+	IF NOT COALESCE(v_avail, FALSE) THEN
+		RETURN QUERY SELECT 'unavailable', NULL::VARCHAR, v_renter, NULL::NUMERIC, NULL::NUMERIC;
+		RETURN;
+	END IF;
+
+	v_book := COALESCE(p_book_id, next_id('booking'));
+	v_cost := round(v_price * (p_end - p_start) / 30.0, 2);
+	INSERT INTO Booking(RenterID, BookID, PropId, StartDate, EndDate, Mode_of_pay, TotalCost)
+	VALUES (v_renter, v_book, p_prop_id, p_start, p_end, p_mode, v_cost);
+
+	IF p_mode = 'Credit' THEN
+		INSERT INTO CreditCard(RenterID, Card_name, Card_no, exp_date, cvv)
+		VALUES (v_renter, p_card_name, p_card_no, p_exp_date, p_cvv)
+		ON CONFLICT DO NOTHING;
+	END IF;
+
+	INSERT INTO Rewards AS rw (R_id, Reward_Points) VALUES (v_renter, 100)
+	ON CONFLICT (R_id) DO UPDATE SET Reward_Points = rw.Reward_Points + 100
+	RETURNING rw.Reward_Points INTO v_points;
+
+	RETURN QUERY SELECT 'booked', v_book, v_renter, v_cost, v_points;
+EXCEPTION
+	WHEN lock_not_available THEN
+		RETURN QUERY SELECT 'busy', NULL::VARCHAR, v_renter, NULL::NUMERIC, NULL::NUMERIC;
+	WHEN exclusion_violation THEN
+		RETURN QUERY SELECT 'unavailable', NULL::VARCHAR, v_renter, NULL::NUMERIC, NULL::NUMERIC;
+END;
+$$ LANGUAGE plpgsql;
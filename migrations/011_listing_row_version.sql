@@ -0,0 +1,6 @@
+-- Optimistic concurrency for listing edits (queries.save_listing). Every
+-- write to a listing's Property, subtype or Neighbourhood row through the
+-- app bumps Property.RowVersion; a save only applies if the version it was
+-- loaded with is still current.
+
+ALTER TABLE Property ADD COLUMN RowVersion bigint NOT NULL DEFAULT 1;
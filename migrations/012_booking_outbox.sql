@@ -0,0 +1,109 @@
+-- Transactional outbox for booking side effects. book_property() and
+-- cancel_booking() only record what has to happen; outbox_worker.py
+-- applies it (reward points and the receipt) in batches.
+-- IdempotencyKey makes enqueueing the same effect twice a no-op, and the
+-- worker marks an event processed in the transaction that applies it.
+
+CREATE TABLE outbox
+	(EventID BIGSERIAL,
+	 Kind VARCHAR(30),
+	 IdempotencyKey VARCHAR(100) NOT NULL,
+	 Payload jsonb,
+	 CreatedAt TIMESTAMP DEFAULT now(),
+	 Attempts INT DEFAULT 0,
+	 NextAttemptAt TIMESTAMP DEFAULT now(),
+	 LastError TEXT,
+	 ProcessedAt TIMESTAMP,
+	 PRIMARY KEY(EventID),
+	 UNIQUE(IdempotencyKey));
+
+CREATE INDEX outbox_pending_idx ON outbox (NextAttemptAt, EventID) WHERE ProcessedAt IS NULL;
+
+CREATE TABLE booking_receipts
+	(BookID VARCHAR(10),
+	 RenterID VARCHAR(10),
+	 Body jsonb,
+	 CreatedAt TIMESTAMP DEFAULT now(),
+	 PRIMARY KEY(BookID));
+
+CREATE FUNCTION enqueue(p_kind VARCHAR, p_key VARCHAR, p_payload jsonb) RETURNS void AS $$
+BEGIN
+	INSERT INTO outbox(Kind, IdempotencyKey, Payload) VALUES (p_kind, p_key, p_payload)
+	ON CONFLICT (IdempotencyKey) DO NOTHING;
+	PERFORM pg_notify('outbox', p_kind);
+END;
+$$ LANGUAGE plpgsql;
+
+-- As in 010, minus the side effects, which are now queued. points is
+-- always NULL: rewards are credited by the worker.
+CREATE OR REPLACE FUNCTION book_property(
+	p_email     VARCHAR,
+	p_prop_id   VARCHAR,
+	p_book_id   VARCHAR,
+	p_start     DATE,
+	p_end       DATE,
+	p_mode      VARCHAR,
+	p_card_name VARCHAR DEFAULT NULL,
+	p_card_no   NUMERIC DEFAULT NULL,
+	p_exp_date  DATE    DEFAULT NULL,
+	p_cvv       NUMERIC DEFAULT NULL)
+RETURNS TABLE(status TEXT, booking_id VARCHAR, renter_id VARCHAR, amount NUMERIC, points NUMERIC)
+AS $$
+DECLARE
+	v_renter VARCHAR;
+	v_price  NUMERIC;
+	v_avail  BOOLEAN;
+	v_book   VARCHAR;
+	v_cost   NUMERIC;
+BEGIN
+	SELECT r.RenterID INTO v_renter FROM Renter r WHERE r.Email = p_email;
+	IF v_renter IS NULL THEN
+		RETURN QUERY SELECT 'no_renter', NULL::VARCHAR, NULL::VARCHAR, NULL::NUMERIC, NULL::NUMERIC;
+		RETURN;
+	END IF;
+
+	IF p_start IS NULL OR p_end IS NULL OR p_end <= p_start THEN
+		RETURN QUERY SELECT 'bad_dates', NULL::VARCHAR, v_renter, NULL::NUMERIC, NULL::NUMERIC;
+		RETURN;
+	END IF;
+
+	PERFORM set_config('lock_timeout', '2s', TRUE);
+	PERFORM 1 FROM Property p WHERE p.PropId = p_prop_id FOR UPDATE;
+	IF NOT FOUND THEN
+		RETURN QUERY SELECT 'not_found', NULL::VARCHAR, v_renter, NULL::NUMERIC, NULL::NUMERIC;
+		RETURN;
+	END IF;
+
+	SELECT pl.Price, pl.Availablity INTO v_price, v_avail
+	FROM property_listing pl WHERE pl.PropId = p_prop_id;
+	IF NOT COALESCE(v_avail, FALSE) THEN
+		RETURN QUERY SELECT 'unavailable', NULL::VARCHAR, v_renter, NULL::NUMERIC, NULL::NUMERIC;
+		RETURN;
+	END IF;
+
+	v_book := COALESCE(p_book_id, next_id('booking'));
+	v_cost := round(v_price * (p_end - p_start) / 30.0, 2);
+	INSERT INTO Booking(RenterID, BookID, PropId, StartDate, EndDate, Mode_of_pay, TotalCost)
+	VALUES (v_renter, v_book, p_prop_id, p_start, p_end, p_mode, v_cost);
+
+	-- The card is saved here rather than through the outbox, so card
+	-- details never sit in a queued payload.
+	IF p_mode = 'Credit' THEN
+		INSERT INTO CreditCard(RenterID, Card_name, Card_no, exp_date, cvv)
+		VALUES (v_renter, p_card_name, p_card_no, p_exp_date, p_cvv)
+		ON CONFLICT DO NOTHING;
+	END IF;
+	PERFORM enqueue('rewards', 'booking:' || v_book || ':rewards',
+	                jsonb_build_object('renter_id', v_renter, 'delta', 100));
+	PERFORM enqueue('receipt', 'booking:' || v_book || ':receipt',
+	                jsonb_build_object('booking_id', v_book,
+	                                   'card_last4', right(p_card_no::text, 4)));
+
+	RETURN QUERY SELECT 'booked', v_book, v_renter, v_cost, NULL::NUMERIC;
+EXCEPTION
+	WHEN lock_not_available THEN
+		RETURN QUERY SELECT 'busy', NULL::VARCHAR, v_renter, NULL::NUMERIC, NULL::NUMERIC;
+	WHEN exclusion_violation THEN
+		RETURN QUERY SELECT 'unavailable', NULL::VARCHAR, v_renter, NULL::NUMERIC, NULL::NUMERIC;
+END;
+$$ LANGUAGE plpgsql;
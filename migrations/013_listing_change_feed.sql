@@ -0,0 +1,62 @@
+-- Change feed for open listing views (feed.py). Updates and deletes on
+-- Property and the subtype tables NOTIFY 'listing_changes' with compact
+-- JSON arrays of
+--   {"pid": ..., "changed": ["price", ...], "price": ..., "available": ...}
+-- (price/available only from subtype tables) or {"pid": ..., "op": "delete"}.
+-- Arrays are chunked to stay well under the 8000-byte payload limit, and
+-- updates that change nothing (or only RowVersion) are skipped. Inserts
+-- are not fed: no open view can be showing a listing that did not exist.
+
+CREATE FUNCTION listing_change_feed() RETURNS trigger AS $$
+DECLARE
+	changes jsonb;
+	i INT;
+BEGIN
+	IF TG_OP = 'DELETE' THEN
+		EXECUTE format('SELECT jsonb_agg(jsonb_build_object(''pid'', %I, ''op'', ''delete'')) '
+		               'FROM old_rows', TG_ARGV[0]) INTO changes;
+	ELSE
+		EXECUTE format($f$
+			SELECT jsonb_agg(jsonb_strip_nulls(jsonb_build_object(
+				'pid', c.id, 'changed', c.changed,
+				'price', c.nj -> 'price', 'available', c.nj -> 'availablity')))
+			FROM (
+				SELECT n.%1$I AS id, to_jsonb(n) AS nj,
+				       (SELECT jsonb_agg(e.key) FROM jsonb_each(to_jsonb(n)) e
+				        WHERE e.key NOT IN (%2$L, 'rowversion')
+				          AND e.value IS DISTINCT FROM to_jsonb(o) -> e.key) AS changed
+				FROM new_rows n JOIN old_rows o ON o.%1$I = n.%1$I
+			) c
+			WHERE c.changed IS NOT NULL
+		$f$, TG_ARGV[0], TG_ARGV[0]) INTO changes;
+	END IF;
+	IF changes IS NULL THEN
+		RETURN NULL;
+	END IF;
+	FOR i IN 0 .. (jsonb_array_length(changes) - 1) / 25 LOOP
+		PERFORM pg_notify('listing_changes', (
+			SELECT jsonb_agg(t.c ORDER BY t.n)::text
+			FROM jsonb_array_elements(changes) WITH ORDINALITY AS t(c, n)
+			WHERE t.n > i * 25 AND t.n <= (i + 1) * 25));
+	END LOOP;
+	RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DO $$
+DECLARE
+	t RECORD;
+BEGIN
+	FOR t IN SELECT * FROM (VALUES
+		('property', 'propid'), ('vachome', 'vachomeid'), ('houses', 'houseid'),
+		('apartments', 'aptid'), ('commbuildings', 'buildid')
+	) AS v(tbl, col) LOOP
+		EXECUTE format('CREATE TRIGGER listing_feed_upd AFTER UPDATE ON %I '
+		               'REFERENCING NEW TABLE AS new_rows OLD TABLE AS old_rows FOR EACH STATEMENT '
+		               'EXECUTE FUNCTION listing_change_feed(%L)', t.tbl, t.col);
+		EXECUTE format('CREATE TRIGGER listing_feed_del AFTER DELETE ON %I '
+		               'REFERENCING OLD TABLE AS old_rows FOR EACH STATEMENT '
+		               'EXECUTE FUNCTION listing_change_feed(%L)', t.tbl, t.col);
+	END LOOP;
+END;
+$$;
@@ -0,0 +1,201 @@
+-- Booking is range-partitioned by StartDate, one partition per month
+-- (booking_YYYY_MM) plus booking_default for anything beyond the last
+-- one. booking_partitions.py creates partitions ahead of time and moves
+-- months whose stays have all ended into booking_archive, which has the
+-- same shape; moving a partition is a detach/attach, no rows are copied.
+--
+-- The primary key has to include the partition key, so it becomes
+-- (BookID, StartDate); BookIDs still come from booking_id_seq. Exclusion
+-- constraints cannot span partitions, so each partition keeps its own and
+-- book_property() checks for overlaps across partitions under the
+-- Property row lock it already takes.
+
+ALTER TABLE Booking RENAME TO booking_unpartitioned;
+ALTER TABLE booking_unpartitioned DROP CONSTRAINT booking_no_overlap;
+ALTER INDEX booking_pkey RENAME TO booking_unpartitioned_pkey;
+DROP INDEX booking_renterid_idx;
+DROP INDEX booking_propid_idx;
+
+CREATE TABLE Booking
+	(RenterID VARCHAR(10),
+	 BookID VARCHAR(10),
+	 PropId VARCHAR(10),
+	 StartDate DATE NOT NULL,
+	 EndDate DATE,
+	 Mode_of_pay VARCHAR(10),
+	 TotalCost numeric(12,2),
+	 Period daterange GENERATED ALWAYS AS (daterange(StartDate, EndDate, '[)')) STORED,
+	 PRIMARY KEY(BookID, StartDate),
+	 FOREIGN KEY(RenterID) references Renter,
+	 FOREIGN KEY (PropId) REFERENCES Property(PropId))
+	PARTITION BY RANGE (StartDate);
+
+CREATE INDEX booking_renterid_idx ON Booking (RenterID, StartDate);
+CREATE INDEX booking_propid_idx   ON Booking (PropId);
+
+CREATE TABLE booking_default PARTITION OF Booking DEFAULT;
+ALTER TABLE booking_default ADD CONSTRAINT booking_default_no_overlap
+	EXCLUDE USING gist (PropId WITH =, Period WITH &&);
+
+CREATE TABLE booking_archive (LIKE Booking INCLUDING DEFAULTS INCLUDING GENERATED)
+	PARTITION BY RANGE (StartDate);
+ALTER TABLE booking_archive ADD PRIMARY KEY (BookID, StartDate);
+CREATE INDEX booking_archive_renterid_idx ON booking_archive (RenterID, StartDate);
+CREATE INDEX booking_archive_propid_idx   ON booking_archive (PropId);
+
+-- Creates the partition for the month holding p_month, moving any rows
+-- for it out of booking_default first. NULL if it already exists.
+CREATE FUNCTION booking_partition_create(p_month DATE) RETURNS TEXT AS $$
+DECLARE
+	lo   DATE := date_trunc('month', p_month);
+	hi   DATE := date_trunc('month', p_month) + INTERVAL '1 month';
+	part TEXT := 'booking_' || to_char(p_month, 'YYYY_MM');
+BEGIN
+	IF to_regclass(part) IS NOT NULL THEN
+		RETURN NULL;
+	END IF;
+	EXECUTE format('CREATE TABLE %I (LIKE Booking INCLUDING DEFAULTS INCLUDING GENERATED)', part);
+	EXECUTE format('ALTER TABLE %I ADD CONSTRAINT %I EXCLUDE USING gist (PropId WITH =, Period WITH &&)',
+	               part, part || '_no_overlap');
+	EXECUTE format('WITH moved AS (DELETE FROM booking_default WHERE StartDate >= %L AND StartDate < %L '
+	               'RETURNING RenterID, BookID, PropId, StartDate, EndDate, Mode_of_pay, TotalCost) '
+	               'INSERT INTO %I (RenterID, BookID, PropId, StartDate, EndDate, Mode_of_pay, TotalCost) '
+	               'SELECT * FROM moved', lo, hi, part);
+	EXECUTE format('ALTER TABLE Booking ATTACH PARTITION %I FOR VALUES FROM (%L) TO (%L)', part, lo, hi);
+	RETURN part;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Partitions from the earliest month with rows in booking_default (or the
+-- current month) through p_ahead months from now. Returns those created.
+CREATE FUNCTION booking_partitions_ensure(p_ahead INT DEFAULT 12) RETURNS SETOF TEXT AS $$
+	SELECT part
+	FROM generate_series(
+		date_trunc('month', LEAST(current_date, (SELECT min(StartDate) FROM booking_default))),
+		date_trunc('month', current_date) + make_interval(months => p_ahead),
+		INTERVAL '1 month') AS m,
+	     booking_partition_create(m::date) AS part
+	WHERE part IS NOT NULL;
+$$ LANGUAGE sql;
+
+-- Moves every monthly partition that ended before this month and whose
+-- stays have all checked out into booking_archive, optionally onto an
+-- archive tablespace (table and indexes). Returns those moved.
+CREATE FUNCTION booking_partitions_archive(p_tablespace TEXT DEFAULT NULL) RETURNS SETOF TEXT AS $$
+DECLARE
+	part  RECORD;
+	idx   REGCLASS;
+	ended BOOLEAN;
+BEGIN
+	FOR part IN
+		SELECT c.relname, pg_get_expr(c.relpartbound, c.oid) AS bound
+		FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid
+		WHERE i.inhparent = 'booking'::regclass
+		  AND c.relname ~ '^booking_[0-9]{4}_[0-9]{2}$'
+		  AND c.relname < 'booking_' || to_char(current_date, 'YYYY_MM')
+		ORDER BY c.relname
+	LOOP
+		EXECUTE format('SELECT NOT EXISTS (SELECT 1 FROM %I WHERE EndDate > current_date)',
+		               part.relname) INTO ended;
+		CONTINUE WHEN NOT ended;
+		EXECUTE format('ALTER TABLE Booking DETACH PARTITION %I', part.relname);
+		IF p_tablespace IS NOT NULL THEN
+			EXECUTE format('ALTER TABLE %I SET TABLESPACE %I', part.relname, p_tablespace);
+			FOR idx IN SELECT indexrelid::regclass FROM pg_index
+			           WHERE indrelid = part.relname::regclass LOOP
+				EXECUTE format('ALTER INDEX %s SET TABLESPACE %I', idx, p_tablespace);
+			END LOOP;
+		END IF;
+		EXECUTE format('ALTER TABLE booking_archive ATTACH PARTITION %I %s', part.relname, part.bound);
+		RETURN NEXT part.relname;
+	END LOOP;
+END;
+$$ LANGUAGE plpgsql;
+
+SELECT booking_partition_create(m::date)
+FROM generate_series(
+	date_trunc('month', LEAST(current_date, (SELECT min(StartDate) FROM booking_unpartitioned))),
+	date_trunc('month', current_date) + INTERVAL '12 months',
+	INTERVAL '1 month') AS m;
+
+INSERT INTO Booking (RenterID, BookID, PropId, StartDate, EndDate, Mode_of_pay, TotalCost)
+	SELECT RenterID, BookID, PropId, StartDate, EndDate, Mode_of_pay, TotalCost
+	FROM booking_unpartitioned;
+DROP TABLE booking_unpartitioned;
+ANALYZE Booking;
+
+-- As in 012, plus the cross-partition overlap check.
+CREATE OR REPLACE FUNCTION book_property(
+	p_email     VARCHAR,
+	p_prop_id   VARCHAR,
+	p_book_id   VARCHAR,
+	p_start     DATE,
+	p_end       DATE,
+	p_mode      VARCHAR,
+	p_card_name VARCHAR DEFAULT NULL,
+	p_card_no   NUMERIC DEFAULT NULL,
+	p_exp_date  DATE    DEFAULT NULL,
+	p_cvv       NUMERIC DEFAULT NULL)
+RETURNS TABLE(status TEXT, booking_id VARCHAR, renter_id VARCHAR, amount NUMERIC, points NUMERIC)
+AS $$
+DECLARE
+	v_renter VARCHAR;
+	v_price  NUMERIC;
+	v_avail  BOOLEAN;
+	v_book   VARCHAR;
+	v_cost   NUMERIC;
+BEGIN
+	SELECT r.RenterID INTO v_renter FROM Renter r WHERE r.Email = p_email;
+	IF v_renter IS NULL THEN
+		RETURN QUERY SELECT 'no_renter', NULL::VARCHAR, NULL::VARCHAR, NULL::NUMERIC, NULL::NUMERIC;
+		RETURN;
+	END IF;
+
+	IF p_start IS NULL OR p_end IS NULL OR p_end <= p_start THEN
+		RETURN QUERY SELECT 'bad_dates', NULL::VARCHAR, v_renter, NULL::NUMERIC, NULL::NUMERIC;
+		RETURN;
+	END IF;
+
+	PERFORM set_config('lock_timeout', '2s', TRUE);
+	PERFORM 1 FROM Property p WHERE p.PropId = p_prop_id FOR UPDATE;
+	IF NOT FOUND THEN
+		RETURN QUERY SELECT 'not_found', NULL::VARCHAR, v_renter, NULL::NUMERIC, NULL::NUMERIC;
+		RETURN;
+	END IF;
+
+	SELECT pl.Price, pl.Availablity INTO v_price, v_avail
+	FROM property_listing pl WHERE pl.PropId = p_prop_id;
+	IF NOT COALESCE(v_avail, FALSE) OR EXISTS (
+		SELECT 1 FROM Booking b
+		WHERE b.PropId = p_prop_id AND b.StartDate < p_end
+		  AND b.Period && daterange(p_start, p_end, '[)')) THEN
+		RETURN QUERY SELECT 'unavailable', NULL::VARCHAR, v_renter, NULL::NUMERIC, NULL::NUMERIC;
+		RETURN;
+	END IF;
+
+	v_book := COALESCE(p_book_id, next_id('booking'));
+	v_cost := round(v_price * (p_end - p_start) / 30.0, 2);
+	INSERT INTO Booking(RenterID, BookID, PropId, StartDate, EndDate, Mode_of_pay, TotalCost)
+	VALUES (v_renter, v_book, p_prop_id, p_start, p_end, p_mode, v_cost);
+
+	-- The card is saved here rather than through the outbox, so card
+	-- details never sit in a queued payload.
+	IF p_mode = 'Credit' THEN
+		INSERT INTO CreditCard(RenterID, Card_name, Card_no, exp_date, cvv)
+		VALUES (v_renter, p_card_name, p_card_no, p_exp_date, p_cvv)
+		ON CONFLICT DO NOTHING;
+	END IF;
+	PERFORM enqueue('rewards', 'booking:' || v_book || ':rewards',
+	                jsonb_build_object('renter_id', v_renter, 'delta', 100));
+	PERFORM enqueue('receipt', 'booking:' || v_book || ':receipt',
+	                jsonb_build_object('booking_id', v_book,
+	                                   'card_last4', right(p_card_no::text, 4)));
+
+	RETURN QUERY SELECT 'booked', v_book, v_renter, v_cost, NULL::NUMERIC;
+EXCEPTION
+	WHEN lock_not_available THEN
+		RETURN QUERY SELECT 'busy', NULL::VARCHAR, v_renter, NULL::NUMERIC, NULL::NUMERIC;
+	WHEN exclusion_violation THEN
+		RETURN QUERY SELECT 'unavailable', NULL::VARCHAR, v_renter, NULL::NUMERIC, NULL::NUMERIC;
+END;
+$$ LANGUAGE plpgsql;
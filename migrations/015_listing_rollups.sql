@@ -0,0 +1,237 @@
+-- Agency and market analytics (analytics.py, the dashboard page): listing
+-- and booking totals per agency, city and property type in
+-- listing_rollup. Averages and ratios are derived from the stored sums
+-- and counts, so every change folds in exactly. Keys are '' where the
+-- listing has no agency, city or type.
+--
+-- Statement-level triggers on property_listing and Booking append net
+-- deltas to listing_rollup_delta; listing_rollup_fold() (analytics.py
+-- fold) applies them. Writers only ever append, so bookings never queue
+-- on a shared rollup row. listing_rollup_source is the full recompute the
+-- consistency check compares against.
+
+CREATE TABLE listing_rollup
+	(AgencyName VARCHAR(25) NOT NULL,
+	 City VARCHAR(12) NOT NULL,
+	 PropType VARCHAR(15) NOT NULL,
+	 Listings BIGINT NOT NULL DEFAULT 0,
+	 Available BIGINT NOT NULL DEFAULT 0,
+	 PriceSum NUMERIC NOT NULL DEFAULT 0,
+	 PriceCount BIGINT NOT NULL DEFAULT 0,
+	 SqftSum NUMERIC NOT NULL DEFAULT 0,
+	 SqftCount BIGINT NOT NULL DEFAULT 0,
+	 Bookings BIGINT NOT NULL DEFAULT 0,
+	 Revenue NUMERIC NOT NULL DEFAULT 0,
+	 UpdatedAt TIMESTAMP DEFAULT now(),
+	 PRIMARY KEY(AgencyName, City, PropType));
+
+CREATE TABLE listing_rollup_delta
+	(DeltaID BIGSERIAL,
+	 AgencyName VARCHAR(25) NOT NULL,
+	 City VARCHAR(12) NOT NULL,
+	 PropType VARCHAR(15) NOT NULL,
+	 Listings BIGINT NOT NULL DEFAULT 0,
+	 Available BIGINT NOT NULL DEFAULT 0,
+	 PriceSum NUMERIC NOT NULL DEFAULT 0,
+	 PriceCount BIGINT NOT NULL DEFAULT 0,
+	 SqftSum NUMERIC NOT NULL DEFAULT 0,
+	 SqftCount BIGINT NOT NULL DEFAULT 0,
+	 Bookings BIGINT NOT NULL DEFAULT 0,
+	 Revenue NUMERIC NOT NULL DEFAULT 0,
+	 PRIMARY KEY(DeltaID));
+
+-- Live and archived bookings (migrations/014_booking_partitions.sql);
+-- archiving a month moves no rows, so it changes no totals.
+CREATE VIEW all_bookings AS
+	SELECT RenterID, BookID, PropId, StartDate, EndDate, Mode_of_pay, TotalCost FROM Booking
+	UNION ALL
+	SELECT RenterID, BookID, PropId, StartDate, EndDate, Mode_of_pay, TotalCost FROM booking_archive;
+
+CREATE VIEW listing_rollup_source AS
+	SELECT COALESCE(l.AgencyName, '') AS AgencyName, COALESCE(l.City, '') AS City,
+	       COALESCE(l.PropType, '') AS PropType,
+	       count(*) AS Listings, count(*) FILTER (WHERE l.Availablity) AS Available,
+	       COALESCE(sum(l.Price), 0) AS PriceSum, count(l.Price) AS PriceCount,
+	       COALESCE(sum(l.SqFootage), 0) AS SqftSum, count(l.SqFootage) AS SqftCount,
+	       COALESCE(sum(b.n), 0) AS Bookings, COALESCE(sum(b.revenue), 0) AS Revenue
+	FROM property_listing l
+	LEFT JOIN (
+		SELECT PropId, count(*) AS n, COALESCE(sum(TotalCost), 0) AS revenue
+		FROM all_bookings GROUP BY PropId
+	) b ON b.PropId = l.PropId
+	GROUP BY 1, 2, 3;
+
+-- A listing carries its bookings with it: leaving a group takes them out,
+-- joining one brings them in. Old and new rows are read in one statement,
+-- hence one snapshot, so an UPDATE that keeps the key nets to zero.
+CREATE FUNCTION listing_rollup_listing_delta() RETURNS trigger AS $$
+DECLARE
+	src TEXT;
+BEGIN
+	src := CASE TG_OP
+		WHEN 'INSERT' THEN 'SELECT *, 1 AS sign FROM new_rows'
+		WHEN 'DELETE' THEN 'SELECT *, -1 AS sign FROM old_rows'
+		ELSE 'SELECT *, -1 AS sign FROM old_rows UNION ALL SELECT *, 1 FROM new_rows'
+	END;
+	EXECUTE format($q$
+		INSERT INTO listing_rollup_delta
+			(AgencyName, City, PropType, Listings, Available, PriceSum, PriceCount,
+			 SqftSum, SqftCount, Bookings, Revenue)
+		SELECT * FROM (
+			SELECT COALESCE(l.AgencyName, ''), COALESCE(l.City, ''), COALESCE(l.PropType, ''),
+			       sum(l.sign), COALESCE(sum(l.sign) FILTER (WHERE l.Availablity), 0),
+			       COALESCE(sum(l.sign * l.Price), 0),
+			       COALESCE(sum(l.sign) FILTER (WHERE l.Price IS NOT NULL), 0),
+			       COALESCE(sum(l.sign * l.SqFootage), 0),
+			       COALESCE(sum(l.sign) FILTER (WHERE l.SqFootage IS NOT NULL), 0),
+			       COALESCE(sum(l.sign * b.n), 0), COALESCE(sum(l.sign * b.revenue), 0)
+			FROM (%s) l
+			CROSS JOIN LATERAL (
+				SELECT count(*) AS n, COALESCE(sum(TotalCost), 0) AS revenue
+				FROM all_bookings WHERE PropId = l.PropId
+			) b
+			GROUP BY 1, 2, 3
+		) d (a, c, t, listings, available, price_sum, price_n, sqft_sum, sqft_n, bookings, revenue)
+		WHERE (listings, available, price_sum, price_n, sqft_sum, sqft_n, bookings, revenue)
+		      <> (0, 0, 0, 0, 0, 0, 0, 0)
+	$q$, src);
+	RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Bookings count towards their listing's current group. A property's
+-- bookings have to go before the property itself (Booking's foreign key),
+-- so the listing is always there to say which group that is.
+CREATE FUNCTION listing_rollup_booking_delta() RETURNS trigger AS $$
+DECLARE
+	src TEXT;
+BEGIN
+	src := CASE TG_OP
+		WHEN 'INSERT' THEN 'SELECT PropId, TotalCost, 1 AS sign FROM new_rows'
+		WHEN 'DELETE' THEN 'SELECT PropId, TotalCost, -1 AS sign FROM old_rows'
+		ELSE 'SELECT PropId, TotalCost, -1 AS sign FROM old_rows '
+		     'UNION ALL SELECT PropId, TotalCost, 1 FROM new_rows'
+	END;
+	EXECUTE format($q$
+		INSERT INTO listing_rollup_delta (AgencyName, City, PropType, Bookings, Revenue)
+		SELECT * FROM (
+			SELECT COALESCE(l.AgencyName, ''), COALESCE(l.City, ''), COALESCE(l.PropType, ''),
+			       sum(b.sign), COALESCE(sum(b.sign * b.TotalCost), 0)
+			FROM (%s) b
+			JOIN property_listing l ON l.PropId = b.PropId
+			GROUP BY 1, 2, 3
+		) d (a, c, t, bookings, revenue)
+		WHERE (bookings, revenue) <> (0, 0)
+	$q$, src);
+	RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER listing_rollup_ins AFTER INSERT ON property_listing
+	REFERENCING NEW TABLE AS new_rows FOR EACH STATEMENT
+	EXECUTE FUNCTION listing_rollup_listing_delta();
+CREATE TRIGGER listing_rollup_upd AFTER UPDATE ON property_listing
+	REFERENCING NEW TABLE AS new_rows OLD TABLE AS old_rows FOR EACH STATEMENT
+	EXECUTE FUNCTION listing_rollup_listing_delta();
+CREATE TRIGGER listing_rollup_del AFTER DELETE ON property_listing
+	REFERENCING OLD TABLE AS old_rows FOR EACH STATEMENT
+	EXECUTE FUNCTION listing_rollup_listing_delta();
+
+CREATE TRIGGER listing_rollup_ins AFTER INSERT ON Booking
+	REFERENCING NEW TABLE AS new_rows FOR EACH STATEMENT
+	EXECUTE FUNCTION listing_rollup_booking_delta();
+CREATE TRIGGER listing_rollup_upd AFTER UPDATE ON Booking
+	REFERENCING NEW TABLE AS new_rows OLD TABLE AS old_rows FOR EACH STATEMENT
+	EXECUTE FUNCTION listing_rollup_booking_delta();
+CREATE TRIGGER listing_rollup_del AFTER DELETE ON Booking
+	REFERENCING OLD TABLE AS old_rows FOR EACH STATEMENT
+	EXECUTE FUNCTION listing_rollup_booking_delta();
+
+-- As in 005, but rows that did not change are left alone, so the triggers
+-- above (and the table) see no churn from refreshes that change nothing.
+CREATE OR REPLACE FUNCTION refresh_property_listings(pids VARCHAR[]) RETURNS void AS $$
+BEGIN
+	DELETE FROM property_listing l
+	WHERE l.PropId = ANY(pids)
+	  AND NOT EXISTS (SELECT 1 FROM Property p WHERE p.PropId = l.PropId);
+	INSERT INTO property_listing AS l
+		SELECT * FROM property_listing_source WHERE PropId = ANY(pids)
+	ON CONFLICT (PropId) DO UPDATE SET
+		(PropType, Description, City, State_, address, NoOfRooms, SqFootage, Price,
+		 Availablity, AgentID, AgentName, AgencyName, CrimeRate, NearbySchool, Hospital,
+		 Park, mart)
+		= (EXCLUDED.PropType, EXCLUDED.Description, EXCLUDED.City, EXCLUDED.State_,
+		   EXCLUDED.address, EXCLUDED.NoOfRooms, EXCLUDED.SqFootage, EXCLUDED.Price,
+		   EXCLUDED.Availablity, EXCLUDED.AgentID, EXCLUDED.AgentName, EXCLUDED.AgencyName,
+		   EXCLUDED.CrimeRate, EXCLUDED.NearbySchool, EXCLUDED.Hospital, EXCLUDED.Park,
+		   EXCLUDED.mart)
+	WHERE (l.PropType, l.Description, l.City, l.State_, l.address, l.NoOfRooms, l.SqFootage,
+	       l.Price, l.Availablity, l.AgentID, l.AgentName, l.AgencyName, l.CrimeRate,
+	       l.NearbySchool, l.Hospital, l.Park, l.mart)
+	      IS DISTINCT FROM
+	      (EXCLUDED.PropType, EXCLUDED.Description, EXCLUDED.City, EXCLUDED.State_,
+	       EXCLUDED.address, EXCLUDED.NoOfRooms, EXCLUDED.SqFootage, EXCLUDED.Price,
+	       EXCLUDED.Availablity, EXCLUDED.AgentID, EXCLUDED.AgentName, EXCLUDED.AgencyName,
+	       EXCLUDED.CrimeRate, EXCLUDED.NearbySchool, EXCLUDED.Hospital, EXCLUDED.Park,
+	       EXCLUDED.mart);
+END;
+$$ LANGUAGE plpgsql;
+
+-- Applies every pending delta; returns how many. One fold at a time, the
+-- others return 0 straight away.
+CREATE FUNCTION listing_rollup_fold() RETURNS BIGINT AS $$
+DECLARE
+	folded BIGINT;
+BEGIN
+	IF NOT pg_try_advisory_xact_lock(hashtext('listing_rollup_fold')) THEN
+		RETURN 0;
+	END IF;
+	WITH d AS (
+		DELETE FROM listing_rollup_delta RETURNING *
+	), g AS (
+		SELECT AgencyName, City, PropType, count(*) AS n,
+		       sum(Listings) AS Listings, sum(Available) AS Available,
+		       sum(PriceSum) AS PriceSum, sum(PriceCount) AS PriceCount,
+		       sum(SqftSum) AS SqftSum, sum(SqftCount) AS SqftCount,
+		       sum(Bookings) AS Bookings, sum(Revenue) AS Revenue
+		FROM d GROUP BY AgencyName, City, PropType
+	), applied AS (
+		INSERT INTO listing_rollup AS r
+			(AgencyName, City, PropType, Listings, Available, PriceSum, PriceCount,
+			 SqftSum, SqftCount, Bookings, Revenue)
+		SELECT AgencyName, City, PropType, Listings, Available, PriceSum, PriceCount,
+		       SqftSum, SqftCount, Bookings, Revenue
+		FROM g
+		ON CONFLICT (AgencyName, City, PropType) DO UPDATE SET
+			Listings   = r.Listings   + EXCLUDED.Listings,
+			Available  = r.Available  + EXCLUDED.Available,
+			PriceSum   = r.PriceSum   + EXCLUDED.PriceSum,
+			PriceCount = r.PriceCount + EXCLUDED.PriceCount,
+			SqftSum    = r.SqftSum    + EXCLUDED.SqftSum,
+			SqftCount  = r.SqftCount  + EXCLUDED.SqftCount,
+			Bookings   = r.Bookings   + EXCLUDED.Bookings,
+			Revenue    = r.Revenue    + EXCLUDED.Revenue,
+			UpdatedAt  = now()
+	)
+	SELECT COALESCE(sum(n), 0) INTO folded FROM g;
+	DELETE FROM listing_rollup WHERE Listings = 0 AND Bookings = 0;
+	RETURN folded;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Recomputes everything from scratch (first load, bulk loads that bypass
+-- the triggers, repairing drift found by the check). The TRUNCATE waits
+-- for in-flight writers and holds off new ones until commit, so every
+-- change is counted either by the recompute or by a later delta.
+CREATE FUNCTION listing_rollup_rebuild() RETURNS void AS $$
+BEGIN
+	TRUNCATE listing_rollup_delta;
+	DELETE FROM listing_rollup;
+	INSERT INTO listing_rollup
+		(AgencyName, City, PropType, Listings, Available, PriceSum, PriceCount,
+		 SqftSum, SqftCount, Bookings, Revenue)
+		SELECT * FROM listing_rollup_source;
+END;
+$$ LANGUAGE plpgsql;
+
+SELECT listing_rollup_rebuild();
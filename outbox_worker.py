@@ -0,0 +1,169 @@
+import os
+import sys
+import json
+import time
+import select
+import argparse
+
+import psycopg2
+import psycopg2.extensions
+
+import db
+
+
+BATCH_SIZE    = int(os.getenv('OUTBOX_BATCH_SIZE', '100'))
+MAX_ATTEMPTS  = int(os.getenv('OUTBOX_MAX_ATTEMPTS', '10'))
+POLL_INTERVAL = float(os.getenv('OUTBOX_POLL_INTERVAL', '5'))
+MAX_BACKOFF   = 3600
+CHANNEL       = 'outbox'
+
+
+CLAIM_SQL = """
+    SELECT EventID, Kind, Payload, Attempts FROM outbox
+    WHERE ProcessedAt IS NULL AND NextAttemptAt <= now() AND Attempts < %s
+    ORDER BY NextAttemptAt, EventID
+    LIMIT %s
+    FOR UPDATE SKIP LOCKED
+"""
+
+
+def apply_rewards(cur, p):
+    # Deltas are applied as they are, unclamped: a cancellation's -100 can
+    # be applied before its booking's +100, and only the sum is meaningful.
+    cur.execute(
+        "INSERT INTO Rewards AS rw (R_id, Reward_Points) VALUES (%s, %s) "
+        "ON CONFLICT (R_id) DO UPDATE SET Reward_Points = rw.Reward_Points + %s",
+        (p['renter_id'], p['delta'], p['delta'])
+    )
+
+
+def apply_receipt(cur, p):
+    # Nothing to do if the booking was cancelled before the receipt was built.
+    cur.execute("""
+        INSERT INTO booking_receipts(BookID, RenterID, Body)
+        SELECT b.BookID, b.RenterID, jsonb_build_object(
+                   'booking_id', b.BookID, 'prop_id', b.PropId, 'prop_type', p.PropType,
+                   'start', b.StartDate, 'end', b.EndDate, 'mode', b.Mode_of_pay,
+                   'total', b.TotalCost, 'card_last4', %s::text)
+        FROM Booking b JOIN Property p ON p.PropId = b.PropId
+        WHERE b.BookID = %s
+        ON CONFLICT (BookID) DO NOTHING
+    """, (p.get('card_last4'), p['booking_id']))
+
+
+HANDLERS = {
+    'rewards': apply_rewards,
+    'receipt': apply_receipt,
+}
+
+
+def drain_once(conn, batch_size=BATCH_SIZE, max_attempts=MAX_ATTEMPTS):
+    # Claims up to batch_size due events, applies each under its own
+    # savepoint and commits effects and bookkeeping together, so an event
+    # is applied exactly once. SKIP LOCKED lets several workers share the
+    # queue. Returns (processed, failed).
+    done, failed = [], 0
+    with conn.cursor() as cur:
+        cur.execute(CLAIM_SQL, (max_attempts, batch_size))
+        events = cur.fetchall()
+        for event_id, kind, payload, attempts in events:
+            cur.execute("SAVEPOINT outbox_event")
+            try:
+                HANDLERS[kind](cur, payload)
+            except Exception as e:
+                # Any handler failure (including a null or malformed
+                # payload) only fails this event, which is retried later.
+                cur.execute("ROLLBACK TO SAVEPOINT outbox_event")
+                cur.execute(
+                    "UPDATE outbox SET Attempts = Attempts + 1, LastError = %s, "
+                    "NextAttemptAt = now() + make_interval(secs => %s) WHERE EventID = %s",
+                    (f"{type(e).__name__}: {e}"[:1000], min(2 ** attempts, MAX_BACKOFF), event_id)
+                )
+                failed += 1
+                continue
+            cur.execute("RELEASE SAVEPOINT outbox_event")
+            done.append(event_id)
+        if done:
+            cur.execute(
+                "UPDATE outbox SET ProcessedAt = now(), Attempts = Attempts + 1 "
+                "WHERE EventID = ANY(%s)",
+                (done,)
+            )
+    conn.commit()
+    return len(done), failed
+
+
+def stats(cur, max_attempts=MAX_ATTEMPTS):
+    cur.execute("""
+        SELECT count(*) FILTER (WHERE ProcessedAt IS NULL AND Attempts < %s),
+               count(*) FILTER (WHERE ProcessedAt IS NULL AND Attempts >= %s),
+               count(*) FILTER (WHERE ProcessedAt IS NOT NULL)
+        FROM outbox
+    """, (max_attempts, max_attempts))
+    pending, dead, processed = cur.fetchone()
+    return {'pending': pending, 'dead': dead, 'processed': processed}
+
+
+def drain(conn, batch_size=BATCH_SIZE, max_attempts=MAX_ATTEMPTS):
+    # Until nothing is due; used by --once and by tests against a local db.
+    totals = {'processed': 0, 'failed': 0}
+    while True:
+        processed, failed = drain_once(conn, batch_size, max_attempts)
+        totals['processed'] += processed
+        totals['failed'] += failed
+        if processed + failed < batch_size:
+            return totals
+
+
+def run_forever(batch_size, max_attempts):
+    # Drains whenever book_property()/cancel_booking() NOTIFY, and at least
+    # every POLL_INTERVAL seconds to pick up retries that have come due.
+    conn = listener = None
+    backoff = 1
+    while True:
+        try:
+            conn = db.connect()
+            listener = db.connect()
+            listener.set_isolation_level(psycopg2.extensions.ISOLATION_LEVEL_AUTOCOMMIT)
+            with listener.cursor() as cur:
+                cur.execute(f"LISTEN {CHANNEL}")
+            backoff = 1
+            while True:
+                drain(conn, batch_size, max_attempts)
+                if select.select([listener], [], [], POLL_INTERVAL) != ([], [], []):
+                    listener.poll()
+                    listener.notifies.clear()
+        except Exception as e:
+            print(f"outbox worker: {e!r}; reconnecting in {backoff}s", file=sys.stderr)
+            for c in (conn, listener):
+                if c is not None:
+                    c.close()
+            time.sleep(backoff)
+            backoff = min(backoff * 2, 30)
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description='Apply queued booking side effects.')
+    ap.add_argument('--batch-size', type=int, default=BATCH_SIZE)
+    ap.add_argument('--max-attempts', type=int, default=MAX_ATTEMPTS)
+    ap.add_argument('--once', action='store_true', help='drain what is due, then exit')
+    ap.add_argument('--stats', action='store_true', help='print queue counts and exit')
+    args = ap.parse_args(argv)
+
+    if args.stats or args.once:
+        conn = db.connect()
+        try:
+            report = {}
+            if args.once:
+                report = drain(conn, args.batch_size, args.max_attempts)
+            with conn.cursor() as cur:
+                report.update(stats(cur, args.max_attempts))
+            print(json.dumps(report))
+        finally:
+            conn.close()
+        return 0
+    run_forever(args.batch_size, args.max_attempts)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,569 @@
+import re
+
+from psycopg2.extras import execute_values
+
+
+TYPE_MAP = {
+    'VacHome':      ('VacHome',      'VacHomeId'),
+    'Houses':       ('Houses',       'HouseId'),
+    'Apartments':   ('Apartments',   'AptId'),
+    'CommBuildings':('CommBuildings','BuildId'),
+}
+
+
+# Reads come from the trigger-maintained property_listing read model
+# (migrations/002), so no subtype dispatch or joins are needed.
+LISTING_COLUMNS = """p.PropId, p.PropType, p.Description, p.City, p.State_,
+           p.Price, p.Availablity, p.AgentName, p.AgentID"""
+LISTING_SQL = f"""
+    SELECT {LISTING_COLUMNS}
+    FROM property_listing p
+"""
+
+
+def location_filters(city, state):
+    filters, params = [], []
+    if city and city.strip():
+        filters.append("p.City ILIKE %s")
+        params.append(f"%{city.strip()}%")
+    if state and state.strip():
+        filters.append("p.State_ ILIKE %s")
+        params.append(f"%{state.strip()}%")
+    return filters, params
+
+
+# Faceted search. `search` is a dict with any of: text, city, state, types,
+# price_min, price_max, rooms_min, sqft_min, sqft_max, available, max_crime,
+# amenities (names from AMENITY_BITS) and free_from/free_to (dates the
+# listing must have no booking in, check-out exclusive). Missing or None
+# means no filter.
+AMENITY_BITS  = {'school': 1, 'hospital': 2, 'park': 4, 'mart': 8}
+PRICE_BUCKETS = [1000, 2500, 5000, 10000, 25000]
+SQFT_BUCKETS  = [500, 1000, 2000, 5000]
+CRIME_BUCKETS = [2, 5, 10, 25]
+ROOMS_CAP     = 6       # the rooms facet groups 6 and more together
+# Facets count at most this many matches, the first by PropId, so a broad
+# search costs the same however large the catalogue grows. A capped count
+# is only a lower bound, and its breakdown covers that first part only.
+FACET_LIMIT   = 10000
+
+FACET_SQL = """
+    WITH page AS (
+        SELECT {columns}, {rank} AS rank
+        FROM property_listing p {cursor_join} {page_where}
+        ORDER BY {order} LIMIT %s
+    ), facets AS (
+        SELECT CASE 0 WHEN GROUPING(ptype) THEN 'type' WHEN GROUPING(rooms) THEN 'rooms'
+                      WHEN GROUPING(price) THEN 'price' WHEN GROUPING(sqft) THEN 'sqft'
+                      WHEN GROUPING(crime) THEN 'crime' ELSE 'total' END AS facet,
+               COALESCE(ptype, rooms::text, price::text, sqft::text, crime::text) AS bucket,
+               count(*) AS any_type,
+               count(*) FILTER (WHERE type_ok) AS n,
+               count(*) FILTER (WHERE type_ok AND available) AS available,
+               count(*) FILTER (WHERE type_ok AND amenities & 1 <> 0) AS school,
+               count(*) FILTER (WHERE type_ok AND amenities & 2 <> 0) AS hospital,
+               count(*) FILTER (WHERE type_ok AND amenities & 4 <> 0) AS park,
+               count(*) FILTER (WHERE type_ok AND amenities & 8 <> 0) AS mart
+        FROM (
+            SELECT p.PropType AS ptype, LEAST(p.NoOfRooms, {rooms_cap}) AS rooms,
+                   width_bucket(p.Price, %s::numeric[]) AS price,
+                   width_bucket(p.SqFootage, %s::numeric[]) AS sqft,
+                   width_bucket(p.CrimeRate, %s::numeric[]) AS crime,
+                   p.Availablity AS available, p.Amenities AS amenities,
+                   {type_ok} AS type_ok
+            FROM property_listing p {facet_where}
+            ORDER BY p.PropId LIMIT %s
+        ) f
+        GROUP BY GROUPING SETS ((ptype), (rooms), (price), (sqft), (crime), ())
+    )
+    SELECT *, NULL::json FROM page
+    UNION ALL
+    SELECT NULL, NULL, NULL, NULL, NULL, NULL, NULL, NULL, NULL, NULL,
+           (SELECT json_agg(facets) FROM facets)
+"""
+
+
+def text_query(text):
+    # "near park 3 bedroom" -> "near:* & park:* & 3:* & bedroom:*": every
+    # word must match, each as a prefix. Only word characters survive, so
+    # user input can never be tsquery syntax.
+    return ' & '.join(f"{w}:*" for w in re.findall(r'[^\W_]+', text or ''))
+
+
+def facet_filters(search):
+    # Everything except PropType: the type facet is disjunctive, so its
+    # counts ignore the type selection while every other facet honours it.
+    filters, params = location_filters(search.get('city'), search.get('state'))
+    tsquery = text_query(search.get('text'))
+    if tsquery:
+        filters.append("p.search_doc @@ to_tsquery('english', %s)")
+        params.append(tsquery)
+    for key, sql in (('price_min', "p.Price >= %s"), ('price_max', "p.Price <= %s"),
+                     ('rooms_min', "p.NoOfRooms >= %s"), ('sqft_min', "p.SqFootage >= %s"),
+                     ('sqft_max', "p.SqFootage <= %s"), ('max_crime', "p.CrimeRate <= %s")):
+        if search.get(key) is not None:
+            filters.append(sql)
+            params.append(search[key])
+    if search.get('available') is not None:
+        filters.append("p.Availablity" if search['available'] else "NOT p.Availablity")
+    if search.get('free_from') and search.get('free_to'):
+        # Probes the GiST indexes behind each partition's no-overlap
+        # constraint; the StartDate bound skips partitions after the window.
+        filters.append("NOT EXISTS (SELECT 1 FROM Booking b WHERE b.PropId = p.PropId "
+                       "AND b.StartDate < %s AND b.Period && daterange(%s, %s, '[)'))")
+        params += [search['free_to'], search['free_from'], search['free_to']]
+    mask = sum(AMENITY_BITS[a] for a in search.get('amenities') or ())
+    if mask:
+        filters.append("p.Amenities & %s = %s")
+        params += [mask, mask]
+    return filters, params
+
+
+def _bucket_label(bounds, i):
+    if i == 0:
+        return f"< {bounds[0]:,}"
+    if i >= len(bounds):
+        return f"{bounds[-1]:,}+"
+    return f"{bounds[i - 1]:,}–{bounds[i]:,}"
+
+
+def _facet_counts(raw):
+    facets = {'total': 0, 'capped': False, 'available': 0,
+              'amenities': dict.fromkeys(AMENITY_BITS, 0),
+              'type': {}, 'rooms': {}, 'price': {}, 'sqft': {}, 'crime': {}}
+    bounds = {'price': PRICE_BUCKETS, 'sqft': SQFT_BUCKETS, 'crime': CRIME_BUCKETS}
+    for f in sorted(raw or (), key=lambda f: (f['facet'], len(f['bucket'] or ''), f['bucket'] or '')):
+        name, bucket = f['facet'], f['bucket']
+        if name == 'total':
+            facets['total'], facets['available'] = f['n'], f['available']
+            facets['capped'] = f['any_type'] >= FACET_LIMIT
+            facets['amenities'] = {a: f[a] for a in AMENITY_BITS}
+        elif name == 'type' and bucket is not None:
+            facets['type'][bucket] = f['any_type']
+        elif bucket is not None and f['n']:
+            if name == 'rooms':
+                label = f"{bucket}+" if int(bucket) >= ROOMS_CAP else bucket
+            else:
+                label = _bucket_label(bounds[name], int(bucket))
+            facets[name][label] = f['n']
+    return facets
+
+
+def search_listings(cur, search, after=None, before=None, limit=20):
+    # One statement returns a keyset page (on PropId, no OFFSET) plus
+    # the facet counts over the whole result. With search text the page is
+    # ordered by ts_rank, and the cursor PropId's rank is recomputed in SQL
+    # so callers keep passing plain PropIds. Returns
+    # (rows, has_prev, has_next, facets); facets['capped'] says the counts
+    # stopped at FACET_LIMIT.
+    cur.execute(*search_statement(search, after, before, limit))
+    return search_result(cur.fetchall(), search, after, before, limit)
+
+
+# search_listings() in two halves, for drivers that execute differently
+# (api.py): the statement to run, and the shaping of what it returned.
+def search_statement(search, after=None, before=None, limit=20):
+    filters, params = facet_filters(search)
+    types = list(search.get('types') or ())
+    type_ok, type_params = ("p.PropType = ANY(%s)", [types]) if types else ("TRUE", [])
+    tsquery = text_query(search.get('text'))
+
+    page_filters, page_params = filters + ([type_ok] if types else []), params + type_params
+    forward = before is None
+    cursor = after if forward else before
+    rank, rank_params = "NULL::real", []
+    cursor_join, join_params = "", []
+    if tsquery:
+        rank, rank_params = "ts_rank(p.search_doc, to_tsquery('english', %s))", [tsquery]
+        order = f"rank {'DESC' if forward else 'ASC'}, p.PropId {'ASC' if forward else 'DESC'}"
+        if cursor is not None:
+            cursor_join = ("CROSS JOIN (SELECT ts_rank(c.search_doc, to_tsquery('english', %s)) "
+                           "AS rank FROM property_listing c WHERE c.PropId = %s) c")
+            join_params = [tsquery, cursor]
+            page_filters.append(f"({rank} {'<' if forward else '>'} c.rank OR "
+                                f"({rank} = c.rank AND p.PropId {'>' if forward else '<'} %s))")
+            page_params += rank_params * 2 + [cursor]
+    else:
+        order = f"p.PropId {'ASC' if forward else 'DESC'}"
+        if cursor is not None:
+            page_filters.append(f"p.PropId {'>' if forward else '<'} %s")
+            page_params.append(cursor)
+
+    def where(f):
+        return " WHERE " + " AND ".join(f) if f else ""
+
+    sql = FACET_SQL.format(columns=LISTING_COLUMNS, rank=rank, cursor_join=cursor_join,
+                           page_where=where(page_filters), order=order, rooms_cap=ROOMS_CAP,
+                           type_ok=type_ok, facet_where=where(filters))
+    return sql, (rank_params + join_params + page_params
+                 + [limit + 1, PRICE_BUCKETS, SQFT_BUCKETS, CRIME_BUCKETS] + type_params + params
+                 + [FACET_LIMIT])
+
+
+def search_result(result, search, after=None, before=None, limit=20):
+    rows = [r for r in result if r[0] is not None]
+    rows.sort(key=(lambda r: (-r[9], r[0])) if text_query(search.get('text')) else (lambda r: r[0]))
+    rows = [r[:9] for r in rows]
+    facets = _facet_counts(next((r[-1] for r in result if r[0] is None), None))
+    more = len(rows) > limit
+    if before is not None:
+        return rows[len(rows) - limit:] if more else rows, more, True, facets
+    return rows[:limit], after is not None, more, facets
+
+
+# Statements below are module constants so api.py runs exactly the same SQL.
+BY_ID_SQL = LISTING_SQL + " WHERE p.PropId = ANY(%s)"
+
+def fetch_listings_by_id(cur, pids):
+    cur.execute(BY_ID_SQL, (list(pids),))
+    return cur.fetchall()
+
+AGENCY_LISTINGS_SQL = (
+    "SELECT PropId, PropType, Description, City, State_, Price, Availablity "
+    "FROM property_listing WHERE AgencyName = %s ORDER BY PropId"
+)
+
+def fetch_agency_listings(cur, agency_name):
+    cur.execute(AGENCY_LISTINGS_SQL, (agency_name,))
+    return cur.fetchall()
+
+
+
+BOOK_SQL = "SELECT * FROM book_property(%s, %s, %s, %s, %s, %s, %s, %s, %s, %s)"
+
+def book_params(email, pid, book_id, start, end, mode, card=None):
+    card_name, card_no, exp_date, cvv = card or (None, None, None, None)
+    return (email, pid, book_id, start, end, mode, card_name, card_no, exp_date, cvv)
+
+def book_property(cur, email, pid, book_id, start, end, mode, card=None):
+    # Returns (status, booking_id, renter_id, total_cost, None); status is
+    # 'booked', 'unavailable' (closed, or those dates are taken),
+    # 'bad_dates', 'busy', 'not_found' or 'no_renter'. Reward points, the
+    # saved card and the receipt follow via the outbox (outbox_worker.py).
+    cur.execute(BOOK_SQL, book_params(email, pid, book_id, start, end, mode, card))
+    return cur.fetchone()
+
+
+BOOKED_PERIODS_SQL = (
+    "SELECT StartDate, EndDate FROM Booking "
+    "WHERE PropId = %s AND Period && daterange(current_date, NULL) ORDER BY StartDate"
+)
+
+def booked_periods(cur, pid):
+    # Upcoming and current bookings of one listing, as (start, end) with
+    # end the check-out date.
+    cur.execute(BOOKED_PERIODS_SQL, (pid,))
+    return cur.fetchall()
+
+
+CANCEL_SQL = "DELETE FROM Booking WHERE BookID = %s AND RenterID = %s RETURNING PropId"
+CANCEL_REWARDS_SQL = (
+    "SELECT enqueue('rewards', %s, jsonb_build_object('renter_id', %s::text, 'delta', -100))"
+)
+
+def cancel_rewards_params(book_id, renter_id):
+    return (f"cancel:{book_id}:rewards", renter_id)
+
+def cancel_booking(cur, book_id, renter_id):
+    # Deletes the renter's own booking and queues taking back its reward
+    # points. Returns False if there was no such booking.
+    cur.execute(CANCEL_SQL, (book_id, renter_id))
+    if not cur.rowcount:
+        return False
+    cur.execute(CANCEL_REWARDS_SQL, cancel_rewards_params(book_id, renter_id))
+    return True
+
+
+# Current and upcoming stays. The receipt (last column) is None until the
+# outbox worker has built it.
+RENTER_BOOKINGS_SQL = """
+    SELECT
+      b.BookID,
+      b.PropId,
+      p.PropType,
+      b.StartDate,
+      b.EndDate,
+      b.Mode_of_pay,
+      b.TotalCost,
+      r.Body
+    FROM Booking b
+    JOIN Property p ON b.PropId = p.PropId
+    LEFT JOIN booking_receipts r ON r.BookID = b.BookID
+    WHERE b.RenterID = %s AND b.EndDate >= current_date
+    ORDER BY b.StartDate, b.BookID
+"""
+
+def renter_bookings(cur, renter_id):
+    cur.execute(RENTER_BOOKINGS_SQL, (renter_id,))
+    return cur.fetchall()
+
+
+# Past stays, newest first: ended bookings still in Booking plus the
+# archived months (migrations/014_booking_partitions.sql). Same columns as
+# RENTER_BOOKINGS_SQL.
+BOOKING_HISTORY_SQL = """
+    SELECT b.BookID, b.PropId, p.PropType, b.StartDate, b.EndDate, b.Mode_of_pay,
+           b.TotalCost, r.Body
+    FROM (SELECT BookID, PropId, StartDate, EndDate, Mode_of_pay, TotalCost FROM Booking
+          WHERE RenterID = %s AND EndDate < current_date
+          UNION ALL
+          SELECT BookID, PropId, StartDate, EndDate, Mode_of_pay, TotalCost FROM booking_archive
+          WHERE RenterID = %s) b
+    JOIN Property p ON b.PropId = p.PropId
+    LEFT JOIN booking_receipts r ON r.BookID = b.BookID
+    {keyset}
+    ORDER BY b.StartDate DESC, b.BookID DESC
+"""
+
+def booking_history(conn, renter_id, before=None, limit=20):
+    # One page of past stays older than the (StartDate, BookID) key
+    # `before`, read through a server-side cursor so a long history is
+    # never materialised client-side. Returns (rows, has_more); the next
+    # page's key is (rows[-1][3], rows[-1][0]).
+    params = [renter_id, renter_id]
+    keyset = ""
+    if before is not None:
+        keyset = "WHERE (b.StartDate, b.BookID) < (%s, %s)"
+        params += list(before)
+    with conn.cursor(name='booking_history') as cur:
+        cur.itersize = limit + 1
+        cur.execute(BOOKING_HISTORY_SQL.format(keyset=keyset), params)
+        rows = cur.fetchmany(limit + 1)
+    conn.commit()
+    return rows[:limit], len(rows) > limit
+
+
+# Everything pages need about the logged-in user, in one round trip.
+IDENTITY_SQL = """
+    SELECT u.Email, u.Name_, u.address, u.UserType,
+           r.RenterID, r.PrefLocation, r.Budget, COALESCE(rw.Reward_Points, 0),
+           a.AgentID, a.AgencyName, a.JobTitle
+    FROM Users u
+    LEFT JOIN Renter r ON r.Email = u.Email
+    LEFT JOIN Rewards rw ON rw.R_id = r.RenterID
+    LEFT JOIN Agent a ON a.Email = u.Email
+    WHERE u.Email = %s
+"""
+IDENTITY_FIELDS = ['email', 'name', 'address', 'role', 'renter_id', 'pref_location', 'budget',
+                   'rewards', 'agent_id', 'agency', 'job_title']
+
+def load_identity(cur, email):
+    # A dict of IDENTITY_FIELDS (renter or agent ones None as the role
+    # dictates), or None if there is no such user.
+    cur.execute(IDENTITY_SQL, (email,))
+    row = cur.fetchone()
+    return dict(zip(IDENTITY_FIELDS, row)) if row else None
+
+
+
+# details: rooms, address, sqft, price, available and btype (BuildingType
+# for Apartments, BusinessType for CommBuildings).
+# hood: (crime_rate, school, hospital, park, mart).
+
+def insert_listing(cur, agent_id, ptype, description, city, state, details, hood):
+    cur.execute(
+        "INSERT INTO Property(PropType, Description, City, State_, AgentID) "
+        "VALUES (%s,%s,%s,%s,%s) RETURNING PropId",
+        (ptype, description, city, state, agent_id)
+    )
+    pid = cur.fetchone()[0]
+    d = details
+    if ptype == 'CommBuildings':
+        cur.execute("INSERT INTO CommBuildings VALUES(%s,%s,%s,%s,%s,%s)",
+                    (pid, d['address'], d['btype'], d['sqft'], d['price'], d['available']))
+    elif ptype == 'Apartments':
+        cur.execute("INSERT INTO Apartments VALUES(%s,%s,%s,%s,%s,%s,%s)",
+                    (pid, d['rooms'], d['address'], d['sqft'], d['price'], d['available'], d['btype']))
+    else:
+        table, _ = TYPE_MAP[ptype]
+        cur.execute(f"INSERT INTO {table} VALUES(%s,%s,%s,%s,%s,%s)",
+                    (pid, d['rooms'], d['address'], d['sqft'], d['price'], d['available']))
+    cur.execute(
+        "INSERT INTO Neighbourhood(PropId,CrimeRate,NearbySchool,Hospital,Park,mart) "
+        "VALUES(%s,%s,%s,%s,%s,%s)",
+        (pid, *hood)
+    )
+    return pid
+
+
+EDIT_SQL = """
+    SELECT p.PropType, p.Description, p.City, p.State_, p.RowVersion,
+           s.NoOfRooms, s.address, s.SqFootage, s.Price, s.Availablity, s.btype,
+           n.CrimeRate, n.NearbySchool, n.Hospital, n.Park, n.mart
+    FROM Property p
+    LEFT JOIN (
+        SELECT NoOfRooms, address, SqFootage, Price, Availablity, NULL AS btype
+        FROM VacHome WHERE VacHomeId = %(pid)s
+        UNION ALL
+        SELECT NoOfRooms, address, SqFootage, Price, Availablity, NULL
+        FROM Houses WHERE HouseId = %(pid)s
+        UNION ALL
+        SELECT NoOfRooms, address, SqFootage, Price, Availablity, BuildingType
+        FROM Apartments WHERE AptId = %(pid)s
+        UNION ALL
+        SELECT NULL, address, SqFootage, Price, Availablity, BusinessType
+        FROM CommBuildings WHERE BuildId = %(pid)s
+    ) s ON TRUE
+    LEFT JOIN LATERAL (
+        SELECT CrimeRate, NearbySchool, Hospital, Park, mart
+        FROM Neighbourhood WHERE PropId = p.PropId LIMIT 1
+    ) n ON TRUE
+    WHERE p.PropId = %(pid)s
+"""
+
+
+def load_listing(cur, pid):
+    # Everything the edit form needs in one read. Returns (ptype,
+    # description, city, state, version, details, hood) or None.
+    cur.execute(EDIT_SQL, {'pid': pid})
+    row = cur.fetchone()
+    if row is None:
+        return None
+    ptype, description, city, state, version, rooms, address, sqft, price, available, btype = row[:11]
+    details = {'rooms': rooms, 'address': address, 'sqft': sqft, 'price': price,
+               'available': available, 'btype': btype}
+    # No Neighbourhood row yet: blank defaults, saved as a new row.
+    hood = row[11:] if row[11] is not None else (0, '', '', '', '')
+    return ptype, description, city, state, version, details, tuple(hood)
+
+
+SUBTYPE_SET = {
+    'CommBuildings': "address=%(address)s, BusinessType=%(btype)s, SqFootage=%(sqft)s, "
+                     "Price=%(price)s, Availablity=%(available)s",
+    'Apartments':    "NoOfRooms=%(rooms)s, address=%(address)s, SqFootage=%(sqft)s, "
+                     "Price=%(price)s, Availablity=%(available)s, BuildingType=%(btype)s",
+}
+SUBTYPE_SET['VacHome'] = SUBTYPE_SET['Houses'] = (
+    "NoOfRooms=%(rooms)s, address=%(address)s, SqFootage=%(sqft)s, "
+    "Price=%(price)s, Availablity=%(available)s"
+)
+
+SAVE_SQL = """
+    WITH prop AS (
+        UPDATE Property
+        SET Description=%(description)s, City=%(city)s, State_=%(state)s,
+            RowVersion = RowVersion + 1
+        WHERE PropId = %(pid)s AND RowVersion = %(version)s
+        RETURNING PropId, RowVersion
+    ), sub AS (
+        UPDATE {table} t SET {subtype_set}
+        FROM prop WHERE t.{col} = prop.PropId
+    ), hood AS (
+        UPDATE Neighbourhood n
+        SET CrimeRate=%(crime)s, NearbySchool=%(school)s, Hospital=%(hospital)s,
+            Park=%(park)s, mart=%(mart)s
+        FROM prop WHERE n.PropId = prop.PropId
+    ), new_hood AS (
+        INSERT INTO Neighbourhood(PropId, CrimeRate, NearbySchool, Hospital, Park, mart)
+        SELECT prop.PropId, %(crime)s, %(school)s, %(hospital)s, %(park)s, %(mart)s
+        FROM prop WHERE NOT EXISTS (SELECT 1 FROM Neighbourhood n WHERE n.PropId = prop.PropId)
+    )
+    SELECT (SELECT RowVersion FROM prop),
+           (SELECT RowVersion FROM Property WHERE PropId = %(pid)s)
+"""
+
+
+def save_listing(cur, pid, ptype, description, city, state, details, hood, version):
+    # One statement updates Property, the subtype row and Neighbourhood
+    # (creating the Neighbourhood row if the listing has none), and only if
+    # the listing is still at `version`; nothing is locked while the form is
+    # open. Returns ('saved', new_version), ('conflict', None) if
+    # someone else saved first, or ('deleted', None).
+    table, col = TYPE_MAP[ptype]
+    crime, school, hospital, park, mart = hood
+    params = dict(details, pid=pid, description=description, city=city, state=state,
+                  version=version, crime=crime, school=school, hospital=hospital,
+                  park=park, mart=mart)
+    cur.execute(SAVE_SQL.format(table=table, col=col, subtype_set=SUBTYPE_SET[ptype]), params)
+    new_version, current = cur.fetchone()
+    if new_version is not None:
+        return 'saved', new_version
+    return ('deleted' if current is None else 'conflict'), None
+
+
+def delete_listing(cur, pid, ptype):
+    table, col = TYPE_MAP[ptype]
+    cur.execute(f"DELETE FROM {table} WHERE {col} = %s", (pid,))
+    cur.execute("DELETE FROM Neighbourhood WHERE PropId = %s", (pid,))
+    cur.execute("DELETE FROM Property WHERE PropId = %s", (pid,))
+
+
+def fetch_agent_listings(cur, agent_id):
+    cur.execute(
+        "SELECT PropId, PropType, Description, City, State_, Price, Availablity "
+        "FROM property_listing WHERE AgentID = %s ORDER BY PropId",
+        (agent_id,)
+    )
+    return cur.fetchall()
+
+
+# Bulk portfolio actions. pids_by_type maps PropType -> [PropId, ...]; each
+# action is one set-based statement per subtype table, and the join to
+# Property enforces that only the agent's own listings are touched.
+
+def _bulk(cur, sql, rows, template):
+    execute_values(cur, sql, rows, template=template, page_size=max(len(rows), 1))
+    return cur.rowcount
+
+
+def _bump_versions(cur, agent_id, pids_by_type):
+    # Keeps edit forms opened before a bulk change from overwriting it.
+    _bulk(cur, """
+        UPDATE Property p SET RowVersion = p.RowVersion + 1
+        FROM (VALUES %s) AS v(pid, agent)
+        WHERE p.PropId = v.pid AND p.AgentID = v.agent
+    """, [(pid, agent_id) for pids in pids_by_type.values() for pid in pids], None)
+
+
+def bulk_reprice(cur, agent_id, pids_by_type, factor=1, delta=0):
+    _bump_versions(cur, agent_id, pids_by_type)
+    changed = 0
+    for ptype, pids in pids_by_type.items():
+        table, col = TYPE_MAP[ptype]
+        changed += _bulk(cur, f"""
+            UPDATE {table} t
+            SET Price = LEAST(GREATEST(round(t.Price * v.factor + v.delta, 2), 0), 9999999999.99)
+            FROM (VALUES %s) AS v(pid, agent, factor, delta)
+            JOIN Property p ON p.PropId = v.pid AND p.AgentID = v.agent
+            WHERE t.{col} = v.pid
+        """, [(pid, agent_id, factor, delta) for pid in pids],
+            "(%s, %s, %s::numeric, %s::numeric)")
+    return changed
+
+
+def bulk_set_availability(cur, agent_id, pids_by_type, available):
+    _bump_versions(cur, agent_id, pids_by_type)
+    changed = 0
+    for ptype, pids in pids_by_type.items():
+        table, col = TYPE_MAP[ptype]
+        changed += _bulk(cur, f"""
+            UPDATE {table} t
+            SET Availablity = v.available
+            FROM (VALUES %s) AS v(pid, agent, available)
+            JOIN Property p ON p.PropId = v.pid AND p.AgentID = v.agent
+            WHERE t.{col} = v.pid
+        """, [(pid, agent_id, available) for pid in pids], "(%s, %s, %s::boolean)")
+    return changed
+
+
+def bulk_delete(cur, agent_id, pids_by_type):
+    everything = [(pid, agent_id) for pids in pids_by_type.values() for pid in pids]
+    for ptype, pids in pids_by_type.items():
+        table, col = TYPE_MAP[ptype]
+        _bulk(cur, f"""
+            DELETE FROM {table} t
+            USING (VALUES %s) AS v(pid, agent)
+            JOIN Property p ON p.PropId = v.pid AND p.AgentID = v.agent
+            WHERE t.{col} = v.pid
+        """, [(pid, agent_id) for pid in pids], None)
+    _bulk(cur, """
+        DELETE FROM Neighbourhood n
+        USING (VALUES %s) AS v(pid, agent)
+        JOIN Property p ON p.PropId = v.pid AND p.AgentID = v.agent
+        WHERE n.PropId = v.pid
+    """, everything, None)
+    return _bulk(cur, """
+        DELETE FROM Property p
+        USING (VALUES %s) AS v(pid, agent)
+        WHERE p.PropId = v.pid AND p.AgentID = v.agent
+    """, everything, None)
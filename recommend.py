@@ -0,0 +1,283 @@
+import os
+import sys
+import json
+import time
+import argparse
+import threading
+from datetime import datetime
+
+import numpy as np
+
+import db
+import cache
+
+
+FULL_REFRESH = float(os.getenv('RECOMMEND_FULL_REFRESH', '3600'))
+FETCH_SIZE   = int(os.getenv('RECOMMEND_FETCH_SIZE', '50000'))
+
+# Relative weight of each score component; every component is in [0, 1].
+WEIGHTS = {'budget': 0.35, 'location': 0.30, 'safety': 0.15, 'size': 0.10, 'amenities': 0.10}
+
+SNAPSHOT_SQL = """
+    SELECT PropId, lower(City), lower(State_), Price, SqFootage, CrimeRate,
+           Amenities, Availablity
+    FROM property_listing
+"""
+
+# Number of amenities present for each value of the 4-bit Amenities mask.
+_AMENITY_SHARE = np.array([bin(i).count('1') / 4 for i in range(16)], dtype=np.float32)
+
+
+class Snapshot:
+    # Columnar copy of the catalogue: one NumPy array per scored attribute,
+    # row i describing pids[i]. Cities and states are dictionary-encoded.
+    # Change events mark rows dirty and the next score() re-reads only
+    # those; a flush (or FULL_REFRESH seconds) reloads everything.
+
+    def __init__(self):
+        self._lock    = threading.Lock()
+        self._dirty   = set()
+        self._stale   = True
+        self._flushes = 0
+        self._reloading = None  # pids changed while load() runs
+        self.loaded_at = None
+        self.codes    = {}
+        self.index    = {}
+        self.pids     = []
+        self.cols     = self._empty(0)
+
+    @staticmethod
+    def _empty(n):
+        return {
+            'city':      np.full(n, -1, dtype=np.int32),
+            'state':     np.full(n, -1, dtype=np.int32),
+            'price':     np.zeros(n, dtype=np.float32),
+            'sqft':      np.zeros(n, dtype=np.float32),
+            'crime':     np.full(n, np.nan, dtype=np.float32),
+            'amenities': np.zeros(n, dtype=np.uint8),
+            'available': np.zeros(n, dtype=bool),
+        }
+
+    def _code(self, codes, text):
+        if text is None:
+            return -1
+        return codes.setdefault(text, len(codes))
+
+    def _fill(self, cols, codes, i, row):
+        _, city, state, price, sqft, crime, amenities, available = row
+        cols['city'][i]      = self._code(codes, city)
+        cols['state'][i]     = self._code(codes, state)
+        cols['price'][i]     = price or 0
+        cols['sqft'][i]      = sqft or 0
+        cols['crime'][i]     = np.nan if crime is None else crime
+        cols['amenities'][i] = amenities or 0
+        cols['available'][i] = bool(available) and price is not None
+
+    def on_event(self, event):
+        with self._lock:
+            if event.get('all'):
+                self._stale = True
+                self._flushes += 1
+                self._dirty.clear()
+                return
+            pids = set(event.get('pids') or ())
+            if event.get('pid') is not None:
+                pids.add(event['pid'])
+            self._dirty |= pids
+            if self._reloading is not None:
+                self._reloading |= pids
+
+    def load(self):
+        # Streams the catalogue through a server-side cursor straight into
+        # preallocated arrays, then swaps it in. Reads a replica when one is
+        # configured; rows changed meanwhile arrive as events and are patched
+        # from the primary.
+        with self._lock:
+            flushes = self._flushes
+            self._reloading = set()
+        with db.connection(replica=True) as conn:
+            with conn.cursor() as cur:
+                cur.execute("SELECT count(*) FROM property_listing")
+                n = cur.fetchone()[0]
+            cols, codes, pids = self._empty(n), {}, []
+            with conn.cursor(name='recommend_snapshot') as cur:
+                cur.itersize = FETCH_SIZE
+                cur.execute(SNAPSHOT_SQL)
+                for row in cur:
+                    if len(pids) == n:
+                        break   # rows inserted since the count wait for an event
+                    self._fill(cols, codes, len(pids), row)
+                    pids.append(row[0])
+            conn.commit()
+        for name in cols:
+            cols[name] = cols[name][:len(pids)]
+        with self._lock:
+            self.cols, self.codes, self.pids = cols, codes, pids
+            self.index = {pid: i for i, pid in enumerate(pids)}
+            self._stale = flushes != self._flushes
+            self.loaded_at = time.monotonic()
+            # Changes patched into the old arrays meanwhile may predate
+            # what this load read; patch them again.
+            self._dirty |= self._reloading
+            self._reloading = None
+
+    def _patch(self):
+        with self._lock:
+            dirty, self._dirty = self._dirty, set()
+        if not dirty:
+            return
+        with db.connection() as conn, conn.cursor() as cur:
+            cur.execute(SNAPSHOT_SQL + " WHERE PropId = ANY(%s)", (list(dirty),))
+            rows = {r[0]: r for r in cur.fetchall()}
+        with self._lock:
+            new = [pid for pid in rows if pid not in self.index]
+            if new:
+                start = len(self.pids)
+                grown = self._empty(len(new))
+                self.cols = {k: np.concatenate([v, grown[k]]) for k, v in self.cols.items()}
+                for offset, pid in enumerate(new):
+                    self.index[pid] = start + offset
+                    self.pids.append(pid)
+            for pid in dirty:
+                i = self.index.get(pid)
+                if i is None:
+                    continue
+                if pid in rows:
+                    self._fill(self.cols, self.codes, i, rows[pid])
+                else:
+                    self.cols['available'][i] = False     # deleted
+
+    def refresh(self):
+        # Never reloads on the caller's thread: a due full reload runs in
+        # the background while this snapshot keeps serving, patched as usual.
+        if self._stale or (self.loaded_at and time.monotonic() - self.loaded_at > FULL_REFRESH):
+            _load_in_background()
+        self._patch()
+
+    @property
+    def ready(self):
+        return self.loaded_at is not None
+
+    def score(self, pref_location, budget):
+        # Vectorized score of every listing for one renter profile;
+        # unavailable listings score -inf.
+        c = self.cols
+        with np.errstate(divide='ignore', invalid='ignore'):
+            if budget:
+                ratio = c['price'] / np.float32(budget)
+                fit = np.where(ratio <= 1, 0.5 + 0.5 * ratio, np.exp(-10 * (ratio - 1)))
+            else:
+                fit = np.full(len(self.pids), 0.5, dtype=np.float32)
+            code = self.codes.get((pref_location or '').strip().lower(), -2)
+            location = (c['city'] == code) * np.float32(1.0) + (c['state'] == code) * np.float32(0.5)
+            safety = np.nan_to_num(1 - c['crime'] / 100, nan=0.5)
+            size = np.log1p(c['sqft']) / np.log1p(max(float(c['sqft'].max(initial=0)), 1.0))
+            total = (WEIGHTS['budget'] * fit
+                     + WEIGHTS['location'] * np.minimum(location, 1)
+                     + WEIGHTS['safety'] * safety
+                     + WEIGHTS['size'] * size
+                     + WEIGHTS['amenities'] * _AMENITY_SHARE[c['amenities'] & 15])
+        return np.where(c['available'], total, -np.inf)
+
+    def top_k(self, pref_location, budget, k=5):
+        with self._lock:
+            scores = self.score(pref_location, budget)
+            pids = self.pids
+        k = min(k, int(np.isfinite(scores).sum()))
+        if k <= 0:
+            return []
+        best = np.argpartition(-scores, k - 1)[:k]
+        best = best[np.argsort(-scores[best], kind='stable')]
+        return [(pids[i], float(scores[i])) for i in best]
+
+
+_snapshot = Snapshot()
+_loader = None
+_loader_lock = threading.Lock()
+
+
+def _load_in_background():
+    global _loader
+    with _loader_lock:
+        if _loader is None or not _loader.is_alive():
+            _loader = threading.Thread(target=_snapshot.load, name='recommend-snapshot',
+                                       daemon=True)
+            _loader.start()
+
+
+def start():
+    # Safe to call on every rerun.
+    cache.subscribe(_snapshot.on_event)
+    if not _snapshot.ready:
+        _load_in_background()
+
+
+def for_renter(cur, renter_id, pref_location, budget, k=5):
+    # Live scores once the snapshot is loaded; until then (a cold process
+    # loading a large catalogue) the last batch run's results.
+    if not _snapshot.ready:
+        _load_in_background()
+        return stored(cur, renter_id, k)
+    _snapshot.refresh()
+    return _snapshot.top_k(pref_location, float(budget) if budget else None, k)
+
+
+def stored(cur, renter_id, k=5):
+    cur.execute(
+        "SELECT r.PropId, r.Score FROM renter_recommendations r "
+        "JOIN property_listing p ON p.PropId = r.PropId AND p.Availablity "
+        "WHERE r.RenterID = %s ORDER BY r.Rank_ LIMIT %s",
+        (renter_id, k)
+    )
+    return cur.fetchall()
+
+
+def batch(args):
+    # Precompute top-k for every renter. Renters sharing a (location,
+    # budget) profile are scored once.
+    started = time.monotonic()
+    _snapshot.load()
+    loaded = time.monotonic()
+    with db.connection() as conn, conn.cursor() as cur:
+        cur.execute("SELECT RenterID, PrefLocation, Budget FROM Renter")
+        renters = cur.fetchall()
+        profiles = {}
+        for renter_id, pref, budget in renters:
+            profiles.setdefault(((pref or '').strip().lower(), budget), []).append(renter_id)
+
+        scored = time.monotonic()
+        computed_at = datetime.now()
+
+        def rows():
+            for (pref, budget), renter_ids in profiles.items():
+                best = _snapshot.top_k(pref, float(budget) if budget else None, args.k)
+                for renter_id in renter_ids:
+                    for rank, (pid, score) in enumerate(best, 1):
+                        yield (renter_id, rank, pid, score, computed_at)
+
+        cur.execute("DELETE FROM renter_recommendations")
+        db.copy_rows(cur, 'renter_recommendations',
+                     ['RenterID', 'Rank_', 'PropId', 'Score', 'ComputedAt'], rows())
+        conn.commit()
+    done = time.monotonic()
+    print(json.dumps({
+        'listings': len(_snapshot.pids), 'renters': len(renters), 'profiles': len(profiles),
+        'k': args.k, 'load_s': round(loaded - started, 2),
+        'score_and_write_s': round(done - scored, 2),
+        'ms_per_profile': round((done - scored) * 1000 / len(profiles), 2) if profiles else None,
+    }))
+    return 0
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description='Renter property recommendations.')
+    sub = ap.add_subparsers(dest='command', required=True)
+    b = sub.add_parser('batch', help='precompute top-k recommendations for every renter')
+    b.add_argument('--k', type=int, default=10)
+    b.set_defaults(fn=batch)
+    args = ap.parse_args(argv)
+    return args.fn(args)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,25 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# These tests need PostgreSQL with DBOSchema.sql and migrations/ applied,
+# reached through the usual DB_* settings. Seeding runs
+# `bench.py generate --reset`, which truncates the application tables, so
+# they only run against a throwaway database, with RUN_DB_TESTS=1.
+RUN_DB_TESTS = os.getenv('RUN_DB_TESTS') == '1'
+# The plan checks are meant for a 1M-property catalogue; a smaller
+# DB_TEST_PROPERTIES makes a quicker, less telling run.
+DB_TEST_PROPERTIES = os.getenv('DB_TEST_PROPERTIES', '1000000')
+
+
+@pytest.fixture(scope='session')
+def seeded():
+    # bench, seeded once per session with DB_TEST_PROPERTIES properties.
+    if not RUN_DB_TESTS:
+        pytest.skip('set RUN_DB_TESTS=1 to run against a throwaway database')
+    import bench
+    bench.main(['generate', '--reset', '--properties', DB_TEST_PROPERTIES])
+    return bench
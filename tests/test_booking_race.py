@@ -0,0 +1,11 @@
+BUYERS = 100
+
+
+def test_one_of_many_concurrent_buyers_wins(seeded):
+    report = seeded.race_report(BUYERS)
+    outcomes = report['outcomes']
+    assert report['buyers'] == BUYERS
+    assert sum(outcomes.values()) == BUYERS, outcomes
+    assert outcomes.get('booked') == 1, outcomes
+    # Everyone else lost cleanly rather than erroring out.
+    assert set(outcomes) <= {'booked', 'unavailable', 'busy'}, outcomes
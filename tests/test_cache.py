@@ -0,0 +1,126 @@
+from types import SimpleNamespace
+
+import pytest
+
+pytest.importorskip('psycopg2')
+
+import cache
+
+
+CUR = SimpleNamespace(connection=SimpleNamespace(readonly=False))
+
+
+@pytest.fixture
+def listings(monkeypatch):
+    # A fresh cache in front of a fake search_listings that returns one
+    # page per search: Houses in Austin, Texas, P1 and P2 on page one.
+    monkeypatch.setattr(cache, '_cache', cache.ListingCache(16, 60))
+    loads = []
+
+    def search_listings(cur, search, after, before, limit):
+        loads.append((cache.search_key(search), after))
+        rows = [('P3',), ('P4',)] if after else [('P1',), ('P2',)]
+        return rows, {'any_type': 4}
+
+    monkeypatch.setattr(cache.queries, 'search_listings', search_listings)
+    return loads
+
+
+def _search(search, after=None):
+    return cache.search_page(CUR, search, after)
+
+
+def _cached(search, after=None):
+    key = ('search', cache.search_key(search), after, None, 20)
+    return key in cache._cache._data
+
+
+def test_hit_miss_and_lru_eviction():
+    c = cache.ListingCache(2, 60)
+    never = lambda value: lambda event: False
+    for key in ['a', 'b', 'a', 'c']:
+        c.get_or_load(key, lambda: key.upper(), never)
+    s = c.stats()
+    assert (s['hits'], s['misses'], s['evictions'], s['size']) == (1, 3, 1, 2)
+    # 'a' was used more recently than 'b', so 'b' was evicted.
+    assert list(c._data) == ['a', 'c']
+
+
+def test_expired_entries_are_reloaded():
+    c = cache.ListingCache(4, 0)
+    calls = []
+    for _ in range(2):
+        c.get_or_load('k', lambda: calls.append(1), lambda value: lambda event: False)
+    assert len(calls) == 2
+    assert c.stats()['expired'] == 1
+
+
+def test_invalidate_drops_only_hit_entries():
+    c = cache.ListingCache(4, 60)
+    c.get_or_load('x', lambda: 1, lambda value: lambda event: event['pid'] == 'P1')
+    c.get_or_load('y', lambda: 2, lambda value: lambda event: event['pid'] == 'P2')
+    assert c.invalidate(cache.change_event('P1')) == 1
+    assert list(c._data) == ['y']
+    c.invalidate(cache.flush_event())
+    assert c.stats()['size'] == 0
+
+
+def test_load_racing_an_invalidation_is_not_kept():
+    c = cache.ListingCache(4, 60)
+
+    def loader():
+        c.invalidate(cache.change_event('P9'))
+        return 'old'
+
+    assert c.get_or_load('k', loader, lambda value: lambda event: False) == 'old'
+    assert 'k' not in c._data
+
+
+def test_write_elsewhere_in_searched_location_drops_every_page(listings):
+    search = {'city': 'Austin'}
+    _search(search)
+    _search(search, after='P2')
+    cache._cache.invalidate(cache.change_event('P7', locations=[('Dallas', 'Texas')]))
+    assert _cached(search) and _cached(search, 'P2')
+    # P8 is on neither page but counts towards both pages' facets.
+    cache._cache.invalidate(cache.change_event('P8', locations=[('Austin', 'Texas')]))
+    assert not _cached(search) and not _cached(search, 'P2')
+
+
+def test_events_without_locations_drop_every_search(listings):
+    for event in [cache.change_event('P8'), cache.batch_event(['P8', 'P9'])]:
+        _search({'city': 'Austin'})
+        _search({'state': 'Ohio'}, after='P2')
+        cache._cache.invalidate(event)
+        assert cache._cache.stats()['size'] == 0
+
+
+def test_batch_event_with_locations_keeps_other_searches(listings):
+    _search({'city': 'Austin'})
+    _search({'city': 'Dallas'})
+    cache._cache.invalidate(cache.batch_event(['P8', 'P9'], [('Dallas', 'Texas')] * 2))
+    assert _cached({'city': 'Austin'}) and not _cached({'city': 'Dallas'})
+
+
+def test_booking_event_only_drops_date_searches_and_its_listing(listings):
+    window = {'city': 'Austin', 'free_from': '2030-01-01', 'free_to': '2030-01-08'}
+    _search({'city': 'Austin'})
+    _search({'city': 'Austin'}, after='P2')
+    _search(window)
+    cache._cache.invalidate(cache.booking_event('P3'))
+    assert _cached({'city': 'Austin'})
+    assert not _cached({'city': 'Austin'}, 'P2')
+    assert not _cached(window)
+
+
+def test_agency_entry_follows_its_agency_and_listings(monkeypatch):
+    monkeypatch.setattr(cache, '_cache', cache.ListingCache(16, 60))
+    monkeypatch.setattr(cache.queries, 'fetch_agency_listings', lambda cur, name: [('P1',)])
+    cache.agency_listings(CUR, 'Acme')
+    cache._cache.invalidate(cache.change_event('P5', agency='Other'))
+    assert cache._cache.stats()['size'] == 1
+    cache._cache.invalidate(cache.change_event('P5', agency='Acme'))
+    assert cache._cache.stats()['size'] == 0
+    cache.agency_listings(CUR, 'Acme')
+    cache._cache.invalidate(cache.batch_event(['P1']))
+    assert cache._cache.stats()['size'] == 0
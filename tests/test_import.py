@@ -0,0 +1,69 @@
+import re
+import json
+
+import pytest
+
+pytest.importorskip('psycopg2')
+
+import db
+import import_listings
+from import_listings import RowError, validate
+
+
+GOOD = {'agent_id': 'A1', 'type': 'Houses', 'description': 'import test', 'city': 'Austin',
+        'state': 'Texas', 'address': '1 Main St', 'rooms': 3, 'sqft': 1200, 'price': 2500,
+        'available': 'true', 'crime_rate': 4.5, 'school': 'Lincoln'}
+
+
+@pytest.mark.parametrize('change, reason', [
+    ({'type': 'Castle'}, 'unknown type'),
+    ({'city': ''}, 'city is required'),
+    ({'city': 'Llanfairpwllgwyngyll'}, 'city longer than 12'),
+    ({'price': 'cheap'}, 'price is not a number'),
+    ({'price': 'NaN'}, 'price is not a finite number'),
+    ({'price': '12345678901'}, 'price does not fit numeric(12,2)'),
+    ({'sqft': -5}, 'sqft must be >= 0'),
+    ({'rooms': 0}, 'rooms must be >= 1'),
+    ({'available': 'maybe'}, 'available is not a boolean'),
+    ({'agent_id': None}, 'agent_id is required'),
+])
+def test_bad_rows_are_rejected(change, reason):
+    assert validate(GOOD)
+    with pytest.raises(RowError, match=re.escape(reason)):
+        validate(dict(GOOD, **change))
+
+
+def test_non_object_rows_are_rejected():
+    with pytest.raises(RowError, match='expected an object'):
+        validate(['Houses', 'Austin'])
+
+
+def test_import_loads_good_rows_and_reports_the_rest(seeded, tmp_path, capsys):
+    agent = seeded.load_samples(1)['agents'][0][0]
+    path, rejects = tmp_path / 'listings.jsonl', tmp_path / 'rejects.jsonl'
+    lines = [json.dumps(dict(GOOD, agent_id=agent)),
+             '{"type": "Houses", ',
+             json.dumps(dict(GOOD, agent_id=agent, price='cheap')),
+             json.dumps(dict(GOOD, agent_id='A_NOBODY')),
+             json.dumps(dict(GOOD, agent_id=agent, type='Apartments', btype='Lowrise'))]
+    path.write_text('\n'.join(lines) + '\n', encoding='utf-8')
+
+    assert import_listings.main([str(path), '--rejects', str(rejects),
+                                 '--job', f'test-{tmp_path.name}']) == 0
+    report = json.loads(capsys.readouterr().out.strip().splitlines()[-1])
+    assert (report['read'], report['loaded'], report['rejected']) == (5, 2, 3)
+
+    rejected = [json.loads(l) for l in rejects.read_text(encoding='utf-8').splitlines()]
+    assert sorted(r['line'] for r in rejected) == [2, 3, 4]
+    reasons = ' '.join(r['reason'] for r in rejected)
+    assert 'invalid JSON' in reasons and 'price is not a number' in reasons
+    assert "unknown agent 'A_NOBODY'" in reasons
+
+    conn = db.connect()
+    try:
+        with conn.cursor() as cur:
+            cur.execute("SELECT PropType FROM property_listing "
+                        "WHERE AgentID = %s AND Description = 'import test' ORDER BY 1", (agent,))
+            assert [r[0] for r in cur.fetchall()] == ['Apartments', 'Houses']
+    finally:
+        conn.close()
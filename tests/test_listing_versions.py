@@ -0,0 +1,52 @@
+import random
+
+import pytest
+
+pytest.importorskip('psycopg2')
+
+import db
+import queries
+
+
+HOOD = (1, 'Lincoln', '', '', '')
+
+
+def _save(cur, seeded, pid, version, description):
+    ptype, _, city, state, *_ = queries.load_listing(cur, pid)
+    return queries.save_listing(cur, pid, ptype, description, city, state,
+                                seeded._details(random.Random(0), ptype), HOOD, version)
+
+
+def test_stale_save_is_a_conflict(seeded):
+    # Two edit forms opened at the same version: the first save wins and
+    # the second is refused without changing anything.
+    pid = seeded.load_samples(1)['props'][0][0]
+    conn = db.connect()
+    try:
+        with conn.cursor() as cur:
+            version = queries.load_listing(cur, pid)[4]
+            status, new_version = _save(cur, seeded, pid, version, 'first editor')
+            assert (status, new_version) == ('saved', version + 1)
+            conn.commit()
+
+            assert _save(cur, seeded, pid, version, 'second editor') == ('conflict', None)
+            conn.commit()
+            _, description, _, _, current, *_ = queries.load_listing(cur, pid)
+            assert (description, current) == ('first editor', new_version)
+    finally:
+        conn.close()
+
+
+def test_bulk_change_makes_open_forms_stale(seeded):
+    conn = db.connect()
+    try:
+        with conn.cursor() as cur:
+            a_id = seeded.load_samples(1)['agents'][0][0]
+            pid, ptype, *_ = queries.fetch_agent_listings(cur, a_id)[0]
+            version = queries.load_listing(cur, pid)[4]
+            assert queries.bulk_reprice(cur, a_id, {ptype: [pid]}, delta=10) == 1
+            conn.commit()
+            assert _save(cur, seeded, pid, version, 'edited') == ('conflict', None)
+    finally:
+        conn.rollback()
+        conn.close()
@@ -0,0 +1,5 @@
+def test_page_queries_use_indexes(seeded):
+    # Every page query issues at least one statement, and none of them
+    # seq-scans a large table on the seeded dataset.
+    report, failures = seeded.explain_report()
+    assert failures == 0, {name: check for name, check in report.items() if not check['ok']}
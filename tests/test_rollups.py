@@ -0,0 +1,51 @@
+import random
+from datetime import date, timedelta
+
+import pytest
+
+pytest.importorskip('psycopg2')
+
+import analytics
+import db
+import queries
+
+
+def test_rollup_deltas_match_full_recompute(seeded):
+    # A move, a reprice, a new listing, a booking and a cancellation must
+    # leave the rollups matching listing_rollup_source, both with the
+    # deltas still pending and once they have been folded.
+    rnd = random.Random(7)
+    samples = seeded.load_samples(20)
+    r_id, email = samples['renters'][0]
+    a_id, _, _ = samples['agents'][0]
+    start = date.today() + timedelta(days=3650)
+
+    conn = db.connect()
+    try:
+        with conn.cursor() as cur:
+            pid, ptype, _, city, state, _, _ = queries.fetch_agent_listings(cur, a_id)[0]
+            moved = samples['props'][0][0]
+            mtype, desc, _, mstate, version, *_ = queries.load_listing(cur, moved)
+            status, _ = queries.save_listing(cur, moved, mtype, desc, 'Rollup City', mstate,
+                                             seeded._details(rnd, mtype), (1, '', '', '', ''),
+                                             version)
+            assert status == 'saved'
+            assert queries.bulk_reprice(cur, a_id, {ptype: [pid]}, factor=1.1) == 1
+            new = queries.insert_listing(cur, a_id, 'Houses', 'd', city, state,
+                                         seeded._details(rnd, 'Houses'), (1, '', '', '', ''))
+            for prop in (pid, new):
+                status = queries.book_property(cur, email, prop, None, start,
+                                               start + timedelta(days=5), 'Cash')[0]
+                assert status == 'booked'
+            conn.commit()
+            book_id = queries.renter_bookings(cur, r_id)[-1][0]
+            assert queries.cancel_booking(cur, book_id, r_id)
+            conn.commit()
+
+            assert analytics.check(cur) == []
+            conn.rollback()
+            assert analytics.fold(conn) > 0
+            assert analytics.check(cur) == []
+            conn.rollback()
+    finally:
+        conn.close()